@@ -49,6 +49,9 @@ except ImportError:
 import matplotlib as mpl
 from . import db
 from . import data
+from . import cache
+from . import scheduler
+from . import profiling
 from . import utils
 from . import ui
 from . import threads
@@ -610,10 +613,11 @@ class MainWindow(qt5.QMainWindow):
 
     workspace_updated = qt5.pyqtSignal()
 
-    def __init__(self, app):
+    def __init__(self, app, headless=False):
         super(MainWindow, self).__init__()
 
         self.app = app
+        self.headless = headless  # Batch mode (see batch.py); no window, dialogs or view rendering
         # Central variable for storing application configuration (load/save from file?
         self.config = qt5.QSettings()
 
@@ -698,6 +702,20 @@ class MainWindow(qt5.QMainWindow):
 
         self.menuBars['file'].addSeparator()
 
+        export_profileAction = qt5.QAction(tr('Export Profile Report…'), self)
+        export_profileAction.setStatusTip(tr('Export timings of each tool for the latest workflow run'))
+        export_profileAction.triggered.connect(self.onExportProfile)
+        self.menuBars['file'].addAction(export_profileAction)
+
+        trace_memoryAction = qt5.QAction(tr('Profile Peak Memory'), self)
+        trace_memoryAction.setStatusTip(tr('Record the peak memory of each tool in the profile report (slows tools down)'))
+        trace_memoryAction.setCheckable(True)
+        trace_memoryAction.setChecked(profiling.trace_memory)
+        trace_memoryAction.toggled.connect(self.onTraceMemory)
+        self.menuBars['file'].addAction(trace_memoryAction)
+
+        self.menuBars['file'].addSeparator()
+
         printAction = qt5.QAction(qt5.QIcon(os.path.join(utils.scriptdir, 'icons', 'printer.png')), tr('&Print…'), self)
         printAction.setShortcut('Ctrl+P')
         printAction.setStatusTip(tr('Print current figure'))
@@ -854,6 +872,21 @@ class MainWindow(qt5.QMainWindow):
         self.threadpool = qt5.QThreadPool()
         print(("Multithreading with maximum %d threads" % self.threadpool.maxThreadCount()))
 
+        if not self.headless:
+            self.preloadDB()
+
+        # Runs tool regeneration in workflow order (see GenericApp.schedule_generate)
+        self.scheduler = scheduler.WorkflowScheduler(self)
+
+        # Cache of tool results (see GenericApp._generate_copy_on_write); sizes in MB
+        self.result_cache = cache.ResultCache(
+            max_bytes=int(self.config.value('/Cache/Memory', 512)) * cache.MB,
+            spill_max_bytes=int(self.config.value('/Cache/Disk', 2048)) * cache.MB,
+        )
+
+        # Timings of tool generate/prerender calls, per workflow run (see profiling.py)
+        self.profile_log = profiling.ProfileLog()
+
         self.setCentralWidget(self.stack)
         self.stack.setCurrentIndex(0)
 
@@ -942,6 +975,9 @@ class MainWindow(qt5.QMainWindow):
         self.progressTracker = {}  # Dict storing values for each view/object
 
         self.statusBar().showMessage(tr('Ready'))
+        if self.headless:
+            return
+
         self.showMaximized()
 
         # Do version upgrade check
@@ -1113,6 +1149,14 @@ class MainWindow(qt5.QMainWindow):
                 # Unsupported format error
                 pass
 
+    def onExportProfile(self):
+        filename, _ = qt5.QFileDialog.getSaveFileName(self, 'Export profile report', '', "CSV (*.csv);;JSON (*.json)")
+        if filename:
+            self.profile_log.write(filename)
+
+    def onTraceMemory(self, checked):
+        profiling.trace_memory = checked
+
     def onAbout(self):
         dlg = DialogAbout(self)
         dlg.exec_()
@@ -1122,6 +1166,11 @@ class MainWindow(qt5.QMainWindow):
 
     def onReloadDB(self):
         self.db = db.databaseManager()
+        self.preloadDB()
+
+    def preloadDB(self):
+        # Load the on-demand database sections in the background; batch runs load only what they use
+        self.threadpool.start(threads.Worker(self.db.preload))
 
     def onRefresh(self):
         self.generateGraphView()
@@ -1274,6 +1323,10 @@ class MainWindow(qt5.QMainWindow):
         root = et.Element("Workflow")
         root.set('xmlns:mpwfml', "http://pathomx.org/schema/Workflow/2013a")
 
+        # Generated results are stored as DataSet archives in a folder next to the workflow file
+        datapath = os.path.splitext(fn)[0] + '_data'
+        datafiles = set()
+
         # Build a JSONable object representing the entire current workspace and write it to file
         for v in self.apps:
             app = et.SubElement(root, "App")
@@ -1310,9 +1363,46 @@ class MainWindow(qt5.QMainWindow):
                     cs.set("manager", si.manager.id)
                     cs.set("interface", si.manager_interface)
 
+            if getattr(v, 'source', None):  # Imported file (or folder)
+                source = et.SubElement(app, "Source")
+                source.set("file", v.source[0])
+                if v.source[1]:
+                    source.set("type", v.source[1])
+
+            # Store the latest results with the hash of the inputs/config that produced them
+            result = v._latest_generator_result
+            if v.generated_hash and result and all(isinstance(dso, data.DataSet) for dso in result.values()):
+                utils.mkdir_p(datapath)
+                saved = {}
+                try:
+                    for rk, dso in list(result.items()):
+                        dfn = '%s_%s.npz' % (v.id, rk)
+                        dso.save(os.path.join(datapath, dfn))
+                        saved[rk] = dfn
+                except TypeError as e:
+                    # Results holding values that can't be stored are regenerated on open instead
+                    logging.warning("Not storing results of %s: %s" % (v.name, e))
+                else:
+                    generated = et.SubElement(app, "GeneratedData")
+                    generated.set("hash", v.generated_hash)
+                    for rk, dfn in saved.items():
+                        ro = et.SubElement(generated, "Result")
+                        ro.set("id", rk)
+                        ro.set("file", os.path.join(os.path.basename(datapath), dfn))
+                datafiles.update(saved.values())
+
         tree = et.ElementTree(root)
         tree.write(fn)  # , pretty_print=True)
 
+        # Remove results left from earlier saves
+        if os.path.isdir(datapath):
+            for dfn in os.listdir(datapath):
+                if dfn.endswith('.npz') and dfn not in datafiles:
+                    try:
+                        os.remove(os.path.join(datapath, dfn))
+                    except OSError:
+                        pass  # Still mapped (Windows)
+
     def onOpenWorkflow(self):
         """ Open a data file"""
         filename, _ = qt5.QFileDialog.getOpenFileName(self, 'Open new workflow', '', "Pathomx Workflow Format (*.mpf)")
@@ -1352,6 +1442,10 @@ class MainWindow(qt5.QMainWindow):
 
             app.config.set_many(config, trigger_update=False)
 
+            xsource = xapp.find('Source')
+            if xsource is not None:
+                app.source = (xsource.get('file'), xsource.get('type'))
+
         print("...Linking objects.")
         # Now build the links between objects; we need to force these as data is not present
         for xapp in workflow.findall('App'):
@@ -1360,11 +1454,66 @@ class MainWindow(qt5.QMainWindow):
             for idef in xapp.findall('DataInputs/Input'):
                 app.data._consume_action(idef.get('id'), appref[idef.get('manager')].data.o[idef.get('interface')])
 
+        print("...Restoring generated data.")
+        self.restoreWorkflowData(workflow, appref, os.path.dirname(fn))
+
         print("Load complete.")
         # Focus the home tab & refresh the view
         self.workspace_updated.emit()
 
 
+    def restoreWorkflowData(self, workflow, appref, path):
+        # Bring tools up from their saved results where the hash of their inputs and config still
+        # matches; otherwise regenerate (downstream tools follow through the usual notifications)
+        xapps = workflow.findall('App')
+        upstream = {}
+        for xapp in xapps:
+            upstream[xapp.get('id')] = set(idef.get('manager') for idef in xapp.findall('DataInputs/Input'))
+
+        done = set()
+        restored = set()
+        regenerate = []
+        while len(done) < len(xapps):
+            # Upstream tools first
+            ready = [xapp for xapp in xapps if xapp.get('id') not in done and upstream[xapp.get('id')] <= done]
+            if not ready:
+                break  # Circular links; leave the rest as loaded
+
+            for xapp in ready:
+                app_id = xapp.get('id')
+                done.add(app_id)
+                if not upstream[app_id] <= restored:
+                    continue  # Changed upstream; regenerated when that tool is
+
+                app = appref[app_id]
+                generated = xapp.find('GeneratedData')
+                if generated is not None and self._generatedDataCurrent(app, generated, path):
+                    result = {}
+                    for ro in generated.findall('Result'):
+                        result[ro.get('id')] = data.DataSet().load(os.path.join(path, ro.get('file')), db=self.db)
+                    app.restore(result, generated.get('hash'))
+                    restored.add(app_id)
+
+                elif upstream[app_id]:
+                    regenerate.append(app)
+
+                elif getattr(app, 'source', None) and os.path.exists(app.source[0]):
+                    app.thread_load_datafile(*app.source)  # Source changed since the save; re-import
+
+        for app in regenerate:
+            app.schedule_generate()
+
+    def _generatedDataCurrent(self, app, generated, path):
+        for ro in generated.findall('Result'):
+            if not os.path.exists(os.path.join(path, ro.get('file'))):
+                return False
+
+        kwargs_dict = {}
+        for i in list(app.data.i.keys()):
+            kwargs_dict[i] = app.data.get(i)
+        return app.generate_hash(kwargs_dict) == generated.get('hash')
+
+
 class QApplicationExtend(qt5.QApplication):
     def event(self, e):
         if e.type() == qt5.QEvent.FileOpen:
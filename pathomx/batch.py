@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+Headless batch execution of saved workflows.
+
+    pathomx-batch [options] workflow.mpf [input ...]
+
+The workflow is run once for each input (a file, or folder for Bruker NMR data), loaded
+through the import tool given by --tool (by default the workflow's only import tool).
+Further import tools can be bound to a fixed input for every run with --bind name=path.
+The outputs of each tool that produced results in the run are written as DataSet archives
+(see DataSet.save) to <output folder>/<input name>/<tool name>-<tool id>.<output>.npz, along
+with a profile.csv report of the time and memory each tool took (see profiling.py). Tools
+that failed, or were not re-run because a tool upstream failed, are left out.
+
+Tools are built without showing a window and views are not rendered; Qt runs on the
+offscreen platform unless QT_QPA_PLATFORM is set, so no display server is needed.
+'''
+from __future__ import unicode_literals
+
+import os
+import sys
+import re
+from optparse import OptionParser
+
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtWidgets import QApplication
+
+from . import utils
+
+
+class BatchRunner(object):
+
+    def __init__(self, app, workflow):
+        from .Pathomx import MainWindow
+
+        self.app = app
+        self.m = MainWindow(app, headless=True)
+        self.m.openWorkflow(workflow)
+        self.wait()
+
+        self.written = {}  # tool id: results whose outputs were last written
+
+    def find_tool(self, name):
+        for a in self.m.apps:
+            if a.name == name or a.id == name:
+                return a
+        raise ValueError("No tool named '%s' in workflow" % name)
+
+    def import_tools(self):
+        from .ui import ImportDataApp
+        return [a for a in self.m.apps if isinstance(a, ImportDataApp)]
+
+    def wait(self):
+        # Spin the event loop until nothing is queued, generating or waiting to deliver results
+        idle = 0
+        while idle < 2:
+            self.app.processEvents(QEventLoop.AllEvents, 100)
+            if self.m.scheduler.busy() or not self.m.threadpool.waitForDone(100):
+                idle = 0
+            else:
+                idle += 1
+
+    def run(self, bindings):
+        for a in self.m.apps:
+            a._latest_exception = None  # Only report errors from this run
+        self.m.profile_log.new_run()
+
+        for tool, path in bindings:
+            print("Loading %s into %s" % (path, tool.name))
+            tool.thread_load_datafile(path)
+        self.wait()
+
+        return [(a, a._latest_exception) for a in self.m.apps if a._latest_exception is not None]
+
+    def write_outputs(self, path):
+        # Only tools with new results since the last write; the id keeps same-named tools apart
+        for a in self.m.apps:
+            result = a._latest_generator_result
+            if a._latest_exception is not None or result is None or result is self.written.get(a.id):
+                continue
+            self.written[a.id] = result
+
+            for interface, dso in list(a.data.o.items()):
+                if dso.data.size == 0:
+                    continue
+                fn = '%s-%s.%s.npz' % (re.sub(r'[^\w\-. ]', '_', a.name), a.id, interface)
+                try:
+                    dso.save(os.path.join(path, fn))
+                except TypeError as e:  # Values that can't be stored in an archive
+                    print("Not writing %s: %s" % (fn, e))
+
+        self.m.profile_log.write(os.path.join(path, 'profile.csv'))
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] workflow.mpf [input ...]")
+    parser.add_option("-t", "--tool", dest="tool", default=None,
+                      help="import tool (name or id) each input is loaded into")
+    parser.add_option("-b", "--bind", dest="bind", action="append", default=[],
+                      help="load path into an import tool for every run, as name=path")
+    parser.add_option("-o", "--output", dest="output", default='.',
+                      help="folder to write outputs to (default: current folder)")
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("No workflow given")
+    workflow, inputs = args[0], args[1:]
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication(sys.argv)
+    app.setOrganizationName("Pathomx")
+    app.setOrganizationDomain("pathomx.org")
+    app.setApplicationName("Pathomx")
+
+    runner = BatchRunner(app, workflow)
+
+    bindings = []
+    for b in options.bind:
+        name, path = b.split('=', 1)
+        bindings.append((runner.find_tool(name), path))
+
+    if options.tool:
+        tool = runner.find_tool(options.tool)
+    else:
+        tools = [a for a in runner.import_tools() if a not in [t for t, p in bindings]]
+        if inputs and len(tools) != 1:
+            parser.error("Workflow has %d unbound import tools; choose one with --tool" % len(tools))
+        tool = tools[0] if tools else None
+
+    # No inputs: run once with the workflow as saved (and any fixed bindings)
+    runs = [(os.path.basename(os.path.normpath(i)), bindings + [(tool, i)]) for i in inputs] or [('output', bindings)]
+
+    failed = 0
+    for name, run_bindings in runs:
+        print("Running %s..." % name)
+        errors = runner.run(run_bindings)
+        for a, e in errors:
+            print("Error in %s: %s" % (a.name, e))
+        failed += bool(errors)
+
+        path = os.path.join(options.output, name)
+        utils.mkdir_p(path)
+        runner.write_outputs(path)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import zipfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import utils
+from .data import DataSet, CategoricalAnnotation, scratch_path
+
+MB = 1024 * 1024
+
+
+def result_nbytes(v):
+    '''
+    Bytes held in the ndarrays of a result value: DataSet data and annotations, and arrays
+    on their own or in lists, tuples and dicts.
+    '''
+    if isinstance(v, DataSet):
+        annotations = (v.labels, v.entities, v.scales, v.classes)
+        return v.data.nbytes + sum((a.codes if isinstance(a, CategoricalAnnotation) else a.values).nbytes
+                                   for al in annotations for a in al)
+    elif isinstance(v, np.ndarray):
+        return v.nbytes
+    elif isinstance(v, dict):
+        return sum(result_nbytes(x) for x in v.values())
+    elif isinstance(v, (list, tuple)):
+        return sum(result_nbytes(x) for x in v)
+    return 0
+
+
+class ResultCache(object):
+    '''
+    Size-bounded LRU cache of generate() results, keyed by GenericApp.generate_hash.
+
+    Entries pushed out of memory are spilled to disk as DataSet archives (up to spill_max_bytes)
+    and read back memory-mapped on a hit. Results are held and returned as copy-on-write views,
+    so tools can't modify a cached result in place. Safe to use from worker threads.
+    '''
+
+    def __init__(self, max_bytes=512 * MB, spill_max_bytes=0, spill_path=None):
+        self.max_bytes = max_bytes
+        self.spill_max_bytes = spill_max_bytes
+        self.spill_path = spill_path
+
+        self.entries = OrderedDict()  # key: (result, nbytes); least recently used first
+        self.spilled = OrderedDict()  # key: (names, nbytes)
+        self.nbytes = 0
+        self.spill_nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries[key] = self.entries.pop(key)  # Most recently used
+                result = self.entries[key][0]
+
+            elif key in self.spilled:
+                names, nbytes = self.spilled.pop(key)
+                self.spill_nbytes -= nbytes
+                path = self._spill_dir(key)
+                result = dict((n, DataSet().load(os.path.join(path, '%s.npz' % n))) for n in names)
+                self._put(key, result, nbytes)
+
+            else:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._views(result)
+
+    def put(self, key, result):
+        nbytes = result_nbytes(result)
+        with self.lock:
+            if key in self.entries:
+                return
+            self._put(key, self._views(result), nbytes)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for key in list(self.spilled.keys()):
+                shutil.rmtree(self._spill_dir(key), True)
+            self.spilled.clear()
+            self.nbytes = 0
+            self.spill_nbytes = 0
+
+    def _put(self, key, result, nbytes):
+        if nbytes > self.max_bytes:
+            self._spill(key, result, nbytes)
+            return
+
+        self.entries[key] = (result, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            k, (r, n) = self.entries.popitem(last=False)
+            self.nbytes -= n
+            self._spill(k, r, n)
+
+    def _spill(self, key, result, nbytes):
+        # Only whole results of DataSets can be written out; anything else is dropped
+        if not self.spill_max_bytes or nbytes > self.spill_max_bytes or \
+           not all(isinstance(v, DataSet) for v in result.values()):
+            return
+
+        path = self._spill_dir(key)
+        utils.mkdir_p(path)
+        for n, dso in list(result.items()):
+            dso.save(os.path.join(path, '%s.npz' % n))
+
+        self.spilled[key] = (list(result.keys()), nbytes)
+        self.spill_nbytes += nbytes
+        while self.spill_nbytes > self.spill_max_bytes:
+            k, (names, n) = self.spilled.popitem(last=False)
+            self.spill_nbytes -= n
+            shutil.rmtree(self._spill_dir(k), True)
+
+    def _spill_dir(self, key):
+        return os.path.join(self.spill_path or os.path.join(scratch_path(), 'results'), key)
+
+    def _views(self, result):
+        return dict((k, v.as_view() if isinstance(v, DataSet) else v) for k, v in result.items())
+
+
+class FileCache(object):
+    '''
+    Size-bounded cache of named arrays stored as NPZ files in a folder, keyed by strings
+    (e.g. hashes of the files and settings the arrays were computed from). It persists
+    between sessions; trim() removes the least recently used (read or written) entries
+    down to max_bytes.
+    '''
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _file(self, key):
+        return os.path.join(self.path, '%s.npz' % key)
+
+    def get(self, key):
+        # Dict of the arrays stored under key; None if there are none (or they can't be read)
+        fn = self._file(key)
+        try:
+            with np.load(fn) as f:
+                arrays = dict((k, f[k]) for k in f.files)
+            os.utime(fn)  # Most recently used (see trim)
+            return arrays
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def put(self, key, **arrays):
+        utils.mkdir_p(self.path)
+        fn = self._file(key)
+        with open(fn + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(fn + '.tmp', fn)  # Never leave a partly written entry in the cache
+
+    def trim(self):
+        entries = []
+        for fn in os.listdir(self.path) if os.path.isdir(self.path) else []:
+            try:
+                st = os.stat(os.path.join(self.path, fn))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+
+        nbytes = sum(size for mtime, size, fn in entries)
+        for mtime, size, fn in sorted(entries):
+            if nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, fn))
+            except OSError:
+                pass
+            nbytes -= size
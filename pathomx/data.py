@@ -9,6 +9,14 @@ from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
 import os, sys, re, base64
+import atexit
+import hashlib
+import json
+import struct
+import zipfile
+import shutil
+import tempfile
+import weakref
 import numpy as np
 
 from collections import defaultdict
@@ -16,13 +24,6 @@ import operator
 
 from copy import copy, deepcopy
 
-try:
-    import xml.etree.cElementTree as et
-except ImportError:
-    import xml.etree.ElementTree as et
-
-
-
 
 class DataTreeItem(object):
     '''
@@ -191,6 +192,7 @@ class DataManager( QObject ):
 
     # Signals
     source_updated = pyqtSignal()
+    source_appended = pyqtSignal( str, int ) # Input interface, first new row; see append
     consumed = pyqtSignal( tuple, tuple )
     unconsumed = pyqtSignal( tuple, tuple )
 
@@ -219,7 +221,8 @@ class DataManager( QObject ):
             dso = self.i[interface]
             #dso.log.append('Retrieved by %s on interface %s' % (self, interface) )
             #dso.manager.watchers[ dso.manager_interface ].add( self )
-            return deepcopy( dso )
+            # Copy-on-write view; the data is shared read-only with the upstream output
+            return dso.as_view() if dso else dso
                 
         return False
     
@@ -235,14 +238,16 @@ class DataManager( QObject ):
     # independent of the object itself (so can overwrite instead of warping)
     def put(self, interface, dso, update_consumers = True):
         if interface in self.o:
-            self.o[interface].import_data(dso)
+            # Hand-off: the output takes a read-only view of the generated data (no copy)
+            self.o[interface].import_data(dso, shared=True)
             #self.o[interface].log.append('Output by %s on interface %s' % (self, interface) )
             self.o[interface].manager = self
             self.o[interface].manager_interface = interface
             # Update consumers / refresh views
             self.o[interface].refresh_interfaces()    
             self.o[interface].previously_managed_by.append(self)
-            self.notify_watchers(interface)
+            if update_consumers:
+                self.notify_watchers(interface)
 
 
             self.m.dataModel.refresh()
@@ -251,6 +256,17 @@ class DataManager( QObject ):
             
         return False
     
+    # Output a dataset that is the current output with rows (dim 0) appended from start on, e.g.
+    # new samples from a watched folder. Consumers get source_appended rather than source_updated
+    # so tools that support it process only the new rows (see GenericApp.generate_append)
+    def append(self, interface, dso, start):
+        if interface in self.o:
+            self.put(interface, dso, update_consumers=False)
+            if dso.data.shape[0] > start:
+                self.notify_watchers_append(interface, start)
+            return True
+        return False
+
     def unput(self, interface):
         print('UNPUTTING')
         # Trigger _unconsume on all watchers
@@ -317,6 +333,13 @@ class DataManager( QObject ):
             manager.source_updated.emit()
             
             
+    def notify_watchers_append(self, interface, start):
+        dso = self.o[interface]
+        for manager in self.watchers[interface]:
+            for i, d in list(manager.i.items()):
+                if d is dso:
+                    manager.source_appended.emit( i, start )
+
     # Handle consuming of a data object; assignment to internal tables and processing triggers (plus child-triggers if appropriate)
     # Build import/hooks for this consumable object (need interface logic here; standardise where things will end up)
     def can_consume(self, data, consumer_defs=None):
@@ -450,6 +473,283 @@ class DataManager( QObject ):
 def at_least_one_element_in_common(l1, l2):
     return len( set(l1) & set(l2) ) > 0
 
+def readonly_view(a):
+    # Return a read-only view onto array a; writes through the view raise ValueError
+    v = np.asarray(a).view()
+    v.flags.writeable = False
+    return v
+
+# File-mapped (out-of-core) data storage
+# Arrays larger than MEMMAP_THRESHOLD bytes are created as np.memmap arrays in a scratch
+# directory for this workspace, and large copies/selections work CHUNK_BYTES at a time, so
+# resident memory is bounded by the chunk size rather than the size of the dataset.
+# Set MEMMAP_THRESHOLD to None to keep all data in memory.
+MEMMAP_THRESHOLD = 256 * 1024 * 1024
+CHUNK_BYTES = 16 * 1024 * 1024
+
+_scratch_path = None
+
+def scratch_path():
+    # Scratch directory for file-mapped arrays; created on first use, removed on exit
+    global _scratch_path
+    if _scratch_path is None:
+        _scratch_path = tempfile.mkdtemp(prefix='pathomx-scratch-')
+        atexit.register(shutil.rmtree, _scratch_path, True)
+    return _scratch_path
+
+def is_large(shape, dtype=np.float64):
+    return MEMMAP_THRESHOLD is not None and \
+        int(np.prod(shape)) * np.dtype(dtype).itemsize > MEMMAP_THRESHOLD
+
+def scratch_array(shape, dtype=np.float64):
+    '''
+    Return a zeroed array of shape; file-mapped in the scratch directory if it is large.
+    '''
+    if not is_large(shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    fd, fn = tempfile.mkstemp(suffix='.dat', dir=scratch_path())
+    os.close(fd)
+    a = np.memmap(fn, dtype=dtype, mode='w+', shape=tuple(shape))
+    try:
+        os.remove(fn) # The mapping stays valid; the space is freed with the array (POSIX)
+    except OSError:
+        pass # Windows; removed with the scratch directory on exit
+    return a
+
+def chunks(a, axis=0):
+    '''
+    Yield index tuples selecting successive blocks of a along axis, each about CHUNK_BYTES.
+    '''
+    n = a.shape[axis]
+    step = max(1, CHUNK_BYTES // max(1, a.nbytes // max(1, n)))
+    for start in range(0, n, step):
+        yield (slice(None),) * axis + (slice(start, start + step),)
+
+def copy_array(a):
+    # Copy of a; large arrays are copied chunk by chunk into a file-mapped array
+    if not is_large(a.shape, a.dtype):
+        return np.array(a)
+
+    c = scratch_array(a.shape, a.dtype)
+    for s in chunks(a):
+        c[s] = a[s]
+    return c
+
+def take_array(a, key, axis=0):
+    '''
+    Select entries of a along axis by boolean mask or index array, as a[..., key, ...].
+
+    Large results are built chunk by chunk into a file-mapped array.
+    '''
+    key = np.asarray(key)
+    if key.dtype == bool:
+        key = np.flatnonzero(key)
+
+    shape = list(a.shape)
+    shape[axis] = len(key)
+    if not is_large(shape, a.dtype):
+        return np.take(a, key, axis=axis)
+
+    out = scratch_array(shape, a.dtype)
+    if axis == 0:
+        for s in chunks(out):
+            out[s] = a[key[s]]
+    else:
+        for s in chunks(a):
+            out[s] = np.take(a[s], key, axis=axis)
+    return out
+
+def appended_rows(dso, previous):
+    '''
+    Number of rows of previous if dso is previous with rows (dim 0) appended, and the data and
+    annotations of the earlier rows and of the other axes unchanged; otherwise None.
+    '''
+    n = previous.data.shape[0]
+    if dso.data.ndim != previous.data.ndim or dso.data.shape[1:] != previous.data.shape[1:] or dso.data.shape[0] < n:
+        return None
+
+    for annotations, other in [(dso.labels, previous.labels), (dso.scales, previous.scales),
+                               (dso.classes, previous.classes), (dso.entities, previous.entities)]:
+        if annotations[0].tolist()[:n] != other[0].tolist():
+            return None
+        if any(a != b for a, b in zip(annotations[1:], other[1:])):
+            return None
+
+    equal_nan = dso.data.dtype.kind in 'fc' and previous.data.dtype.kind in 'fc'
+    earlier = dso.data[:n]
+    for s in chunks(previous.data):
+        if not np.array_equal(earlier[s], previous.data[s], equal_nan=equal_nan):
+            return None
+    return n
+
+class DataDigest(object):
+    '''
+    Digest of a read-only data array, shared between the DataSets holding views of it.
+
+    Arrays are held by weak reference; the digest applies while a DataSet's data is one of them.
+    '''
+
+    def __init__(self, data, digest=None):
+        self.arrays = [weakref.ref(data)]
+        self.digest = digest
+
+    def add(self, data):
+        self.arrays = [r for r in self.arrays if r() is not None] + [weakref.ref(data)]
+
+    def holds(self, data):
+        return any(r() is data for r in self.arrays)
+
+# NPZ archive members for DataSet.save/load
+DATASET_FORMAT_VERSION = 2 # 2: type-tagged JSON values (see _json_encode)
+
+def _json_encode(v):
+    '''
+    v with the values JSON can't hold as they are tagged by type: tuples, dicts with keys
+    other than strings and NumPy arrays and scalars. Anything else unserialisable raises a
+    TypeError rather than being saved as its string.
+    '''
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    elif isinstance(v, tuple):
+        return {'__tuple__': [_json_encode(i) for i in v]}
+    elif isinstance(v, list):
+        return [_json_encode(i) for i in v]
+    elif isinstance(v, dict):
+        if all(isinstance(k, str) for k in v) and not any(k.startswith('__') and k.endswith('__') for k in v):
+            return dict((k, _json_encode(i)) for k, i in v.items())
+        return {'__dict__': [[_json_encode(k), _json_encode(i)] for k, i in v.items()]}
+    elif isinstance(v, np.generic):
+        return _json_encode(v.item())
+    elif isinstance(v, np.ndarray) and v.dtype != object:
+        return {'__ndarray__': v.tolist(), 'dtype': v.dtype.str}
+    raise TypeError("Can't save %s value %r in a dataset" % (type(v).__name__, v))
+
+def _json_decode(d):
+    # json object_hook reversing _json_encode
+    if '__tuple__' in d:
+        return tuple(d['__tuple__'])
+    elif '__dict__' in d:
+        return dict((k, v) for k, v in d['__dict__'])
+    elif '__ndarray__' in d:
+        return np.array(d['__ndarray__'], dtype=d['dtype'])
+    return d
+
+def _hashable(v):
+    # Lists (e.g. tuple categories from version 1 files) back as tuples
+    return tuple(_hashable(i) for i in v) if isinstance(v, list) else v
+
+def _npz_write(zf, name, a):
+    with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(a), allow_pickle=False)
+
+def _npz_read(zf, name):
+    with zf.open(name + '.npy', 'r') as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+def _npz_memmap(fn, zf, name, mode='r'):
+    '''
+    Memory-map an uncompressed .npy member of the NPZ archive fn (open as zf) without reading it.
+    '''
+    info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return _npz_read(zf, name)
+
+    with open(fn, 'rb') as f:
+        # Skip the zip local file header (fixed 30 bytes, then the name and extra fields)
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_n, extra_n = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_n + extra_n)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+
+    return np.memmap(fn, dtype=dtype, mode=mode, offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+# Grouped reductions with a vectorized kernel; other functions are applied group by group
+GROUP_REDUCE_KERNELS = {
+    np.sum: 'sum', np.ma.sum: 'sum',
+    np.mean: 'mean', np.ma.mean: 'mean',
+    np.std: 'std', np.ma.std: 'std',
+    np.median: 'median', np.ma.median: 'median',
+}
+
+def group_reduce(data, groups, n, fn=np.mean, axis=0):
+    '''
+    Reduce data along axis within groups, in a single pass over the data.
+
+    groups holds the group number (0 to n-1) of each entry along axis; the result has n
+    entries along axis. Entries are sorted by group once so each group is a contiguous
+    block; sum, mean and std are then reduced with np.add.reduceat and median (or any
+    other fn) per block. Groups with no entries give NaN (0 for sum).
+
+    Masked entries of a masked array are left out, as np.ma reductions do; the result is
+    then a masked array, masked where every entry of a group was.
+    '''
+    masked = np.ma.isMaskedArray(data)
+    valid = np.moveaxis( ~np.ma.getmaskarray(data), axis, 0 ) if masked else None
+    data = np.moveaxis( np.ma.getdata(data) if masked else np.asarray(data), axis, 0 )
+    groups = np.asarray(groups, dtype=np.intp)
+
+    order = np.argsort( groups, kind='mergesort' )
+    sdata = data[ order ]
+    counts = np.bincount( groups, minlength=n )
+    starts = np.concatenate( [[0], np.cumsum(counts)[:-1]] ).astype(np.intp)
+    present = counts > 0 # reduceat needs increasing starts within the data
+    shape = (n,) + sdata.shape[1:]
+
+    def reduce(a):
+        # Sum of each group's block
+        r = np.zeros( shape, dtype=a.dtype )
+        if present.any():
+            r[present] = np.add.reduceat( a, starts[present], axis=0 )
+        return r
+
+    if masked:
+        svalid = valid[ order ]
+        sdata = np.where( svalid, sdata, 0 )
+        bcounts = reduce( svalid.astype(np.intp) )
+    else:
+        bcounts = np.broadcast_to( counts.reshape( (-1,) + (1,) * (sdata.ndim - 1) ), shape ) # Broadcast against data
+
+    kernel = GROUP_REDUCE_KERNELS.get(fn)
+    with np.errstate( invalid='ignore', divide='ignore' ):
+        if kernel == 'sum':
+            r = reduce( sdata )
+
+        elif kernel == 'mean':
+            r = reduce( sdata ) / bcounts
+
+        elif kernel == 'std':
+            mean = reduce( sdata ) / bcounts
+            deviation = sdata - np.repeat( mean, counts, axis=0 )
+            if masked:
+                deviation = np.where( svalid, deviation, 0 )
+            r = np.sqrt( reduce( deviation ** 2 ) / bcounts )
+
+        else:
+            if kernel == 'median':
+                fn = np.ma.median if masked else np.median
+            r = np.full( shape, np.nan )
+            for g in np.flatnonzero( present ):
+                block = sdata[ starts[g]:starts[g] + counts[g] ]
+                if masked:
+                    block = np.ma.masked_array( block, mask=~svalid[ starts[g]:starts[g] + counts[g] ] )
+                r[g] = np.ma.filled( fn( block, axis=0 ), np.nan )
+
+    if masked:
+        r = np.ma.masked_array( r, mask=(bcounts == 0) )
+    return np.moveaxis( r, 0, axis )
+
 class DataDefinition( QObject ):
 
     cmp_map = {
@@ -581,6 +881,319 @@ class TableInterface(QAbstractTableModel):
             self.emit(SIGNAL("layoutChanged()"))
 
 
+# Array-backed annotations (labels, entities, scales, classes) for a single DataSet axis.
+# These behave as lists for plugin code, but hold the values in a NumPy array so that
+# mask and index selection along an axis is a single vectorized operation.
+
+def _object_array(values):
+    # 1d object array; assigned element-wise if numpy would otherwise descend into
+    # sequence values (e.g. tuples) and build a 2d array
+    a = np.empty(len(values), dtype=object)
+    try:
+        a[:] = values
+    except (ValueError, TypeError):
+        for n, v in enumerate(values):
+            a[n] = v
+    return a
+
+def _is_float(v):
+    return isinstance(v, (float, np.floating))
+
+def _annotation_array(values):
+    # Float annotations (e.g. ppm scales) are stored as float64, anything else as objects
+    # so None and mixed types are kept as-is. Always returns a new array.
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'f':
+            return values.astype(np.float64)
+        elif values.dtype == object:
+            return values.copy()
+        values = values.tolist()
+
+    values = list(values)
+    if values and all(_is_float(v) for v in values):
+        return np.array(values, dtype=np.float64)
+    return _object_array(values)
+
+
+class Annotation(object):
+    '''
+    Annotation values for one axis of a DataSet, e.g. dso.labels[1].
+
+    Supports the list operations used by plugins (indexing, slicing, iteration, len, in,
+    index, count, append, extend, + and == with lists). Indexing with a boolean mask or an
+    index array returns the selected annotation, as for NumPy arrays.
+    '''
+
+    def __init__(self, values=()):
+        if isinstance(values, Annotation):
+            values = values.values
+        self._values = _annotation_array(values)
+        self._pending = [] # Appended values not yet merged into the array
+
+    @property
+    def values(self):
+        if self._pending:
+            self._values = _annotation_array(self._values.tolist() + self._pending)
+            self._pending = []
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = _annotation_array(values)
+        self._pending = []
+
+    def tolist(self):
+        return self.values.tolist()
+
+    def select(self, key):
+        '''
+        Return the annotation for the entries selected by a boolean mask or index array.
+        '''
+        a = type(self)()
+        a._values = self.values[key].copy() if isinstance(key, slice) else self.values[key]
+        return a
+
+    def isin(self, values):
+        '''
+        Return a boolean mask of the entries found in values.
+        '''
+        if self.values.dtype.kind == 'f':
+            return np.isin(self.values, [v for v in values if _is_float(v) or isinstance(v, int)])
+        try:
+            values = set(values)
+        except TypeError: # Unhashable; fall back to list membership
+            values = list(values)
+        return np.array([v in values for v in self.values.tolist()], dtype=bool)
+
+    def unique(self):
+        return list(set(self.tolist()))
+
+    def factorize(self):
+        '''
+        Return an integer code for each entry (equal values share a code) and the number of codes.
+        '''
+        if self.values.dtype.kind == 'f':
+            uniques, codes = np.unique( self.values, return_inverse=True )
+            return codes.reshape(-1), len(uniques)
+
+        index = {}
+        codes = np.array([ index.setdefault(v, len(index)) for v in self.values.tolist() ], dtype=np.intp)
+        return codes, len(index)
+
+    def copy(self):
+        return type(self)(self)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        # Values are strings, floats or database objects; don't descend into them
+        return self.copy()
+
+    def __reduce__(self):
+        return (type(self), (self.tolist(),))
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __len__(self):
+        return len(self._values) + len(self._pending)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __contains__(self, v):
+        return v in self.tolist()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return type(self)(self.values[key])
+
+        elif isinstance(key, (int, np.integer)):
+            v = self.values[key]
+            return float(v) if self.values.dtype.kind == 'f' else v
+
+        return self.select(np.asarray(key))
+
+    def __setitem__(self, key, value):
+        if self.values.dtype.kind == 'f':
+            fits = all(_is_float(v) for v in value) if isinstance(key, slice) else _is_float(value)
+            if not fits:
+                self._values = self._values.astype(object)
+
+        if isinstance(key, slice) and self.values.dtype == object:
+            value = _object_array(list(value))
+
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        self.values = np.delete(self.values, key)
+
+    def index(self, v):
+        return self.tolist().index(v)
+
+    def count(self, v):
+        return self.tolist().count(v)
+
+    def append(self, v):
+        self._pending.append(v)
+
+    def extend(self, vs):
+        self._pending.extend(vs)
+
+    def __add__(self, other):
+        return type(self)(self.tolist() + list(other))
+
+    def __radd__(self, other):
+        return type(self)(list(other) + self.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, Annotation)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+class CategoricalAnnotation(Annotation):
+    '''
+    Annotation stored as integer codes into a list of categories; used for classes.
+
+    Selection and membership tests work on the codes, and the unique values are known
+    without scanning the axis.
+    '''
+
+    def __init__(self, values=()):
+        if isinstance(values, CategoricalAnnotation):
+            self.categories = values.categories[:]
+            self.codes = values.codes.copy()
+        else:
+            self.categories, self.codes = [], np.zeros((0,), dtype=np.intp)
+            self.extend(values.tolist() if isinstance(values, Annotation) else values)
+
+    def _code(self, v):
+        try:
+            return self.categories.index(v)
+        except ValueError:
+            self.categories.append(v)
+            return len(self.categories) - 1
+
+    def _encode(self, values):
+        index = {c: n for n, c in enumerate(self.categories)}
+        codes = []
+        for v in values:
+            if v not in index:
+                index[v] = len(self.categories)
+                self.categories.append(v)
+            codes.append(index[v])
+        return np.array(codes, dtype=np.intp)
+
+    @property
+    def values(self):
+        return _object_array(self.categories)[self.codes]
+
+    @values.setter
+    def values(self, values):
+        self.categories = []
+        self.codes = self._encode(values.tolist() if isinstance(values, np.ndarray) else values)
+
+    def tolist(self):
+        c = self.categories
+        return [c[n] for n in self.codes.tolist()]
+
+    def select(self, key):
+        a = CategoricalAnnotation()
+        a.categories = self.categories[:]
+        a.codes = self.codes[key].copy() if isinstance(key, slice) else self.codes[key]
+        return a
+
+    def isin(self, values):
+        try:
+            values = set(values)
+        except TypeError:
+            values = list(values)
+        found = np.array([c in values for c in self.categories], dtype=bool)
+        return found[self.codes]
+
+    def unique(self):
+        return [self.categories[n] for n in np.unique(self.codes)]
+
+    def factorize(self):
+        return self.codes, len(self.categories)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.categories[self.codes[key]]
+        elif isinstance(key, slice):
+            return self.select(key)
+        return self.select(np.asarray(key))
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            self.codes[key] = self._encode(value)
+        else:
+            self.codes[key] = self._code(value)
+
+    def __delitem__(self, key):
+        self.codes = np.delete(self.codes, key)
+
+    def append(self, v):
+        self.codes = np.append(self.codes, self._code(v))
+
+    def extend(self, vs):
+        if isinstance(vs, np.ndarray):
+            vs = vs.tolist()
+        self.codes = np.concatenate([self.codes, self._encode(vs)])
+
+
+class AnnotationList(list):
+    '''
+    Per-axis list of annotations, e.g. DataSet.labels. Values assigned to an axis are
+    converted to the array-backed annotation type, so dso.labels[1] = [...] still works.
+    Annotations are copied on assignment, so dso.labels[0] = dsi.labels[0] doesn't leave
+    the two DataSets sharing (and editing) one annotation.
+    '''
+
+    def __init__(self, annotations=(), annotation_class=Annotation):
+        self.annotation_class = annotation_class
+        super(AnnotationList, self).__init__(annotation_class(a) for a in annotations)
+
+    def _as_annotation(self, v):
+        return self.annotation_class(v)
+
+    def _take(self, n, annotation):
+        # Set an annotation made for this list (e.g. by select) without copying it
+        super(AnnotationList, self).__setitem__(n, annotation)
+
+    def __setitem__(self, n, v):
+        super(AnnotationList, self).__setitem__(n, self._as_annotation(v))
+
+    def append(self, v):
+        super(AnnotationList, self).append(self._as_annotation(v))
+
+    def copy(self):
+        return AnnotationList(self, self.annotation_class)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return (AnnotationList, (list(self), self.annotation_class))
+
+
 #### FIXME: Other data managers may need to be provided e.g. for 2D/3D datasets. Interfaces should be consistent.
 ## TODO: Chaining and update notification/re-processing 
 
@@ -621,7 +1234,7 @@ class DataSet( QObject ):
 
     def __deepcopy__(self, memo):
 
-        o = DataSet( size=self.shape )
+        o = DataSet() # Don't allocate a zeroed array only to replace it below
         o.manager = None # Maintain the manager link
         o.manager_interface = None # Interface the manager is advertising this on
         
@@ -629,12 +1242,12 @@ class DataSet( QObject ):
         o.description = copy(self.description)
         o.type = copy(self.type) 
 
-        o.labels = [x[:] for x in self.labels]
-        o.entities = [x[:] for x in self.entities]
-        o.scales = [x[:] for x in self.scales]
-        o.classes = [x[:] for x in self.classes]
+        o.labels = self.labels.copy()
+        o.entities = self.entities.copy()
+        o.scales = self.scales.copy()
+        o.classes = self.classes.copy()
 
-        o.data = deepcopy(self.data)
+        o.data = copy_array(self.data)
 
         o.log = self.log[:]
         
@@ -645,38 +1258,55 @@ class DataSet( QObject ):
     # Wipes the data and metadata from the object; but does not alter references to it (or name/description)
     def empty(self, size=(0,)):
 
-        self.labels = []
-        self.entities = []
-        self.scales = []
-        self.classes = []
+        self.labels = AnnotationList()
+        self.entities = AnnotationList()
+        self.scales = AnnotationList()
+        self.classes = AnnotationList(annotation_class=CategoricalAnnotation)
         
         for s in size:
-            self.labels.append( [''] * s )
-            self.entities.append( [None] * s )
-            self.scales.append( [None] * s )
+            self.labels.append( np.full( s, '', dtype=object ) )
+            self.entities.append( np.full( s, None, dtype=object ) )
+            self.scales.append( np.full( s, None, dtype=object ) )
             self.classes.append( [None] * s ) 
 
         self.axes = [None] * len(size)
         
-        self.data = np.zeros( size ) #np.array([]) # Data container  
+        self.data = scratch_array( size ) # Data container; file-mapped if large
+        self._data_hash = None # DataDigest; see content_hash
         
         self.metadata = {}
               
     
-    def import_data(self, dso):
+    # Import data and annotations from another dataset. By default everything is copied;
+    # with shared=True the data is taken as a read-only view of the source and only the
+    # per-axis annotation lists are copied. This is the copy-on-write hand-off between tools:
+    # any in-place write to the shared data raises rather than corrupting the source.
+    def import_data(self, dso, shared=False):
         
         self.name = copy(dso.name)
         self.description = copy(dso.description)
         self.type = copy(dso.type)
 
-        self.axes = deepcopy(dso.axes)
+        self.axes = copy(dso.axes)
 
-        self.labels = deepcopy(dso.labels)
-        self.entities = [copy(e) for e in dso.entities]
-        self.scales = deepcopy(dso.scales)
-        self.classes = deepcopy(dso.classes)
+        # Annotations are array-backed; copying them does not descend into the values
+        self.labels = AnnotationList(dso.labels)
+        self.entities = AnnotationList(dso.entities)
+        self.scales = AnnotationList(dso.scales)
+        self.classes = AnnotationList(dso.classes, annotation_class=CategoricalAnnotation)
 
-        self.data  = deepcopy(dso.data)
+        if shared:
+            self.data = readonly_view(dso.data)
+            # The view has the same content; share the digest of it (see content_hash)
+            if dso.data.flags.writeable:
+                self._data_hash = None
+            else:
+                if not (dso._data_hash and dso._data_hash.holds(dso.data)):
+                    dso._data_hash = DataDigest(dso.data)
+                dso._data_hash.add(self.data)
+                self._data_hash = dso._data_hash
+        else:
+            self.data  = copy_array(dso.data)
     
         self.previously_managed_by = [n for n in dso.previously_managed_by]
 
@@ -699,7 +1329,7 @@ class DataSet( QObject ):
     # class_n holds the number of classes (in each dimension). All accessible as properties
 
     def _l(self, ls):
-        return [ list( set( l ) ) for l in ls ]
+        return [ l.unique() for l in ls ]
 
     def _n(self, ls):
         return [len(l) for l in self._l(ls)]
@@ -774,31 +1404,13 @@ class DataSet( QObject ):
 
     # Return data table np.array containing supplied classes as grouped means
     # classes is a list, d is dimension to collapse
-    # FIXME: This function only works for dim = 0
     def as_class_groups(self, d=0, fn=np.ma.mean, classes=None ):
 
-        # Collapse the classes to a set 
-        if classes:
-            classmatch = list( set( self.classes[d] ) & set( classes ) ) # Matched the classes
-        else:
-            classmatch = self.classes_l
-        
-        sizeR = list( self.shape )
-        sizeR[d] = len(classmatch) # Resizing
-        
-        dso = DataSet()
-        dso.import_data( self ) # We'll overwrite the wrongly dimensional data anyway
-        dso.data = np.zeros(sizeR)
+        # Restrict to the requested classes
+        dso = self.as_filtered(dim=d, classes=classes) if classes else self
         
-        for n,c in enumerate( classmatch):    
-            mask = np.array( [True if c in classmatch else False for c in self.classes[d] ] )
-            masked_data = np.ma.array(self.data, mask=np.repeat(mask,self.data.shape[d]))    
-            
-            calculated_d = fn( masked_data, axis=d)
-            dso.data[n,:] = calculated_d
-                        
-        dso.classes[d] = classmatch
-        dso.labels[d] = classmatch
+        dso = dso.as_summary(fn=fn, dim=d, match_attribs=['classes'])
+        dso.labels[d] = dso.classes[d].tolist()
 
         return dso        
 
@@ -807,103 +1419,105 @@ class DataSet( QObject ):
     # Compression only if classes, labels and entities are equal. Scale is treated the same as data (fn function)
     def as_summary(self, fn=np.mean, dim=1, match_attribs=['classes','labels','entities']):
     
-        available_match_attribs = ['classes','labels','entities'] # If anything not specified collapse/wipe object entities
-    
+        # Group on the combined (class, label, entity) identity; we match only on those
+        # specified as match_attribs. Other annotations are taken from the first entry of each group
+        groups, first = self._groups( dim, match_attribs )
+        print('Reshape from %s to %d on axis %d' % (self.data.shape, len(first), dim))
+
         dso = DataSet()
-        dso.import_data( self ) # We'll overwrite the wrongly dimensional data anyway
+        dso.import_data( self, shared=True ) # Data is replaced by the reduction below
+        dso._select_annotations( dim, first )
 
-        # Build combined (class, label, entity) tuples as matching value
-        # We match only on those specified as match_attribs
-        #print "!!", [ dso.__dict__[ma][dim] for ma in match_attribs ]
-        identities = [ tuple(o) for o in zip( *[ dso.__dict__[ma][dim] for ma in match_attribs ] )  ]#dso.classes[dim], dso.labels[dim], dso.entities[dim]) ]
-        identities_na = np.array( identities )
-        
-        unique = tuple( set( identities ) )
-        
-        old_shape, new_shape = dso.data.shape, list( dso.data.shape )
-        new_shape[ dim ] = len( unique )
-        print('Reshape from %s to %s' % (old_shape,new_shape))
-        dso.crop( new_shape )
-        
-        # OPTIMISE?
-        # Get the singular values (no summarisation needed) and first copy those across
-        # then perform the summary on the remaining entries
+        dso.data = group_reduce( self.data, groups, len(first), fn=fn, axis=dim )
 
-        for n,u in enumerate( unique ):
-            for ma in match_attribs:
-                dso.__dict__[ma][dim][n] = u
-                
-            # Build mask against the original identities file
-            mask = (identities_na == u).all(axis=1) # np.array([ True if u == i else False for i in identities ])
-
-            # Mask of T F T T T F if the identity at this position matches our unique value
-            # Apply this mask to the data; then use specified np.function to reduce it in our dimension
-            if dim == 0:
-                data = self.data[ mask, :] #np.ma.array(self.data, mask=mask)
-                summarised_data = fn( data, axis=dim) #, keepdims=True )
-                dso.data[n,:] = summarised_data
-                # FIXME: We wipe but could combine to keep record
-
-            elif dim ==1:
-                data = self.data[ :, mask] #np.ma.array(self.data, mask=mask)
-                summarised_data = fn( data, axis=dim) #, keepdims=True )
-                dso.data[:,n] = summarised_data
-
-            # Fix existing class/label/etc markers
-            for mn, ma in enumerate(match_attribs):
-                dso.__dict__[ma][dim][n] = unique[n][ mn ]
-                
-            # Wipe out compressed attributes
-            for ma in set(match_attribs) - set(available_match_attribs):
-                dso.__dict__[ma][dim] = [None]*new_shape[dim]
-            
-        for mn, ma in enumerate(match_attribs):
-            dso.__dict__[ma][dim] = dso.__dict__[ma][dim][:new_shape[dim]]
+        scales = self.scales[dim]
+        if scales.values.dtype.kind == 'f':
+            dso.scales[dim] = group_reduce( scales.values, groups, len(first), fn=fn )
 
         return dso
+
+    # Number entries on axis dim by their combined values of the annotations in attribs
+    # Returns the group of each entry and the index of the first entry in each group;
+    # groups are numbered in order of first appearance
+    def _groups(self, dim, attribs):
+        key = np.zeros( self.data.shape[dim], dtype=np.intp )
+        for ma in attribs:
+            codes, n = self.__dict__[ma][dim].factorize()
+            # Renumber after each step so the combined key can't overflow
+            _, key = np.unique( key * n + codes, return_inverse=True )
+            key = key.reshape(-1)
+
+        _, first, groups = np.unique( key, return_index=True, return_inverse=True )
+        order = np.argsort( first )
+        renumber = np.empty_like( order )
+        renumber[ order ] = np.arange( len(order) )
+        
+        return renumber[ groups.reshape(-1) ], first[ order ]
     
     # Filter data by labels/entities on a given axis    
     def as_filtered(self, dim=1, scales=None, classes=None, labels=None, entities=None):
-        dso = DataSet()
-        dso.import_data( self ) # We'll overwrite the wrongly dimensional data anyway
-        old_shape, new_shape = dso.data.shape, list( dso.data.shape )
-        
         # Build consecutive mask
         iter = [
-            (dso.entities[dim], entities),
-            (dso.classes[dim], classes),
-            (dso.scales[dim], scales),
-            (dso.labels[dim], labels),
+            (self.entities[dim], entities),
+            (self.classes[dim], classes),
+            (self.scales[dim], scales),
+            (self.labels[dim], labels),
         ]
         
-        mask = np.array([ True for i in dso.entities[dim] ])
+        mask = np.ones( self.data.shape[dim], dtype=bool )
         for dis,ois in iter:
-            if ois == None:
+            if ois is None:
                 continue
 
-            imask = np.array([ True if di not in ois else False for di in dis ]) 
-            mask[imask] = False
-            
-        new_shape[dim] = list(mask).count(True) # New size of it
-
-        print('Reshape from %s to %s' % (old_shape,new_shape))
-        dso.crop( new_shape )
-        # FIXME: Hacky; what about 3d arrays
-        if dim == 0:
-            dso.data = self.data[ mask, : ]
-        else:
-            dso.data = self.data[ :, mask ]
+            mask &= dis.isin( ois )
 
-        dso.classes[dim] = [v for t,v in zip( mask, self.classes[dim]) if t]
-        dso.entities[dim] = [v for t,v in zip( mask, self.entities[dim]) if t]
-        dso.labels[dim] = [v for t,v in zip( mask, self.labels[dim]) if t]
-        dso.scales[dim] = [v for t,v in zip( mask, self.scales[dim]) if t]
+        print('Reshape from %s to %d on axis %d' % (self.data.shape, np.count_nonzero(mask), dim))
+        dso = DataSet()
+        dso.import_data( self, shared=True ) # Selection below makes the new data array
+        dso.select( dim, mask )
 
         return dso     
     
     def as_copy(self):
         return deepcopy(self)
+
+    # Copy-on-write view of this dataset; data is shared read-only (see import_data)
+    # Tools that need to modify the data in place should take as_copy() instead
+    def as_view(self):
+        dso = DataSet()
+        dso.import_data(self, shared=True)
+        dso.log = self.log[:]
+        return dso
         
+    # New dataset of this one with the rows (dim 0) of dso appended; annotations of the other
+    # axes are this one's. Large data is copied chunk by chunk into a file-mapped array
+    def as_appended(self, dso):
+        o = DataSet()
+        o.import_data(self, shared=True)
+        o.log = self.log[:]
+
+        for annotations, other in [(o.labels, dso.labels), (o.entities, dso.entities), (o.scales, dso.scales), (o.classes, dso.classes)]:
+            annotations._take(0, annotations[0] + other[0])
+
+        n = self.data.shape[0]
+        data = scratch_array((n + dso.data.shape[0],) + self.data.shape[1:], np.result_type(self.data, dso.data))
+        for target, source in [(data[:n], self.data), (data[n:], dso.data)]:
+            for s in chunks(source):
+                target[s] = source[s]
+        o.data = data
+        return o
+
+    # DESTRUCTIVE selection of entries on axis dim by boolean mask or index array
+    # Data and all annotations on that axis are selected in one operation each
+    def select(self, dim, key):
+        key = np.asarray(key)
+        self.data = take_array( self.data, key, axis=dim )
+        self._select_annotations( dim, key )
+
+    def _select_annotations(self, dim, key):
+        for annotations in [self.labels, self.entities, self.scales, self.classes]:
+            annotations._take(dim, annotations[dim].select(key))
+
     # DESTRUCTIVE resizing of the current dso
     # All entries are simply clipped to size
     def crop(self,shape):
@@ -917,7 +1531,8 @@ class DataSet( QObject ):
                 self.scales[d] = self.scales[d][:s]
                 final_shape[d] = shape[d]
                 
-        self.data.resize( final_shape )
+        # Copy the cropped region (chunked if large) so the full array can be released
+        self.data = copy_array( self.data[ tuple( slice(0, s) for s in final_shape ) ] )
 
 
     # DESTRUCTIVE remove invalid data from this dataset object
@@ -925,29 +1540,15 @@ class DataSet( QObject ):
     # updated to keep consistent
     def remove_invalid_data(self, axis=1):   
         
-        if type(axis) != type(list):
+        if not isinstance(axis, list):
             axis = [axis]
           
         # Filter each dimension in turn as specified (order affects results!)
         for d in axis:  
-            if d == 0: #FIXME; how to do this properly?
-                dax = 1
-            else:
-                dax = 0
-                
+            # Any inf/NaN along the other axes makes the mean non-finite
+            dax = tuple( a for a in range( self.data.ndim ) if a != d )
             mask = np.isfinite( np.mean( self.data, axis=dax ) )
-
-            self.labels[d]   = [ l for l,y in zip( self.labels[d], mask) if y ]
-            self.entities[d] = [ l for l,y in zip( self.entities[d], mask) if y ]
-            self.scales[d]   = [ l for l,y in zip( self.scales[d], mask) if y ]
-            self.classes[d]  = [ l for l,y in zip( self.classes[d], mask) if y ]
-
-            if d == 0:
-                self.data = self.data[ mask,: ]            
-            if d == 1:
-                self.data = self.data[ :,mask ]            
-
-        print(self.labels)
+            self.select( d, mask )
                     
     # JSON
     
@@ -980,61 +1581,126 @@ class DataSet( QObject ):
 
     #return o   
     
-    def annotations_to_XML(self, et, obj, anno):
-        # Labels (all axes)
-        objset = et.SubElement(root, anno[0])
-        for os in self.labels:
-            objs = et.SubElement(objset, anno[1])
-            for o in os:
-                obj = et.SubElement(objs, anno[2])
-                obj.set('type', type(o).__name__)
-                obj.text = str(o) 
-        return objset
-        
-    def annotations_from_XML(self, et, obj):
-        pass
-    
-    def to_XML(self):
-        
-        root = et.Element("DataSet")
-        root.set('xmlns', "http://pathomx.org/schema/DataSet/2013a")
-        
-        manager = et.SubElement(root, "Manager")
-        manager.set('id', self.manager.id)
-        manager.set('interface', self.manager_interface)
-        
-        name = et.SubElement(root, "Name")
-        name.text = self.name
+    # Hex digest identifying the content of this dataset (data and annotations); used to tell whether
+    # a tool's inputs have changed. Hashing the data is the expensive part, so its digest is kept
+    # while the data is a read-only array (outputs and the views handed to consumers), as that can't
+    # be written through, and shared with views of it. Assigning a new data array invalidates it.
+    def content_hash(self):
+        annotations = [
+            [l.tolist() for l in self.labels],
+            [s.tolist() for s in self.scales],
+            [c.tolist() for c in self.classes],
+            [[getattr(e, 'id', e) for e in es] for es in self.entities],
+        ]
+        h = hashlib.sha1(self._data_digest().encode('ascii'))
+        h.update(json.dumps(annotations, default=str).encode('utf-8'))
+        return h.hexdigest()
+
+    def _data_digest(self):
+        cell = self._data_hash if self._data_hash and self._data_hash.holds(self.data) else None
+        if cell and cell.digest:
+            return cell.digest
+
+        h = hashlib.sha1(('%s %s' % (self.data.dtype.str, self.data.shape)).encode('ascii'))
+        for s in chunks(self.data):
+            h.update(np.ascontiguousarray(self.data[s]).data)
+        digest = h.hexdigest()
+        if cell:
+            cell.digest = digest
+        elif not self.data.flags.writeable:
+            self._data_hash = DataDigest(self.data, digest)
+        return digest
+
+    # Binary save/load
+    # A dataset is stored as an uncompressed NPZ archive (so np.load can also read it): the raw
+    # data buffer as data.npy, float scales and class codes as .npy members, and everything else
+    # (names, labels, class categories, entity ids, log and provenance) in dataset.json.
+    # Members are stored, not deflated, so the data can be memory-mapped straight out of the file.
+    def save(self, fn):
+        meta = {
+            'version': DATASET_FORMAT_VERSION,
+            'name': self.name,
+            'description': self.description,
+            'type': self.type,
+            'shape': list(self.data.shape),
+            'data_digest': self._data_digest(),
+            'labels': [l.tolist() for l in self.labels],
+            'entities': [[e.id if e is not None else None for e in es] for es in self.entities],
+            'scales': [],
+            'classes': [],
+            'log': self.log,
+            'metadata': self.metadata,
+            'provenance': {
+                'manager': self.manager.id if self.manager else None,
+                'interface': self.manager_interface,
+                'previously_managed_by': [m.id for m in self.previously_managed_by],
+            },
+        }
 
-        description = et.SubElement(root, "Description")
-        description.text = self.description
+        for scales, classes in zip(self.scales, self.classes):
+            meta['scales'].append(None if scales.values.dtype == np.float64 else scales.tolist())
+            meta['classes'].append(classes.categories)
+        meta = json.dumps(_json_encode(meta)) # Raises on values that can't be saved, before writing
+
+        # Written alongside and then moved into place; a dataset loaded (memory-mapped) from fn
+        # keeps reading the old file rather than one being rewritten under it
+        tmp_fn = fn + '.tmp'
+        with zipfile.ZipFile(tmp_fn, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for d, (scales, classes) in enumerate(zip(self.scales, self.classes)):
+                if scales.values.dtype == np.float64:
+                    _npz_write(zf, 'scales_%d' % d, scales.values)
+                _npz_write(zf, 'classes_%d' % d, classes.codes)
+
+            _npz_write(zf, 'data', self.data) # Streamed in buffer-sized blocks
+            zf.writestr('dataset.json', meta)
+
+        os.replace(tmp_fn, fn)
+
+    # Replace the contents of this dataset with one saved to fn. With mmap_mode (as for np.load)
+    # the data is memory-mapped from the file, so only the slices a consumer touches are read;
+    # mmap_mode=None reads it into memory. Entities are resolved by id through db.index if
+    # a database is given; otherwise they are left empty.
+    def load(self, fn, mmap_mode='r', db=None):
+        with zipfile.ZipFile(fn, 'r') as zf:
+            meta = json.loads(zf.read('dataset.json').decode('utf-8'), object_hook=_json_decode)
+            shape = meta['shape']
+
+            self.empty(size=[0] * len(shape))
+            self.name = meta['name']
+            self.description = meta['description']
+            self.type = meta['type']
+            self.log = meta['log']
+            self.metadata = meta['metadata']
+            self.metadata['provenance'] = meta['provenance'] # Where the saved dataset came from
+
+            for d, n in enumerate(shape):
+                self.labels[d] = meta['labels'][d]
+                if db is not None:
+                    self.entities[d] = [db.index.get(e) if e is not None else None for e in meta['entities'][d]]
+                else:
+                    self.entities[d] = np.full(n, None, dtype=object)
+
+                if meta['scales'][d] is None:
+                    self.scales[d] = _npz_read(zf, 'scales_%d' % d)
+                else:
+                    self.scales[d] = meta['scales'][d]
+
+                classes = CategoricalAnnotation()
+                classes.categories = [_hashable(c) for c in meta['classes'][d]]
+                classes.codes = _npz_read(zf, 'classes_%d' % d).astype(np.intp)
+                self.classes._take(d, classes)
+
+            self.axes = [None] * len(shape)
+
+            if mmap_mode is None:
+                self.data = _npz_read(zf, 'data')
+            else:
+                self.data = _npz_memmap(fn, zf, 'data', mode=mmap_mode)
 
-        type = et.SubElement(root, "Type")
-        type.text = self.type
-    
-        self.annotations_to_XML(root, self.labels,  ['LabelSet','Labels','Label'])
-        self.annotations_to_XML(root, self.scales,  ['ScaleSet','Scale','Point'])
-        self.annotations_to_XML(root, self.classes, ['ClassSet','Classes','Class'])
-        self.annotations_to_XML(root, self.scales,  ['EntitySet','Entities','Entity'])
-
-        log = et.SubElement(root, "Log")
-        for log_ in self.log:
-            li = et.SubElement(log,"Entry")
-            li.text = log_
-            
-        history = et.SubElement(root, "History")
-        for manager in self.previously_managed_by:
-            hi = et.SubElement(log,"Manager")
-            hi.set('id', manager.id)
-        
-        data = et.SubElement(root, "Data")
-        data.set("type", self.data.dtype.type.__name__)
-        data.text = '\n'.join(' '.join(str(cell) for cell in row) for row in self.data)
+            if not self.data.flags.writeable:
+                self._data_hash = DataDigest(self.data, meta['data_digest'])
 
-        tree = et.ElementTree(root)    
-    
-    def from_XML(self):
-        pass
+        return self
         
         
         
@@ -8,7 +8,11 @@ from __future__ import unicode_literals
 import os
 import sys
 import re
+import pickle
+import threading
 from .utils import UnicodeReader, UnicodeWriter
+from .synonyms import SynonymIndex
+from .graph import GraphIndex
 from collections import defaultdict
 
 from . import utils
@@ -16,6 +20,8 @@ import numpy as np
 
 from .translate import tr
 
+from PyQt5.QtCore import QStandardPaths
+
 try:
     from urllib.request import urlopen
     from urllib.parse import urlparse
@@ -36,6 +42,33 @@ REACTION_URL = 'pathomx://db/reaction/%s/view'
 PROTEIN_URL = 'pathomx://db/protein/%s/view'
 GENE_URL = 'pathomx://db/gene/%s/view'
 
+# Compiled database snapshot; bump the version when the loaders or object classes change
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SOURCES = ['pathways', 'compounds', 'genes', 'proteins', 'reactions', 'synonyms']
+
+
+class _SectionAttribute(object):
+    '''
+    Attribute that a database section adds to or fills in; the section is loaded on first
+    access (see databaseManager.require). Reads the instance __dict__ as a plain attribute would.
+    '''
+
+    def __init__(self, name, section):
+        self.name = name
+        self.section = section
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        obj.require(self.section)
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
 
 # Global Pathomx db object class to simplify object display, synonym referencing, etc.
 class _PathomxObject(object):
@@ -43,7 +76,7 @@ class _PathomxObject(object):
         return self.name
 
     def __repr__(self):
-        return self.__unicode__
+        return self.__unicode__()
 
     def __init__(self, **entries):
         object.__init__(self)
@@ -71,6 +104,17 @@ class _PathomxObject(object):
     def synonym_str(self):
         return ', '.join(self.synonyms)
 
+    # Cross-references add synonyms and database links; gibbs is from the thermodynamics section
+    synonyms = _SectionAttribute('synonyms', 'xrefs')
+    databases = _SectionAttribute('databases', 'xrefs')
+    gibbs = _SectionAttribute('gibbs', 'gibbs')
+
+    def require(self, section):
+        # Objects are linked to their database once it is built (see databaseManager.link_sections)
+        db = self.__dict__.get('_db')
+        if db is not None:
+            db.require(section)
+
 
 # Dummy wrapper classes for readability
 class Compound(_PathomxObject):
@@ -174,12 +218,103 @@ class ReactionIntermediate(_PathomxObject):
     name = 'n/a'
 
 
+def snapshot_file():
+    # In the user cache, kept between sessions; not under the application's own cache folder, as
+    # worker processes (see processes.py) have no application name set and share the snapshot
+    return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), 'Pathomx', 'database', 'snapshot.pickle')
+
+
+def source_stamp():
+    # Path, modification time and size of every file the snapshot is built from
+    stamp = []
+    for f in SNAPSHOT_SOURCES:
+        st = os.stat(os.path.join(utils.scriptdir, 'database', f))
+        stamp.append((f, st.st_mtime_ns, st.st_size))
+    return stamp
+
+
+def _shell(cls):
+    return cls.__new__(cls)
+
+
+class _SnapshotPickler(pickle.Pickler):
+    # Database objects are written as empty shells, with their attributes written after them
+    # all; objects link to each other so deeply that pickling them whole would overflow the stack
+    def reducer_override(self, obj):
+        if isinstance(obj, _PathomxObject):
+            return _shell, (type(obj), )
+        return NotImplemented
+
+
 class databaseManager():
+    '''
+    The core of the database (pathways, compounds, genes, proteins, reactions and their synonyms)
+    is loaded on creation. The sections after it are loaded on first access to what they add
+    (require), in order as each builds on those before: the graph index (see graph.py), additional
+    identities, cross-references (synonym and unification lookups, object synonyms and database
+    links), gibbs free energies and the synonym index for resolve_many. Call preload() on a worker thread to load them in
+    the background.
+    '''
+
+    # Attributes held in the snapshot
+    snapshot_attributes = ['synfwd', 'synrev', 'synrev_by_type', 'index', 'pathways', 'reactions', 'compounds', 'proteins', 'genes', 'unification']
+
+    # Loaded on demand by load_<section>, in this order
+    sections = ['graph', 'identities', 'xrefs', 'gibbs', 'synonym_index']
+    pending_sections = ()  # Nothing to load while the core is built
+
+    synfwd = _SectionAttribute('synfwd', 'xrefs')
+    synrev = _SectionAttribute('synrev', 'xrefs')
+    synrev_by_type = _SectionAttribute('synrev_by_type', 'xrefs')
+    unification = _SectionAttribute('unification', 'xrefs')
+    synonym_index = _SectionAttribute('synonym_index', 'synonym_index')
+    graph = _SectionAttribute('graph', 'graph')
 
     # compounds, reactions, pathways = dict()
-    def __init__(self):
-
-    # Initialise variables
+    def __init__(self, snapshot=True):
+        self.section_lock = threading.RLock()
+        self.loading_section = False
+
+        # The core is loaded from the compiled snapshot if it is up to date with the source
+        # files; otherwise built from them, and the snapshot rewritten for next time
+        if not (snapshot and self.load_snapshot()):
+            self.build()
+            if snapshot:
+                self.save_snapshot()
+
+        self.link_sections()
+
+    def link_sections(self):
+        for o in self.index.values():
+            o._db = self
+        self.pending_sections = list(self.sections)
+
+    def require(self, section):
+        '''
+        Load section, and any before it, if not loaded yet. Other threads wait for a load in
+        progress; from the loading thread (the loaders themselves) this returns at once.
+        '''
+        if section not in self.pending_sections:
+            return
+
+        with self.section_lock:
+            if self.loading_section:
+                return
+
+            self.loading_section = True
+            try:
+                while section in self.pending_sections:
+                    getattr(self, 'load_%s' % self.pending_sections[0])()
+                    del self.pending_sections[0]  # Only once loaded; see the check above
+            finally:
+                self.loading_section = False
+
+    def preload(self):
+        # Load all sections; for a worker thread
+        self.require(self.sections[-1])
+
+    def build(self):
+        # Initialise variables
         self.synfwd = defaultdict(set)  # ID -> Synonyms
         self.synrev = dict()  # Synonym -> ID
         self.synrev_by_type = defaultdict(dict)  # Synonym -> ID
@@ -207,13 +342,48 @@ class databaseManager():
 
         self.load_reactions()
 
-        # Load synonym interface for conversion and data-interpreting
+        # Load synonym interface for conversion and data-interpreting; identities, xrefs and
+        # additional chemical data (gibbs) are loaded on demand (see require)
         self.load_synonyms()
-        self.load_identities()
-        self.load_xrefs()
 
-        # Load additional chemical data
-        self.load_gibbs()
+    def load_snapshot(self, filename=None):
+        filename = filename or snapshot_file()
+        try:
+            stamp = source_stamp()
+            with open(filename, 'rb') as f:
+                header = pickle.load(f)
+                if header != {'version': SNAPSHOT_VERSION, 'sources': stamp}:
+                    return False
+
+                objects, states, attributes = pickle.load(f)
+
+        except Exception:
+            return False  # Missing, unreadable or from another Python; rebuilt
+
+        for o, state in zip(objects, states):
+            o.__dict__.update(state)
+        self.__dict__.update(attributes)
+        return True
+
+    def save_snapshot(self, filename=None):
+        filename = filename or snapshot_file()
+        # The core only; saved before the objects are linked to sections (see __init__)
+        objects = list(set(self.index.values()))
+        payload = (
+            objects,
+            [dict((k, v) for k, v in o.__dict__.items() if k != '_db') for o in objects],
+            dict((k, self.__dict__[k]) for k in self.snapshot_attributes),
+        )
+
+        try:
+            utils.mkdir_p(os.path.dirname(filename))
+            with open(filename + '.tmp', 'wb') as f:
+                pickle.dump({'version': SNAPSHOT_VERSION, 'sources': source_stamp()}, f, pickle.HIGHEST_PROTOCOL)
+                _SnapshotPickler(f, pickle.HIGHEST_PROTOCOL).dump(payload)
+            os.replace(filename + '.tmp', filename)  # Never leave a partly written snapshot
+
+        except (IOError, OSError) as e:
+            print("Could not write database snapshot: %s" % e)
 
     # Helper functions
     def get_via_unification(self, database, id):
@@ -229,6 +399,16 @@ class databaseManager():
         except:
             return None
 
+    def resolve_many(self, labels, type=None, fuzzy=True, limit=5, threshold=0.6):
+        # Ranked (entity, score) candidates for each label; see SynonymIndex.resolve_many
+        return self.synonym_index.resolve_many(labels, type, fuzzy, limit, threshold)
+
+    def load_graph(self):
+        self.graph = GraphIndex(self)
+
+    def load_synonym_index(self):
+        self.synonym_index = SynonymIndex(self.synrev, self.synrev_by_type)
+
     # Handler to load all identity files in /identities
     def load_identities(self):
         identities_files = os.listdir(os.path.join(utils.scriptdir, 'identities', 'synonyms'))
@@ -236,7 +416,7 @@ class databaseManager():
             print("Loading additional synonyms:")
             for filename in identities_files:
                 print("- %s" % filename)
-                reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'identities', 'synonyms', filename), 'rU'), delimiter=str(','), dialect='excel')
+                reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'identities', 'synonyms', filename), 'r'), delimiter=str(','), dialect='excel')
                 for id, identity in reader:
                     self.add_identity(id, identity)
             print("Done.")
@@ -247,7 +427,7 @@ class databaseManager():
             print("Loading additional xrefs:")
             for filename in identities_files:
                 print("- %s" % filename)
-                reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'identities', 'xrefs', filename), 'rU'), delimiter=str(','), dialect='excel')
+                reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'identities', 'xrefs', filename), 'r'), delimiter=str(','), dialect='excel')
                 for id, db, key in reader:
                     #self.add_xref(id, db, key)
                     self.add_db_synonyms(id, {db: key})  # Hack, fix this up
@@ -256,13 +436,16 @@ class databaseManager():
     # Synonym interface for compounds, reactions and pathways (shared namespace)
     # Can call with filename to load a specific synonym file, e.g. containing peak ids
     def load_synonyms(self, filename=os.path.join(utils.scriptdir, 'database/synonyms')):
-        reader = UnicodeReader(open(filename, 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(filename, 'r'), delimiter=str(','), dialect='excel')
         for id, name in reader:
             if id in self.synfwd:  # Protection 
                 self.add_synonym(id, name)
 
+        if 'synonym_index' in self.__dict__:
+            self.load_synonym_index()  # Built already; rebuild with the new synonyms
+
     def load_compounds(self):
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/compounds'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/compounds'), 'r'), delimiter=str(','), dialect='excel')
         for id, name, type, db_unification in reader:
             self.add_compound(id, {
                 'name': name,
@@ -271,7 +454,7 @@ class databaseManager():
                 })
 
     def load_reactions(self):
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/reactions'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/reactions'), 'r'), delimiter=str(','), dialect='excel')
         for id, name, origin, dest, smtins, smtouts, proteins, dir, pathways, db_unification in reader:
             self.add_reaction(id, {
                 'name': name,
@@ -288,7 +471,7 @@ class databaseManager():
             })
 
     def load_pathways(self):
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/pathways'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/pathways'), 'r'), delimiter=str(','), dialect='excel')
         for id, name, db_unification in reader:
             self.add_pathway(id, {
                 'name': name,
@@ -296,7 +479,7 @@ class databaseManager():
             })
 
     def load_proteins(self):
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/proteins'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/proteins'), 'r'), delimiter=str(','), dialect='excel')
         for id, name, genes, compartments, db_unification in reader:
             self.add_protein(id, {
                 'name': name,
@@ -306,7 +489,7 @@ class databaseManager():
                 })
 
     def load_genes(self):
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/genes'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/genes'), 'r'), delimiter=str(','), dialect='excel')
         for id, name, db_unification in reader:
             self.add_gene(id, {
                 'name': name,
@@ -318,7 +501,7 @@ class databaseManager():
         def sum_gibbs_in_outs(key, ins, outs):
             return sum([m.gibbs[key] for m in ins if hasattr(m, 'gibbs')]) - sum([m.gibbs[key] for m in outs if hasattr(m, 'gibbs')])
 
-        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/gibbs'), 'rU'), delimiter=str(','), dialect='excel')
+        reader = UnicodeReader(open(os.path.join(utils.scriptdir, 'database/gibbs'), 'r'), delimiter=str(','), dialect='excel')
 
         # Add reactions from each compound that we have gibbs data for
         gibbs_reactions = set()
@@ -12,6 +12,7 @@ from PyQt5.QtWebKitWidgets import *
 from PyQt5.QtPrintSupport import *
 
 TEXT_COLOR = "#000000"
+PROFILE_TEXT_COLOR = "#888888"
 SHADOW_COLOR = QColor(63, 63, 63, 180)
 BORDER_COLOR = "#888888"
 
@@ -150,6 +151,14 @@ class ToolItem(BaseItem):
 
         self.app.status.connect(self.updateTip)
 
+        # Timing of the latest generate call, above the icon
+        self.profileLabel = QGraphicsSimpleTextItem(parent=self)
+        self.profileLabel.setBrush(QBrush(QColor(PROFILE_TEXT_COLOR)))
+        font = self.profileLabel.font()
+        font.setPointSizeF(font.pointSizeF() * 0.8)
+        self.profileLabel.setFont(font)
+        self.app.profiled.connect(self.updateProfile)
+
         if position:
             self.setPos(position)
 
@@ -160,11 +169,20 @@ class ToolItem(BaseItem):
         else:
             return "Untitled"
 
-    def updateTip(self, status):
+    def updateTip(self, status=None):
+        tips = []
         if status == 'error':
-            self.setToolTip('Error: %s' % self.app._latest_exception)
-        else:
-            self.setToolTip('')
+            tips.append('Error: %s' % self.app._latest_exception)
+        for kind in ['load', 'generate', 'prerender']:
+            if kind in self.app.profile:
+                tips.append(self.app.profile[kind].description())
+        self.setToolTip('\n\n'.join(tips))
+
+    def updateProfile(self, record):
+        if record.kind != 'prerender':
+            self.profileLabel.setText(record.label())
+            self.profileLabel.setPos(32 - self.profileLabel.boundingRect().width() / 2, -self.profileLabel.boundingRect().height())
+        self.updateTip(self.progressBar.status)
 
     def getName(self):
         if self.label.toPlainText() != self.name:  # Prevent infinite loop get/set
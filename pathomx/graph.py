@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+'''
+Sparse graph index over the pathway database.
+
+Each object type (compound, reaction, pathway, protein, gene) has its objects numbered
+in database order, and the links between them are held as sparse incidence matrices
+(scipy.sparse CSR; rows of the first type, columns of the second):
+
+    ('compound', 'reaction')   main substrates and products (mtins, mtouts)
+    ('substrate', 'reaction')  main substrates (mtins); compounds as rows
+    ('product', 'reaction')    main products (mtouts); compounds as rows
+    ('secondary_substrate', 'reaction'), ('secondary_product', 'reaction')
+                               secondary compounds (smtins, smtouts); compounds as rows
+    ('reaction', 'pathway')
+    ('protein', 'reaction')
+    ('protein', 'gene')
+
+Links between types not listed are made by multiplying through, e.g. compound x pathway
+is compound x reaction x pathway, and are cached. Neighbourhood and overlap queries are
+then sparse matrix products rather than loops over the database objects.
+
+Lookup tables derived from the index (e.g. a plugin's reaction patterns) can be kept with
+it by table(); they are built once per database load, as the index is.
+'''
+from __future__ import unicode_literals
+
+import numpy as np
+import scipy.sparse as sp
+
+TYPES = ['compound', 'reaction', 'pathway', 'protein', 'gene']
+
+# Row types that are compounds with a particular role
+ROLES = {
+    'substrate': 'compound',
+    'product': 'compound',
+    'secondary_substrate': 'compound',
+    'secondary_product': 'compound',
+}
+
+# Derived links, as the chain of stored links to multiply through
+DERIVED = {
+    ('compound', 'pathway'): [('compound', 'reaction'), ('reaction', 'pathway')],
+    ('protein', 'pathway'): [('protein', 'reaction'), ('reaction', 'pathway')],
+    ('gene', 'reaction'): [('gene', 'protein'), ('protein', 'reaction')],
+    ('gene', 'pathway'): [('gene', 'reaction'), ('reaction', 'pathway')],
+}
+
+
+def binary(m):
+    # Links present as 1, however many paths make them
+    m = m.tocsr(copy=True)
+    m.eliminate_zeros()
+    m.data[:] = 1
+    return m
+
+
+class GraphIndex(object):
+    '''
+    Integer ids and incidence matrices for a database (see module docstring).
+    '''
+
+    def __init__(self, db):
+        self.objects = {
+            'compound': list(db.compounds.values()),
+            'reaction': list(db.reactions.values()),
+            'pathway': list(db.pathways.values()),
+            'protein': list(db.proteins.values()),
+            'gene': list(db.genes.values()),
+        }
+        self.index = dict((t, dict((o.id, n) for n, o in enumerate(objs))) for t, objs in self.objects.items())
+
+        reactions = self.objects['reaction']
+        self.links = {
+            ('substrate', 'reaction'): self.build('compound', 'reaction', [r.mtins for r in reactions]),
+            ('product', 'reaction'): self.build('compound', 'reaction', [r.mtouts for r in reactions]),
+            ('secondary_substrate', 'reaction'): self.build('compound', 'reaction', [r.smtins for r in reactions]),
+            ('secondary_product', 'reaction'): self.build('compound', 'reaction', [r.smtouts for r in reactions]),
+            ('reaction', 'pathway'): self.build('pathway', 'reaction', [r.pathways for r in reactions]).T.tocsr(),
+            ('protein', 'reaction'): self.build('protein', 'reaction', [r.proteins for r in reactions]),
+            ('protein', 'gene'): self.build('gene', 'protein', [p.genes for p in self.objects['protein']]).T.tocsr(),
+        }
+        self.links[('compound', 'reaction')] = binary(self.links[('substrate', 'reaction')] + self.links[('product', 'reaction')])
+        self.tables = {}
+
+    def build(self, row_type, col_type, linked):
+        # row_type x col_type incidence, from the row_type objects linked to each col_type object
+        index = self.index[row_type]
+        rows, cols = [], []
+        for n, objs in enumerate(linked):
+            for o in objs:
+                i = index.get(getattr(o, 'id', None))
+                if i is not None:
+                    rows.append(i)
+                    cols.append(n)
+        shape = (len(self.objects[row_type]), len(self.objects[col_type]))
+        return binary(sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape))
+
+    def incidence(self, row_type, col_type):
+        '''
+        row_type x col_type incidence matrix (CSR, int32 0/1).
+        '''
+        key = (row_type, col_type)
+        if key not in self.links:
+            if (col_type, row_type) in self.links or (col_type, row_type) in DERIVED:
+                m = self.incidence(col_type, row_type).T
+            elif key in DERIVED:
+                m = self.incidence(*DERIVED[key][0])
+                for link in DERIVED[key][1:]:
+                    m = m * self.incidence(*link)
+            else:
+                raise KeyError("No links between %s and %s" % key)
+            self.links[key] = binary(m)
+        return self.links[key]
+
+    def positions(self, type, objs):
+        '''
+        Positions of objs (objects or ids) in the type's numbering; those not in the database are left out.
+        '''
+        index = self.index[ROLES.get(type, type)]
+        ids = (getattr(o, 'id', o) for o in objs)
+        return np.array([index[i] for i in ids if i in index], dtype=np.intp)
+
+    def vector(self, type, values):
+        '''
+        Dense vector over the type's objects from a dict of id: value; others are 0.
+        '''
+        index = self.index[ROLES.get(type, type)]
+        v = np.zeros(len(index))
+        for k, x in values.items():
+            n = index.get(k)
+            if n is not None:
+                v[n] = x
+        return v
+
+    def table(self, key, build):
+        '''
+        Table derived from the index by build(index), built on first use and kept under key.
+        '''
+        if key not in self.tables:
+            self.tables[key] = build(self)
+        return self.tables[key]
+
+    def select(self, type, positions):
+        objs = self.objects[ROLES.get(type, type)]
+        return [objs[n] for n in positions]
+
+    def linked(self, objs, from_type, to_type):
+        '''
+        to_type objects linked to any of objs (from_type), in database order.
+        '''
+        m = self.incidence(from_type, to_type)
+        hit = np.asarray(m[self.positions(from_type, objs)].sum(axis=0)).ravel() > 0
+        return self.select(to_type, np.flatnonzero(hit))
+
+    def overlap(self, type, via):
+        '''
+        type x type counts of the via objects each pair shares (the diagonal counts each one's own).
+        '''
+        key = ('overlap', type, via)
+        if key not in self.links:
+            m = self.incidence(type, via)
+            self.links[key] = (m * m.T).tocsr()
+        return self.links[key]
+
+    def adjacency(self, type, via):
+        '''
+        type x type adjacency: 1 where two objects share any via object (e.g. compounds in a reaction).
+        '''
+        key = ('adjacency', type, via)
+        if key not in self.links:
+            m = self.overlap(type, via).tolil()
+            m.setdiag(0)
+            self.links[key] = binary(m)
+        return self.links[key]
+
+    def neighbours(self, objs, type, via, hops=1):
+        '''
+        type objects within hops steps of objs through shared via objects, excluding objs themselves.
+        '''
+        start = self.positions(type, objs)
+        reached = np.zeros(len(self.objects[type]), dtype=bool)
+        reached[start] = True
+        frontier = reached.copy()
+        adjacency = self.adjacency(type, via)
+        for n in range(hops):
+            frontier = (adjacency * frontier.astype(np.int32) > 0) & ~reached
+            reached |= frontier
+        reached[start] = False
+        return self.select(type, np.flatnonzero(reached))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+Re-use of laid out (graphviz) maps, for maps that differ from one laid out before only in
+their colours, e.g. when the data shown on them changes.
+
+A map is described by its elements (graph attributes, clusters, nodes and edges with their
+graphviz attributes). layout_signature is everything about the elements that affects their
+layout; maps with the same signature have the same layout, so the SVG rendered for one can be
+re-coloured with the styles of another by restyle_svg, without running the layout again.
+'''
+from __future__ import unicode_literals
+
+import re
+import xml.etree.ElementTree as ET
+
+
+# Attributes that only colour the map; all others place or size its elements (see layout_signature)
+COLOUR_ATTRIBUTES = ['color', 'fillcolor', 'fontcolor', 'colorscheme', 'image']
+SHAPE_SYNONYMS = {'box': 'rect'}
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+ET.register_namespace('', SVG_NS)
+ET.register_namespace('xlink', XLINK_NS)
+
+_font_color = re.compile(r'<font color="([^"]*)">(.*?)</font>')
+
+
+def layout_key(pathways, options, layout=None):
+    # Cache key of a map's layout: the pathways shown, options and layout hints (fixed positions)
+    hints = tuple(sorted(layout.objects.items())) if layout else None
+    return (tuple(p.id for p in pathways), tuple(sorted(vars(options).items())), hints)
+
+
+def edge_colors(color):
+    # Colours of an edge, drawn as parallel lines
+    return color.strip('"').split(':')
+
+
+def label_colors(label, fontcolor):
+    # Colour of each text run of an HTML label, as graphviz renders them (one SVG text each)
+    colors = []
+    for line in label[1:-1].split('<br />'):
+        n = 0
+        for m in _font_color.finditer(line):
+            if line[n:m.start()]:
+                colors.append(fontcolor)
+            if m.group(2):
+                colors.append(m.group(1))
+            n = m.end()
+        if line[n:]:
+            colors.append(fontcolor)
+    return colors
+
+
+def layout_signature(elements):
+    '''
+    Everything about the map elements that affects their layout, i.e. all but their colours;
+    maps with the same signature have the same layout and differ only in style.
+    '''
+    nodes = []
+    for id, attributes in elements['nodes']:
+        a = dict((k, v) for k, v in attributes.items() if k not in COLOUR_ATTRIBUTES)
+        a['shape'] = SHAPE_SYNONYMS.get(a['shape'], a['shape'])
+        a['image'] = 'image' in attributes
+        nodes.append((id, tuple(sorted(a.items()))))
+
+    edges = []
+    for origin, dest, attributes in elements['edges']:
+        a = dict((k, v) for k, v in attributes.items() if k not in COLOUR_ATTRIBUTES)
+        a['color'] = len(edge_colors(attributes['color']))
+        a['label'] = _font_color.sub(r'<font>\2</font>', attributes['label'])
+        edges.append((origin, dest, tuple(sorted(a.items()))))
+
+    clusters = [(name, tuple(sorted(a.items())), tuple(node_ids)) for name, a, node_ids in elements['clusters']]
+    return (tuple(sorted(elements['graph'].items())), tuple(clusters), tuple(nodes), tuple(edges))
+
+
+def restyle_svg(svg, elements):
+    '''
+    Re-colour a map rendered by graphviz (SVG) with the styles of elements, of the same layout
+    signature. Returns None if the SVG doesn't match up with the elements.
+    '''
+    root = ET.fromstring(svg)
+    groups = dict((g.get('id'), g) for g in root.iter('{%s}g' % SVG_NS) if g.get('class') in ('node', 'edge'))
+
+    for id, attributes in elements['nodes']:
+        g = groups.get(attributes['id'])
+        if g is None:
+            return None
+
+        for e in g.iter():
+            tag = e.tag.split('}')[-1]
+            if tag in ('polygon', 'ellipse', 'path', 'polyline'):
+                if e.get('fill') not in (None, 'none'):
+                    e.set('fill', attributes['fillcolor'])
+                e.set('stroke', attributes['color'])
+            elif tag == 'text':
+                e.set('fill', attributes['fontcolor'])
+            elif tag == 'image' and 'image' in attributes:
+                e.set('{%s}href' % XLINK_NS, attributes['image'])
+
+    for origin, dest, attributes in elements['edges']:
+        g = groups.get(attributes['id'])
+        if g is None:
+            return None
+        if attributes['style'] == 'invis':
+            continue
+
+        colors = edge_colors(attributes['color'])
+        lines = [e for e in g.iter('{%s}path' % SVG_NS)]
+        texts = [e for e in g.iter('{%s}text' % SVG_NS)]
+        labels = label_colors(attributes['label'], attributes['fontcolor'])
+        if len(lines) != len(colors) or len(texts) != len(labels):
+            return None
+
+        for e, color in zip(lines, colors):
+            e.set('stroke', color)
+        for e in g.iter('{%s}polygon' % SVG_NS):  # Arrows
+            if e.get('fill') not in (None, 'none'):
+                e.set('fill', colors[0])
+            e.set('stroke', colors[0])
+        for e, color in zip(texts, labels):
+            e.set('fill', color)
+
+    return ET.tostring(root, encoding='unicode')
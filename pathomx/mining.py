@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''
+Pathway mining: scoring of pathways by the data of their compounds, genes and proteins.
+
+An entity's score is added to each of its pathways (optionally shared between them), as
+sparse entity x pathway matrix products over the database's graph index (pathomx.graph).
+Scores may first spread to neighbours through shared reactions (diffuse), and permutation
+p-values are given by scoring batches of the data shuffled between the measured entities.
+'''
+from __future__ import unicode_literals
+
+import numpy as np
+import scipy.sparse as sp
+
+from . import threads
+
+
+MINING_TYPE_CODE = ('c', 'u', 'd', 'm', 't')
+MINING_TYPES = {
+    'c': 'Compound change scores for pathway',
+    'u': 'Compound up-regulation scores for pathway',
+    'd': 'Compound down-regulation scores for pathway',
+    'm': 'Number compounds with data per pathway',
+    't': 'Pathway overall tendency',
+}
+
+# Entity score to add to its pathways, by mining type
+MINING_VALUES = {
+    'c': np.abs,
+    'u': lambda s: np.maximum(0, s),
+    'd': lambda s: np.abs(np.minimum(0, s)),
+    'm': np.ones_like,
+    't': lambda s: s,
+}
+
+MINING_ENTITY_TYPES = ['compound', 'gene', 'protein']
+
+PERMUTATION_BATCH = 256  # Permutations scored per matrix product
+
+
+def measured_values(graph, inputs, mining_type='c'):
+    '''
+    (type, positions, mining values) of the measured entities of each type, for each input
+    DataSet (values from the first row of data).
+    '''
+    mining_value = MINING_VALUES[mining_type]
+
+    measured = []
+    for dsi in inputs:
+        entities = list(dsi.entities[1])
+        values = mining_value(np.asarray(dsi.data[0], dtype=float))
+        for t in MINING_ENTITY_TYPES:
+            index = graph.index[t]
+            cols = [n for n, e in enumerate(entities) if getattr(e, 'type', None) == t and e.id in index]
+            if cols:
+                measured.append((t, graph.positions(t, [entities[n] for n in cols]), values[cols]))
+    return measured
+
+
+def diffuse(graph, type, x, hops=0, decay=0.5):
+    '''
+    Spread entity scores (rows of x) to neighbours through shared reactions: each of hops
+    passes on decay times the mean score of an entity's neighbours.
+    '''
+    if not hops:
+        return x
+
+    adjacency = graph.adjacency(type, 'reaction')
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    mean = sp.diags(1. / np.maximum(degree, 1)) * adjacency
+
+    total = step = x
+    for n in range(hops):
+        step = decay * (mean * step)
+        total = total + step
+    return total
+
+
+def pathway_scores(graph, measured, values, mining_type='c', shared=True, relative=False, hops=0, decay=0.5):
+    '''
+    Pathway x column scores, for columns of values (one array per block of measured
+    entities; e.g. the observed values, or a batch of permutations of them).
+    '''
+    columns = values[0].shape[1]
+
+    scores = np.zeros((len(graph.objects['pathway']), columns))
+    for t in MINING_ENTITY_TYPES:
+        blocks = [(pos, v) for (tt, pos, x), v in zip(measured, values) if tt == t]
+        if not blocks:
+            continue
+
+        x = np.zeros((len(graph.objects[t]), columns))
+        for pos, v in blocks:
+            np.add.at(x, pos, v)  # Entities measured more than once count each time
+
+        x = diffuse(graph, t, x, hops, decay)
+
+        incidence = graph.incidence(t, 'pathway')
+        if shared and mining_type != 'm':
+            # Share the change score between the associated pathways
+            # this prevents compounds having undue influence (counts are whole)
+            n_pathways = np.asarray(incidence.sum(axis=1)).ravel()
+            x = x / np.maximum(n_pathways, 1)[:, None]
+
+        scores += incidence.T * x
+
+    # If we're using tendency scaling; abs the scores here
+    if mining_type == 't':
+        scores = np.abs(scores)
+
+    if relative:
+        # Scale pathway scores to pathway sizes
+        n_reactions = np.asarray(graph.incidence('reaction', 'pathway').sum(axis=0)).ravel()
+        scores = scores / np.maximum(n_reactions, 1)[:, None]
+
+    return scores
+
+
+def permutation_pvalues(graph, measured, scores, permutations, seed=0, **options):
+    '''
+    Permutation p-values of the pathway scores: how often scores of the data shuffled
+    between the measured entities (of each type, within each input) reach the observed.
+    options are passed on to pathway_scores.
+    '''
+    rng = np.random.RandomState(seed)  # Same p-values for the same data
+    exceed = np.zeros(len(scores))
+    for s in range(0, permutations, PERMUTATION_BATCH):
+        threads.checkpoint()
+        n = min(PERMUTATION_BATCH, permutations - s)
+        shuffled = [v[np.argsort(rng.rand(len(v), n), axis=0)] for t, pos, v in measured]
+        exceed += (pathway_scores(graph, measured, shuffled, **options) >= scores[:, None] * (1 - 1e-9)).sum(axis=1)
+    return (exceed + 1) / (permutations + 1)
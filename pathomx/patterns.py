@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+Reaction-pattern tables for the heatmap's pre-defined views: rows of compound ids, such
+as the main compound pairs of redox or phosphorylation reactions, or metabolic endpoints.
+
+The reaction patterns are whole-database queries on the graph index (pathomx.graph); the
+carrier balance of every reaction is one sparse incidence product, rather than a scan of
+db.reactions. predefined_tables builds them all, to be kept with the index by
+GraphIndex.table.
+'''
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+NUCLEOSIDES = [
+    ['AMP', 'ADP', 'ATP'],
+    ['CMP', 'CDP', 'CTP'],
+    ['GMP', 'GDP', 'GTP'],
+    ['UMP', 'UDP', 'UTP'],
+    ['TMP', 'TDP', 'TTP'],
+    #---
+    ['DAMP', 'DADP', 'DATP'],
+    ['DCMP', 'DCDP', 'DCTP'],
+    ['DGMP', 'DGDP', 'DGTP'],
+    ['DUMP', 'DUDP', 'DUTP'],
+    ['DTMP', 'DTDP', 'DTTP'],
+    #---
+    ['Pi', 'PPI', 'PI3', 'PI4'],
+    #---
+    ['NAD', 'NADP'],
+    ['NADH', 'NADPH'],
+]
+
+PROTON = [
+    ['NAD', 'NADH'],
+    ['NADP', 'NADPH'],
+    ['FAD', 'FADH', 'FADH2'],
+]
+
+PROTON_CARRIERS = {'WATER': 1, 'PROTON': 1, 'NADH': 1, 'NADPH': 1, 'FADH': 1, 'FADH2': 2}  # Double count for H2
+
+PHOSPHATE_CARRIERS = {
+    'AMP': 1, 'ADP': 2, 'ATP': 3,
+    'GMP': 1, 'GDP': 2, 'GTP': 4,
+    #---
+    'Pi': 1, 'PPI': 2, 'PI3': 3, 'PI4': 4,
+    #---
+    'NADP': 1, 'NADPH': 1,
+    }
+
+# Standard energy sources (CHO)
+ENERGY = ['GLC', 'GLN',
+# Standard energy modulators (co-factors, carriers, etc.)
+          'CARNITINE',
+# Standard waste metabolites
+          'L-LACTATE', ]
+
+
+def reaction_pairs(graph, forward, reverse):
+    # [in, out] main compound ids of the forward reactions, and [out, in] of the reverse, in database order
+    result = []
+    for n in np.flatnonzero(forward | reverse):
+        r = graph.objects['reaction'][n]
+        ins, outs = (r.mtins, r.mtouts) if forward[n] else (r.mtouts, r.mtins)
+        result.extend([mtin.id, mtout.id] for mtin in ins for mtout in outs)
+    return result
+
+
+def equilibrium_table(graph, carriers):
+    # Main compound pairs of reactions moving carriers (id: count) from their substrates to products
+    # or back, e.g. reductions with the proton carriers; balance of each reaction in one product
+    v = graph.vector('compound', carriers)
+    balance = graph.incidence('secondary_substrate', 'reaction').T * v - graph.incidence('secondary_product', 'reaction').T * v
+    return reaction_pairs(graph, balance > 0, balance < 0)
+
+
+def cofactor_table(graph, pairs):
+    # Main compound pairs of reactions converting cofactor [in, out] pairs (secondary compounds)
+    smtins = graph.incidence('secondary_substrate', 'reaction')
+    smtouts = graph.incidence('secondary_product', 'reaction')
+    result = []
+    for p in pairs:
+        pin, pout = graph.positions('compound', p[:1]), graph.positions('compound', p[1:2])
+        if len(pin) and len(pout):
+            forward = smtins[pin].toarray().ravel() & smtouts[pout].toarray().ravel() > 0
+            reverse = smtins[pout].toarray().ravel() & smtouts[pin].toarray().ravel() > 0
+            result.extend(reaction_pairs(graph, forward, reverse))
+    return result
+
+
+def endpoint_table(graph):
+    # Metabolic endpoints, i.e. compounds not at the 'in' point of any reactions (or in a bidirectional)
+    both = np.array([r.dir == 'both' for r in graph.objects['reaction']], dtype=np.int32)
+    ins = graph.incidence('substrate', 'reaction') * np.ones(len(both), dtype=np.int32)
+    ins += graph.incidence('compound', 'reaction') * both
+    return [m.id for m, n in zip(graph.objects['compound'], ins) if m.type == 'compound' and n == 0]
+
+
+def flattened_entities(db, table):
+    o = []
+    [o.extend(i) for i in table]
+
+    return [db.index[i] for i in o if i in db.index]
+
+
+def predefined_tables(db, graph):
+    '''
+    Tables of the pre-defined views, as view: (rows of compound ids, entities to show). The
+    reaction patterns (redox, phosphorylation, endpoints) come from whole-database queries on
+    the graph index, so are built once per database load and kept with it (GraphIndex.table).
+    '''
+    tables = {
+        'nucleosides': NUCLEOSIDES,
+        'proton': PROTON,
+        'energy': ENERGY,
+        'endpoints': endpoint_table(graph),
+        # Build redox reaction table
+        # Reactions with proton carriers in left/right reaction (PROTON, NAD->NADH, ...)
+        # If on left, swap; store entry for Min,Mout
+        'redox': equilibrium_table(graph, PROTON_CARRIERS),
+        'phosphate': equilibrium_table(graph, PHOSPHATE_CARRIERS),
+    }
+    return dict((k, (t, flattened_entities(db, t))) for k, t in tables.items())
@@ -438,11 +438,15 @@ class BasePlugin(IPlugin):
                 menuAction.triggered.connect(entry['action'])
                 self.m.menuBars[menu].addAction(menuAction)
 
+    def cache_path(self):
+        # Per-plugin folder in the user cache; kept between sessions
+        return os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], self.id)
+
     def generate_cache_key(self, o):
         return 'cache-' + hashlib.sha224(str(o)).hexdigest()
 
     def get_cache_item(self, key):
-        path = os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], self.id)
+        path = self.cache_path()
         hash = self.generate_cache_key(key)
         try:
             with open(os.path.join(path, hash), 'r') as f:
@@ -451,7 +455,7 @@ class BasePlugin(IPlugin):
             return None
 
     def put_cache_item(self, key, value):
-        path = os.path.join(QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0], self.id)
+        path = self.cache_path()
         hash = self.generate_cache_key(key)
         utils.mkdir_p(path)
         with open(os.path.join(path, hash), 'w') as f:
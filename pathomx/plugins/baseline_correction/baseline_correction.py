@@ -143,6 +143,8 @@ class BaselineCorrectionConfigPanel(ui.ConfigPanel):
 
 
 class BaselineCorrectionTool(ui.DataApp):
+    cache_results = True
+    generate_in_process = True  # CPU-bound Python loops; run clear of the GIL
 
     def __init__(self, **kwargs):
         super(BaselineCorrectionTool, self).__init__(**kwargs)
@@ -199,6 +201,7 @@ class BaselineCorrectionTool(ui.DataApp):
     def baseline_correct(self, dsi):
         # Get the target region from the spectra (will be using this for all calculations;
         # then applying the result to the original data)
+        dsi = dsi.as_copy()  # Corrected in place below; the input data is read-only
         scale = dsi.scales[1]
 
         algorithm = self.config.get('algorithm')
@@ -216,6 +219,7 @@ class BaselineCorrectionTool(ui.DataApp):
         cbf_explicit_end = self.config.get('cbf_explicit_start')
 
         for n, dr in enumerate(dsi.data):
+            self.checkpoint()
 
             if algorithm == 'median':
                 dr = ng.process.proc_bl.med(dr, mw=med_mw, sf=med_sf, sigma=med_sigma)
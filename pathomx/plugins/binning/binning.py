@@ -17,10 +17,10 @@ import numpy as np
 import pathomx.ui as ui
 import pathomx.db as db
 import pathomx.utils as utils
-import pathomx.threads as threads
 
 from pathomx.plugins import ProcessingPlugin
-from pathomx.data import DataSet, DataDefinition
+from pathomx.data import DataSet, DataDefinition, chunks
+from pathomx.spectra import bin_index, bin_spectra, uniform_bin_edges, parse_bin_edges, intelligent_bin_index
 from pathomx.views import D3SpectraView, D3DifferenceView, MplSpectraView, MplDifferenceView
 
 
@@ -30,6 +30,19 @@ class BinningConfigPanel(ui.ConfigPanel):
     def __init__(self, *args, **kwargs):
         super(BinningConfigPanel, self).__init__(*args, **kwargs)
 
+        self.mode = {
+            'Fixed width': 'uniform',
+            'Bin edges': 'edges',
+            'Intelligent': 'intelligent',
+        }
+
+        self.mode_cb = QComboBox()
+        self.mode_cb.addItems([k for k, v in list(self.mode.items())])
+        tl = QLabel(self.tr('Binning'))
+        self.layout.addWidget(tl)
+        self.layout.addWidget(self.mode_cb)
+        self.config.add_handler('bin_mode', self.mode_cb, self.mode)
+
         self.binsize_spin = QDoubleSpinBox()
         self.binsize_spin.setDecimals(3)
         self.binsize_spin.setRange(0.001, 0.5)
@@ -50,10 +63,30 @@ class BinningConfigPanel(ui.ConfigPanel):
         self.layout.addWidget(self.binoffset_spin)
         self.config.add_handler('bin_offset', self.binoffset_spin)
 
+        self.binedges_text = QPlainTextEdit()
+        self.binedges_text.setMaximumHeight(60)
+        tl = QLabel(self.tr('Bin edges (ppm)'))
+        self.layout.addWidget(tl)
+        self.layout.addWidget(self.binedges_text)
+        self.config.add_handler('bin_edges', self.binedges_text)
+
+        self.resolution_spin = QDoubleSpinBox()
+        self.resolution_spin.setDecimals(4)
+        self.resolution_spin.setRange(0.0001, 0.5)
+        self.resolution_spin.setSuffix('ppm')
+        self.resolution_spin.setSingleStep(0.001)
+        tl = QLabel(self.tr('Intelligent bin resolution'))
+        self.layout.addWidget(tl)
+        self.layout.addWidget(self.resolution_spin)
+        self.config.add_handler('bin_resolution', self.resolution_spin)
+
         self.finalise()
 
 
 class BinningApp(ui.DataApp):
+    supports_append = True  # New spectra are binned with the bins of the earlier ones
+    cache_results = True
+
     def __init__(self, **kwargs):
         super(BinningApp, self).__init__(**kwargs)
 
@@ -79,60 +112,99 @@ class BinningApp(ui.DataApp):
         )
 
         self.config.set_defaults({
+            'bin_mode': 'uniform',
             'bin_size': 0.01,
             'bin_offset': 0,
+            'bin_edges': '',
+            'bin_resolution': 0.005,
         })
 
         self.addConfigPanel(BinningConfigPanel, 'Settings')
 
         self.finalise()
 
-    def generate(self, input=None):
-        return {'output': self.binning(dsi=input), 'input': input}
-
     def prerender(self, output=None, input=None):
         return {
             'View': {'dso': output},
             'Difference': {'dso_a': input, 'dso_b': output}
             }
 
+    def bins(self, dsi):
+        '''
+        Bin index of each point of the spectra, number of bins and the scale of the bins;
+        None if there would be as many bins as points.
+        '''
+        scale = np.asarray(dsi.scales[1], dtype=float)
+        mode = self.config.get('bin_mode')
+
+        if mode == 'intelligent':
+            # Bins from the mean spectrum; each bin is placed at the mean ppm of its points
+            ref = np.concatenate([np.sum(dsi.data[s], axis=0) for s in chunks(dsi.data, axis=1)]) / dsi.data.shape[0]
+            idx, number_of_bins = intelligent_bin_index(ref, scale, self.config.get('bin_resolution'))
+            return idx, number_of_bins, bin_spectra(scale.reshape(1, -1), idx, number_of_bins)[0]
+
+        if mode == 'edges':
+            edges = parse_bin_edges(self.config.get('bin_edges'))
+        else:
+            edges = uniform_bin_edges(scale, self.config.get('bin_size'), self.config.get('bin_offset'))
+
+        # Can't increase the size of data
+        if len(edges) < 2 or len(edges) - 1 >= len(scale):
+            return None
+
+        return bin_index(scale, edges), len(edges) - 1, edges[:-1]  # Bins are placed at their start
+
+    def bin_rows(self, dsi, idx, number_of_bins, rows=slice(None)):
+        # DataSet of the given rows of dsi, binned
+        data = dsi.data[rows]
+        dso = DataSet(size=(data.shape[0], number_of_bins))
+        dso.name = dsi.name
+        dso.description = dsi.description
+        dso.type = dsi.type
+        dso.labels[0] = dsi.labels[0][rows]
+        dso.classes[0] = dsi.classes[0][rows]
+        dso.entities[0] = dsi.entities[0][rows]
+        dso.scales[0] = dsi.scales[0][rows]
+
+        bin_spectra(data, idx, number_of_bins, out=dso.data)
+        return dso
+
     def generate(self, input=None):
         dsi = input
-        ###### BINNING USING CONFI
-        # Generate bin values for range start_scale to end_scale
-        # Calculate the number of bins at binsize across range
-        dso = DataSet()
-        dso.import_data(dsi)
-
-        r = dsi.scales_r[1]
-        self._bin_size, self._bin_offset = self.config.get('bin_size'), self.config.get('bin_offset')
-
-        bins = np.arange(r[0] + self._bin_offset, r[1] + self._bin_offset, self._bin_size)
-        number_of_bins = len(bins) - 1
-
-        # Can't increase the size of data, if bins > current size return the original
-        if number_of_bins >= len(dso.scales[1]):
-            return {'dso': dso}
+        bins = self.bins(dsi)
+        if bins is None:
+            return {'output': dsi, 'input': input}  # If bins > current size return the original
 
-        # Resize (lossy) to the new shape
-        old_shape, new_shape = list(dsi.data.shape), list(dso.data.shape)
-        new_shape[1] = number_of_bins
-        dso.crop(new_shape)  # Lossy crop, but we'll be within the boundary below
+        idx, number_of_bins, bin_scale = bins
+        dso = self.bin_rows(dsi, idx, number_of_bins)
+        dso.scales[1] = [float(x) for x in bin_scale]
+        dso.labels[1] = [str(x) for x in bin_scale]
 
-
-        for n, d in enumerate(dsi.data):
-            binned_data = np.histogram(dsi.scales[1], bins=bins, weights=d)
-            binned_num = np.histogram(dsi.scales[1], bins=bins)  # Number of data points that ended up contributing to each bin
-            dso.data[n, :] = binned_data[0] / binned_num[0]  # Mean
-
-        dso.scales[1] = [float(x) for x in binned_data[1][:-1]]
-        dso.labels[1] = [str(x) for x in binned_data[1][:-1]]
-
-        # Remove any NaNs that have crept in (due to the histogram)
+        # Remove empty bins and any NaNs in the input
         dso.remove_invalid_data()
 
         return {'output': dso, 'input': input}  # Pass back input for difference plot
 
+    def generate_append(self, previous, start, input=None):
+        # Intelligent bins follow the mean spectrum, so change with every spectrum; regenerate
+        output = previous['output']
+        if self.config.get('bin_mode') == 'intelligent' or output is previous['input']:
+            return None
+
+        bins = self.bins(input)
+        if bins is None:
+            return None  # Not binned; generate passes the input through
+
+        idx, number_of_bins, bin_scale = bins
+        # Only the bins kept by generate (remove_invalid_data); regenerate if the new spectra leave any empty
+        keep = np.searchsorted(bin_scale, output.scales[1].values)
+        dso = self.bin_rows(input, idx, number_of_bins, slice(start, None))
+        dso.select(1, keep)
+        if not np.isfinite(dso.data).all():
+            return None
+
+        return {'output': output.as_appended(dso), 'input': input}
+
  
 class Binning(ProcessingPlugin):
 
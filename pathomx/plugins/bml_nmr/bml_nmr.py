@@ -44,9 +44,6 @@ class BMLNMRApp(ui.ImportDataApp):
 
         self.finalise()
 
-    def onFileChanged(self, file):
-        self.load_datafile(file)
-
     def prerender(self, Raw=None, PQN=None, TSA=None):
         return {'View': {'dso': Raw}}
 
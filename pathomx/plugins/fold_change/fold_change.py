@@ -119,7 +119,9 @@ class FoldChangeApp(ui.AnalysisApp):
             #dso.data[dso.data==0] = np.nan
             dmin = np.ma.masked_less_equal(dso.data, 0).min(0) / 2
             inds = np.where(np.logical_and(dso.data == 0, np.logical_not(np.ma.getmask(dmin))))
-            dso.data[inds] = np.take(dmin, inds[1])
+            data = dso.data.copy()  # May still be the (read-only) input
+            data[inds] = np.take(dmin, inds[1])
+            dso.data = data
 
             #minima = np.amin( dso.data[ dso.data > 0 ], axis=0 ) / 2 # Half the smallest value (in each column) by default
 
@@ -17,14 +17,12 @@ import csv
 import xml.etree.cElementTree as et
 from collections import defaultdict
 
-import numpy as np
-
 import pathomx.ui as ui
 import pathomx.db as db
 import pathomx.threads as threads
 import pathomx.utils as utils
 
-from pathomx.data import DataSet
+from pathomx.text import text_delimiter, read_columns, read_rows
 from pathomx.custom_exceptions import *
 
 
@@ -39,8 +37,11 @@ class ImportTextApp(ui.ImportDataApp):
         fn, fe = os.path.splitext(filename)
         formats = {  # Run specific loading function for different source data types
                 '.csv': self.load_csv,
+                '.tsv': self.load_csv,
+                '.txt': self.load_csv,
             }
 
+        fe = fe.lower()
         if fe in list(formats.keys()):
             print("Loading... %s" % fe)
             dso = formats[fe](filename)
@@ -62,162 +63,25 @@ class ImportTextApp(ui.ImportDataApp):
 
         # Wrapper function to allow loading from alternative format CSV files
         # Legacy is experiments in ROWS, limited number by Excel so also support experiments in COLUMNS
-        reader = csv.reader(open(filename, 'rU'), delimiter=str(','), dialect='excel')
-        hrow = next(reader)  # Get top row
-        print(hrow)
-        if 'sample' in hrow[0].lower():
+        # Only the header is read here; comma or tab separated (see text_delimiter)
+        with open(filename, encoding='utf-8-sig', errors='replace') as f:
+            line = f.readline()
+        delimiter = text_delimiter(filename, line)
+        hrow = next(csv.reader([line], delimiter=delimiter))  # Get top row
+        if len(hrow) > 1 and 'sample' in hrow[0].lower():
             if 'class' in hrow[1].lower():
-                return self.load_csv_R(filename)
+                return self.load_csv_R(filename, delimiter)
             else:
-                return self.load_csv_C(filename)
+                return self.load_csv_C(filename, delimiter)
 
         raise PathomxIncorrectFileStructureException("Data not loaded, check file structure.")
 ###### LOAD HANDLERS
 
-    def load_csv_C(self, filename):  # Load from csv with experiments in COLUMNS, metabolites in ROWS
-        # Read in data for the graphing metabolite, with associated value (generate mean)
-        f = open(filename, 'rU')
-        fsize = os.path.getsize(filename)
-        reader = csv.reader(f, delimiter=str(','), dialect='excel')
-
-        hrow = next(reader)  # Discard top row (sample no's)
-        samples = hrow[1:]
-
-        hrow = next(reader)  # Get 2nd row
-        classesa = hrow[1:]
-        classes = [c for c in classesa if c != '.']
-
-        metabolites = []
-
-        data = []
-
-        added_rows = 0
-        for n, row in enumerate(reader):
-            metabolite = row[0]
-            metabolites.append(row[0])
-            quants = []
-            for cn, c in enumerate(row[1:]):
-                if classesa[cn] != '.':
-                    try:
-                        data.append(float(c))
-                    except:
-                        data.append(0)
-
-            if n % 100 == 0:
-                self.progress.emit(float(f.tell()) / fsize)
-
-        data = np.asarray(data)
-        data = np.reshape(data, (n + 1, len(classes))).T
-
-        xdim = len(quants)
-        ydim = len(classes)
-
-        # Build dataset object
-        dso = DataSet(size=(xdim, ydim))  # self.add_data('imported_data', DataSetself) )
-        dso.empty(size=(ydim, xdim))
-        dso.labels[1] = metabolites
-
-        scales = []
-        mlabels = []
-        for m in metabolites:
-            try:
-                scales.append(float(m))
-                mlabels.append(None)
-            except:
-                scales.append(None)
-                mlabels.append(m)
-
-        dso.scales[0] = [None] * len(samples)
-        dso.labels[0] = samples
-        dso.classes[0] = classes
-        dso.entities[0] = [None] * len(samples)
-
-        dso.scales[1] = scales
-        dso.labels[1] = mlabels
-        dso.classes[1] = [None] * len(scales)
-        dso.entities[1] = [None] * len(scales)
-
-        dso.data = data
-
-        return dso
-
-    def load_csv_R(self, filename):  # Load from csv with experiments in ROWS, metabolites in COLUMNS
-        # Read in data for the graphing metabolite, with associated value (generate mean)
-        f = open(filename, 'rU')
-        fsize = os.path.getsize(filename)
-        reader = csv.reader(f, delimiter=str(','), dialect='excel')
-        print('R')
-        hrow = next(reader)  # Get top row
-        metabolites = hrow[2:]
-        ydim = 0
-        xdim = len(metabolites)
-
-        samples = []
-        classes = []
-        raw_data = []
-
-        # Build quants table for metabolite classes
-        #for metabolite in self.metabolites:
-        #    quantities[ metabolite ] = defaultdict(list)
-
-        for n, row in enumerate(reader):
-            ydim += 1
-            if row[1] != '.':  # Skip excluded classes # row[1] = Class
-                samples.append(row[0])
-                classes.append(row[1])
-                data_row = []
-                for c in row[2:]:  # in self.metabolites:
-                    try:
-                        c = float(c)
-                    except:
-                        c = 0
-                    data_row.append(c)
-
-                raw_data.append(data_row)
-                    #metabolite_column = hrow.index( metabolite )
-                    #if row[ metabolite_column ]:
-                    #    data_row.append(
-                    #    quantities[metabolite][ row[1] ].append( float(row[ metabolite_column ]) )
-                        #self.statistics['ymin'] = min( self.statistics['ymin'], float(row[ metabolite_column ]) )
-                        #self.statistics['ymax'] = max( self.statistics['ymax'], float(row[ metabolite_column ]) )
-                    #else:
-                    #    quantities[metabolite][ row[1] ].append( 0 )
-            else:
-                pass
-
-            if n % 100 == 0:
-                self.progress.emit(float(f.tell()) / fsize)
-
-                #self.statistics['excluded'] += 1
-
-        # Build dataset object
-        dso = DataSet(size=(xdim, ydim))  # self.add_data('imported_data', DataSetself) )
-        dso.empty(size=(ydim, xdim))
-        #dso.labels[1] = metabolites
-
-        scales = []
-        mlabels = []
-        for m in metabolites:
-            try:
-                scales.append(float(m))
-                mlabels.append(None)
-            except:
-                scales.append(None)
-                mlabels.append(m)
-
-        dso.scales[1] = [None] * len(samples)
-        dso.labels[0] = samples
-        dso.classes[0] = classes
-        dso.entities[0] = [None] * len(samples)
-
-        dso.scales[1] = scales
-        dso.labels[1] = mlabels
-        dso.entities[1] = [None] * len(scales)
-        dso.classes[1] = [None] * len(scales)
-
-        dso.data = np.array(raw_data)
+    def load_csv_C(self, filename, delimiter=','):  # Load from csv with experiments in COLUMNS, metabolites in ROWS
+        return read_columns(filename, delimiter, self.progress.emit)
 
-        return dso
+    def load_csv_R(self, filename, delimiter=','):  # Load from csv with experiments in ROWS, metabolites in COLUMNS
+        return read_rows(filename, delimiter, self.progress.emit)
 
 
 class ImportText(ImportPlugin):
@@ -45,6 +45,14 @@ MAP_TYPE_TABLE = {
     'Compound (metabolite)': MAP_ENTITY_COMPOUND,
 }
 
+# Entity type matched for each mapping (see databaseManager.resolve_many)
+MAP_ENTITY_TYPES = {
+    MAP_ENTITY_ALL: None,
+    MAP_ENTITY_GENE: 'gene',
+    MAP_ENTITY_PROTEIN: 'protein',
+    MAP_ENTITY_COMPOUND: 'compound',
+}
+
 
 # Dialog box for Metabohunter search options
 class MapEntityConfigPanel(ui.ConfigPanel):
@@ -58,6 +66,11 @@ class MapEntityConfigPanel(ui.ConfigPanel):
 
         self.layout.addWidget(self.cb_mapping_type)
 
+        self.xb_fuzzy = QCheckBox('Fuzzy matching of unknown names')
+        self.xb_fuzzy.setStatusTip('Map names with no exact match to the most similar synonym, if similar enough')
+        self.config.add_handler('map_fuzzy', self.xb_fuzzy)
+        self.layout.addWidget(self.xb_fuzzy)
+
         self.finalise()
 
 
@@ -173,6 +186,7 @@ class MapEntityApp(ui.GenericApp):
 
         self.config.set_defaults({
             'map_object_type': MAP_ENTITY_ALL,
+            'map_fuzzy': False,
         })
 
         self._entity_mapping_table = {}
@@ -224,26 +238,21 @@ class MapEntityApp(ui.GenericApp):
     ###### TRANSLATION to METACYC IDENTIFIERS
 
     def translate(self, data, db):
-        lku = {
-            MAP_ENTITY_ALL: db.synrev,
-            MAP_ENTITY_GENE: db.synrev_by_type['gene'],
-            MAP_ENTITY_PROTEIN: db.synrev_by_type['protein'],
-            MAP_ENTITY_COMPOUND: db.synrev_by_type['compound'],
-                }[self.config.get('map_object_type')]
-            
-        # Translate loaded data names to metabolite IDs using provided database for lookup
-        for n, m in enumerate(data.labels[1]):
-            
         # Match first using entity mapping table if set (allows override of defaults)
+        labels = list(data.labels[1])
+        unmapped = [n for n, m in enumerate(labels) if m not in self._entity_mapping_table]
+        for n, m in enumerate(labels):
             if m in self._entity_mapping_table:
                 data.entities[1][n] = self._entity_mapping_table[m]
 
-            # Use the internal database identities
-            elif m and m.lower() in lku:
-                data.entities[1][n] = lku[m.lower()]
+        # Translate the rest to entities using the internal database identities, all in one go
+        candidates = db.resolve_many([labels[n] for n in unmapped],
+                                     type=MAP_ENTITY_TYPES[self.config.get('map_object_type')],
+                                     fuzzy=self.config.get('map_fuzzy'), limit=1)
+        for n, c in zip(unmapped, candidates):
+            if c:
+                data.entities[1][n] = c[0][0]
 
-                #self.quantities[ transid ] = self.quantities.pop( m )
-        #print self.metabolites
         return data
 
 
@@ -11,7 +11,7 @@ from PyQt5.QtPrintSupport import *
 from PyQt5.QtSvg import *
 
 from optparse import Values, OptionParser
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import os
 import sys
 import re
@@ -24,13 +24,13 @@ import copy
 import operator
 import pathomx.ui as ui
 import pathomx.utils as utils
-import pathomx.db as db
 import pathomx.threads as threads
 
 from pathomx.plugins import VisualisationPlugin
 from pathomx.data import DataSet, DataDefinition
 from pathomx.db import ReactionIntermediate
 from pathomx.views import SVGView
+from pathomx.layouts import layout_key, layout_signature, restyle_svg
 
 PRUNE_ALL = lambda a, b, c, d: (a, b, c)
 PRUNE_IDENTICAL = lambda a, b, c, d: (a, b, c, d)
@@ -86,7 +86,24 @@ def get_reaction_color(analysis, r):
     return '"%s"' % ':'.join(colors)
 
 
+# Laid out maps kept per tool, for re-styling when only the data changes
+LAYOUT_CACHE_SIZE = 4
+
+
 def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
+    return build_graph(map_elements(pathways, options, db, analysis, layout, verbose))
+
+
+def map_elements(pathways, options, db, analysis=None, layout=None, verbose=True):
+    '''
+    Elements of the pathway map, as graphviz attributes: a dict of 'graph' (attributes),
+    'clusters' (name, attributes, node ids), 'nodes' (node id, attributes) and 'edges'
+    (origin id, dest id, attributes). Nodes and edges are given ids n<x> and e<x>, so
+    they can be found in the rendered SVG.
+    '''
+
+    # Reactions are copied below, and copies don't pick up attributes of sections loaded after
+    db.require('gibbs')
 
     #id,origin,dest,enzyme,dir,pathway
     #options.fit_paper = 'A4'
@@ -239,30 +256,29 @@ def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
                 clusternodes = add_clusternodes(clusternodes, 'compartment', compartments, [mtout])
 
     # id,type,names
-    for m in list(db.compounds.values()):
-
-        # It's in one of our pathways (union)
-        if set(m.pathways) & set(pathways):
-            fillcolor = False
+    # Compounds in one of our pathways (union), in database order
+    for m in db.graph.linked(pathways, 'pathway', 'compound'):
+        fillcolor = False
 
-            if analysis:
-                if m.id in analysis:
-                # We found it by one of the names
-                    fillcolor = analysis[m.id]
+        if analysis:
+            if m.id in analysis:
+            # We found it by one of the names
+                fillcolor = analysis[m.id]
 
-            # This node is in one of our pathways, store it
-            nodes.append([m, fillcolor, visible])
+        # This node is in one of our pathways, store it
+        nodes.append([m, fillcolor, visible])
 
 
     # Add pathway annotations
     if options.show_pathway_links:
 
-        visible_reactions = [r for r, x1, x2, x3 in edges]
-        visible_nodes = [n for n, x1, x2 in nodes]
+        visible_reactions = set(r for r, x1, x2, x3 in edges)
+        visible_nodes = set(n for n, x1, x2 in nodes)
 
         pathway_annotate = set()
         pathway_annotate_dupcheck = set()
-        for id, r in list(db.reactions.items()):
+        # Only reactions of compounds on the map can link to it
+        for r in db.graph.linked(visible_nodes, 'compound', 'reaction'):
 
         # Check that a reaction for this isn't already on the map
             if r not in visible_reactions:
@@ -307,11 +323,16 @@ def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
             nodes.append([pathway_node, fillcolor, True])
 
     # Generate the analysis graph from datasets
-    graph = pydot.Dot('\u200C', graph_type='digraph', sep="+15,+10", esep="+5,+5", labelfloat='false', outputMode='edgeslast', fontname='Calibri', splines=options.splines, gcolor='white', pad=0.5, model='mds', overlap="vpsc")  # , model='mds') #, overlap='ipsep', mode='ipsep', model='mds')
-    subgraphs = list()
+    elements = {
+        'graph': dict(graph_type='digraph', sep="+15,+10", esep="+5,+5", labelfloat='false', outputMode='edgeslast', fontname='Calibri', splines=options.splines, gcolor='white', pad=0.5, model='mds', overlap="vpsc"),  # , model='mds') #, overlap='ipsep', mode='ipsep', model='mds')
+        'clusters': [],
+        'nodes': [],
+        'edges': [],
+    }
     clusterclu = dict()
 
-    nodes_added = set()  # Store nodes that are added, can use simplified adding for subsequent pathways
+    nodes_added = set()  # Store nodes that are added, only add once
+    node_index = dict()  # Node id: position in elements['nodes']
 
     # Handle positioning of our dummy points on positioned elements
     # Must do this or they'll be pushed off the map
@@ -351,20 +372,17 @@ def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
             bgcolor = 'transparent'
             style = 'solid'
 
-        subgraph = pydot.Cluster(str(sgno), label='%s' % cluster, graph_type='digraph', fontname='Calibri', splines=options.splines, color=bcolor, bgcolor=bgcolor, style=style, fontcolor=bcolor, labeljust='left', pad=0.5, margin=12, labeltooltip='%s' % cluster, URL='non')  # PATHWAY_URL % cluster.id )
+        subgraph = dict(label='%s' % cluster, graph_type='digraph', fontname='Calibri', splines=options.splines, color=bcolor, bgcolor=bgcolor, style=style, fontcolor=bcolor, labeljust='left', pad=0.5, margin=12, labeltooltip='%s' % cluster, URL='non')  # PATHWAY_URL % cluster.id )
         # Read node file of compounds to show
         # TODO: Filter this by the option specification
-        for n in clusternodes[cluster_key][cluster]:
-            subgraph.add_node(pydot.Node(n.id))
-        graph.add_subgraph(subgraph)
+        elements['clusters'].append((str(sgno), subgraph, [n.id for n in clusternodes[cluster_key][cluster]]))
 
 
     # Add nodes to map
 
     for m, node_color, visible in nodes:
 
-        if m in nodes_added:  # Previously added, another pathway: use simplified add (speed up)
-            graph.add_node(pydot.Node(m.id))
+        if m in nodes_added:  # Previously added, another pathway
             continue  # Next
 
         label = ' '
@@ -431,15 +449,18 @@ def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
         else:
             image = False
 
+        node = dict(id='n%d' % len(elements['nodes']), width=width, height=height, style=style, shape=shape, color=color, penwidth=border, fontname='Calibri', colorscheme=colorscheme, fontcolor=fontcolor, fillcolor=fillcolor, label=label, labeltooltip=label, URL=url % m.id)  # http://metacyc.org/META/substring-search?object=%s
         if layout and m.id in list(layout.objects.keys()):
-            pos = '%s,%s!' % layout.objects[m.id]
-                # Fugly duplication, but appears to be no way to set a 'none' position
-            graph.add_node(pydot.Node(m.id, width=width, height=height, style=style, shape=shape, color=color, penwidth=border, fontname='Calibri', colorscheme=colorscheme, fontcolor=fontcolor, fillcolor=fillcolor, label=label, labeltooltip=label, URL=url % m.id, pos=pos))  # http://metacyc.org/META/substring-search?object=%s                
+            node['pos'] = '%s,%s!' % layout.objects[m.id]
+        elif image:
+            node['image'] = image
+        if m.id in node_index:  # Another object with the same id; as graphviz, merge the attributes
+            previous = elements['nodes'][node_index[m.id]][1]
+            node['id'] = previous['id']
+            previous.update(node)
         else:
-            if image:
-                graph.add_node(pydot.Node(m.id, width=width, height=height, image=image, style=style, shape=shape, color=color, penwidth=border, fontname='Calibri', colorscheme=colorscheme, fontcolor=fontcolor, fillcolor=fillcolor, label=label, labeltooltip=label, URL=url % m.id))  # http://metacyc.org/META/substring-search?object=%s
-            else:
-                graph.add_node(pydot.Node(m.id, width=width, height=height, style=style, shape=shape, color=color, penwidth=border, fontname='Calibri', colorscheme=colorscheme, fontcolor=fontcolor, fillcolor=fillcolor, label=label, labeltooltip=label, URL=url % m.id))  # http://metacyc.org/META/substring-search?object=%s
+            node_index[m.id] = len(elements['nodes'])
+            elements['nodes'].append((m.id, node))
 
         nodes_added.add(m)
     # Add graph edges to the map
@@ -524,8 +545,26 @@ def generator(pathways, options, db, analysis=None, layout=None, verbose=True):
         if hasattr(r, 'gibbs'):
             penwidth = abs(r.gibbs['deltaG_w'])
 
-        e = pydot.Edge(origin.id, dest.id, weight=weight, len=length, penwidth=penwidth, dir=dir, label='<' + '<br />'.join(label) + '>', colorscheme=colorscheme, color=color, fontcolor='#888888', fontsize='10', arrowhead=arrowhead, arrowtail=arrowtail, style=style, fontname='Calibri', URL=url % r.id, labeltooltip=' ')
-        graph.add_edge(e)
+        e = dict(id='e%d' % len(elements['edges']), weight=weight, len=length, penwidth=penwidth, dir=dir, label='<' + '<br />'.join(label) + '>', colorscheme=colorscheme, color=color, fontcolor='#888888', fontsize='10', arrowhead=arrowhead, arrowtail=arrowtail, style=style, fontname='Calibri', URL=url % r.id, labeltooltip=' ')
+        elements['edges'].append((origin.id, dest.id, e))
+
+    return elements
+
+
+def build_graph(elements):
+    # pydot graph of the map elements (see map_elements)
+    graph = pydot.Dot('\u200C', **elements['graph'])
+    for name, attributes, node_ids in elements['clusters']:
+        subgraph = pydot.Cluster(name, **attributes)
+        for id in node_ids:
+            subgraph.add_node(pydot.Node(id))
+        graph.add_subgraph(subgraph)
+
+    for id, attributes in elements['nodes']:
+        graph.add_node(pydot.Node(id, **attributes))
+
+    for origin, dest, attributes in elements['edges']:
+        graph.add_edge(pydot.Edge(origin, dest, **attributes))
 
     return graph
 
@@ -727,6 +766,8 @@ class MetaVizApp(ui.AnalysisApp):
         self.addConfigPanel(MetaVizPathwayConfigPanel, 'Pathways')
         self.addConfigPanel(MetaVizViewConfigPanel, 'Settings')
 
+        self.layouts = OrderedDict()  # layout_key: (layout_signature, svg); least recently used first
+
         self.finalise()
 
     def url_handler(self, url):
@@ -762,12 +803,12 @@ class MetaVizApp(ui.AnalysisApp):
 
         tps = self.generateGraph(filename=filename, suggested_pathways=suggested_pathways, compound_data=compound_data, gene_data=gene_data, protein_data=protein_data, format='svg')
         if tps == None:
-            svg_source = [open(filename).read().decode('utf8')]
+            svg_source = [open(filename, encoding='utf-8').read()]
             tps = [0]
         else:
             filename = self.get_filename_with_counter(filename)
             svg_source = [
-                open(os.path.join(QDir.tempPath(), filename % tp)).read().decode('utf8')
+                open(os.path.join(QDir.tempPath(), filename % tp), encoding='utf-8').read()
                 for tp in tps
                 ]
 
@@ -872,17 +913,38 @@ class MetaVizApp(ui.AnalysisApp):
                         if ecol is not None:
                             node_colors[m.id] = ecol
 
-            graph = generator(pathways, options, self.m.db, analysis=node_colors)  # , layout=self.layout)
-            self.status.emit('waiting')
-            self.progress.emit(0.5)
-            graph.write(filename, format=options.output, prog='neato')
+            self.render(filename, pathways, options, analysis=node_colors)  # , layout=self.layout)
             return None
         else:
-            graph = generator(pathways, options, self.m.db)  # , layout=self.layout)
+            self.render(filename, pathways, options)  # , layout=self.layout)
+            return None
+
+    def render(self, filename, pathways, options, analysis=None, layout=None):
+        # Lay out and write the map; if only its colours differ from a map laid out before,
+        # re-style that map's SVG instead of running the layout again
+        key = layout_key(pathways, options, layout)
+        elements = map_elements(pathways, options, self.m.db, analysis=analysis, layout=layout)
+        if options.output != 'svg':
+            build_graph(elements).write(filename, format=options.output, prog='neato')
+            return
+
+        signature = layout_signature(elements)
+        svg = None
+        if key in self.layouts and self.layouts[key][0] == signature:
+            self.layouts[key] = self.layouts.pop(key)  # Most recently used
+            svg = restyle_svg(self.layouts[key][1], elements)
+
+        if svg is None:
             self.status.emit('waiting')
             self.progress.emit(0.5)
-            graph.write(filename, format=options.output, prog='neato')
-            return None
+            svg = build_graph(elements).create(prog='neato', format='svg').decode('utf-8')
+            self.layouts.pop(key, None)
+            self.layouts[key] = (signature, svg)
+            while len(self.layouts) > LAYOUT_CACHE_SIZE:
+                self.layouts.popitem(last=False)
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(svg)
 
 
 class MetaViz(VisualisationPlugin):
@@ -13,19 +13,23 @@ from PyQt5.QtWebKitWidgets import *
 from PyQt5.QtPrintSupport import *
 import csv
 import os
+import re
+import json
+import hashlib
 import pprint
 import xml.etree.cElementTree as et
 from collections import defaultdict
 
 import numpy as np
-import scipy as sp
 
 import pathomx.ui as ui
 import pathomx.db as db
 import pathomx.utils as utils
-import pathomx.threads as threads
+import pathomx.processes as processes
 
 from pathomx.data import DataSet
+from pathomx.cache import FileCache
+from pathomx.spectra import PHASE_BLOCK, phase_ramp, phase, peak_window, acme, peak_minima, autophase_batch
 from pathomx.plugins import ImportPlugin
 
 import nmrglue as ng
@@ -33,14 +37,25 @@ import nmrglue as ng
 
 class NMRApp(ui.ImportDataApp):
 
+    # FID processing settings; part of the key of cached spectra, so changes here reprocess
+    fid_processing = {
+        'zero_fill': 32768,
+        'solvent_boxcar': 16,
+        'autophase': 'Peak_minima',
+        'version': 2,
+    }
+    fid_cache_max_bytes = 1024 * 1024 * 1024  # Cached spectra beyond this are removed, least recently used first
+
+    def load_datafile(self, fn):
+        return self.load_bruker(fn)
+
     def load_datafile_by_type(self, fn, type="bruker"):
 
         _callbacks = {
             'bruker': self.load_bruker,
         }
 
-        self.worker = threads.Worker(_callbacks[type], fn)
-        self.start_worker_thread(self.worker)
+        return _callbacks[type](fn)  # Already on the load worker (see thread_load_datafile)
 
     def addImportDataToolbar(self):
         t = self.getCreatedToolbar('External Data', 'external-data')
@@ -49,7 +64,7 @@ class NMRApp(ui.ImportDataApp):
         import_dataAction.setStatusTip('Import spectra from Bruker format')
         import_dataAction.triggered.connect(self.onImportBruker)
         t.addAction(import_dataAction)
-        #self.addExternalDataToolbar()
+        self.addExternalDataToolbar()  # Watch the folder for new spectra during a run
 
     def onImportBruker(self):
         """ Open a data file"""
@@ -61,14 +76,11 @@ class NMRApp(ui.ImportDataApp):
         if folder:
             self.thread_load_datafile(folder, 'bruker')
 
-            self.workspace_item.setText(0, os.path.basename(filename))
+            self.workspace_item.setText(0, os.path.basename(folder))
 
     def load_bruker(self, folder):
         # We should have a folder name; so find all files named fid underneath it (together with path)
         # Extract the path, and the parent folder name (for sample label)
-        nmr_data = []
-        sample_labels = []
-        _ppm_real_scan_folder = False
         fids = []
         for r, d, files in os.walk(folder):
             if 'fid' in files:
@@ -80,24 +92,55 @@ class NMRApp(ui.ImportDataApp):
                 # and for various formats of NMR data input- but simple
                 fids.append(r)
 
+        # In experiment number order, so spectra acquired later are appended (see ImportDataApp)
+        fids.sort(key=lambda r: [int(p) if p.isdigit() else p for p in re.split(r'(\d+)', r)])
+
         total_fids = len(fids)
-        pc_init = None
-        pc_history = []
-        for n, fid in enumerate(fids):
-            self.progress.emit(float(n) / total_fids)
+        points = self.fid_processing['zero_fill']
+
+        # Spectra are written straight into the (file-mapped if large) output as they are read,
+        # rather than holding every spectrum in memory until the end
+        dso = DataSet(size=(total_fids, points))
+        loaded = {}  # row: phase correction
+
+        # Spectra processed before (same files and settings) are read from the cache
+        cache = self.fid_cache()
+        keys = [self.fid_cache_key(fid) for fid in fids]
+        todo = []
+        for n, key in enumerate(keys):
+            cached = cache.get(key)
+            if cached is None:
+                todo.append(n)
+            else:
+                dso.data[n, :] = cached['data']
+                loaded[n] = cached['pc']
+
+        # The rest are read and transformed in parallel in the process pool, then phased together
+        # in blocks as they come in (autophase_batch) and cached, so an interrupted import picks up
+        # where it stopped
+        done = total_fids - len(todo)
+        spectra = {}  # row: transformed spectrum, waiting to be phased
+        futures = dict((processes.submit(self, 'load_bruker_fid', fids[n]), n) for n in todo)
+        for f in processes.as_completed(futures):
+            n = futures[f]
+            dic, data = f.result()
+            if data is not None:
+                spectra[n] = data
 
-            dic, data, pc = self.load_bruker_fid(fid, pc_init)
-            # Store previous phase correction outputs to speed up subsequent runs
-            pc_history.append(pc)
-            pc_init = np.median(np.array(pc_history), axis=0)
+            done += 1
+            if len(spectra) == PHASE_BLOCK or (spectra and done == total_fids):
+                self.phase_bruker_spectra(dso, spectra, loaded, keys, cache)
+                spectra = {}
+            self.progress.emit(float(done) / total_fids)
 
-            if data is not None:
-                label = os.path.basename(fid)
-                #if 'AUTOPOS' in dic['acqus']:
-                #    label = label + " %s" % dic['acqus']['AUTOPOS']
-                sample_labels.append(label)
-                nmr_data.append(data)
-                _ppm_real_scan_folder = fid
+        cache.trim()
+
+        loaded = sorted(loaded.keys())
+        sample_labels = [os.path.basename(fids[n]) for n in loaded]
+        _ppm_real_scan_folder = fids[loaded[-1]] if loaded else False
+
+        if len(loaded) < total_fids:
+            dso.select(0, loaded)  # Drop the rows of spectra that failed to load
 
         # Generate the ppm for these spectra
         # read in the bruker formatted data// use latest
@@ -118,13 +161,15 @@ class NMRApp(ui.ImportDataApp):
         offset = (float(dic['acqus']['SW']) / 2) - (float(dic['acqus']['O1']) / float(dic['acqus']['BF1']))
         start = float(dic['acqus']['SW']) - offset
         end = -offset
-        step = float(dic['acqus']['SW']) / 32768
+        step = float(dic['acqus']['SW']) / points
 
-        nmr_ppms = np.arange(start, end, -step)[:32768]
+        nmr_ppms = np.arange(start, end, -step)[:points]
         experiment_name = '%s (%s)' % (dic['acqus']['EXP'], folder)
 
-        # We now have a list of ft'd Bruker fids; run them into a data object
-        dso = self.process_data_to_dso(nmr_data, nmr_ppms, sample_labels, experiment_name)
+        dso.labels[0] = sample_labels
+        dso.labels[1] = [str(ppm) for ppm in nmr_ppms]
+        dso.scales[1] = [float(ppm) for ppm in nmr_ppms]
+        dso.name = experiment_name
         self.set_name(dso.name)
 
         return {'output': dso}
@@ -148,7 +193,35 @@ class NMRApp(ui.ImportDataApp):
 
         return dso
 
-    def load_bruker_fid(self, fn, pc_init=None):
+    def fid_cache_key(self, fid):
+        # Path, modification time and size of the acquisition files, and the processing settings
+        h = hashlib.sha1(os.path.abspath(fid).encode('utf-8'))
+        for f in ['fid', 'acqus']:
+            fn = os.path.join(fid, f)
+            if os.path.exists(fn):
+                st = os.stat(fn)
+                h.update(('%s %r %d' % (f, st.st_mtime, st.st_size)).encode('utf-8'))
+        h.update(json.dumps(self.fid_processing, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def fid_cache(self):
+        return FileCache(os.path.join(self.plugin.cache_path(), 'fid'), self.fid_cache_max_bytes)
+
+    def phase_bruker_spectra(self, dso, spectra, loaded, keys, cache):
+        # Phase the transformed spectra (row: spectrum) together into their rows of dso, from the
+        # median phase correction of those loaded so far; with none, from a shared estimate
+        rows = sorted(spectra.keys())
+        pc_init = np.median(np.array(list(loaded.values())), axis=0) if loaded else None
+        data, pc = autophase_batch(np.array([spectra[n] for n in rows]), pc_init, algorithm=self.fid_processing['autophase'])
+        data = np.real(data)[:, ::-1]  # discard the imaginaries and reverse, as ng.proc_base.di and rev
+
+        for i, n in enumerate(rows):
+            dso.data[n, :] = data[i]
+            loaded[n] = pc[i]
+            cache.put(keys[n], data=data[i], pc=pc[i])
+
+    def load_bruker_fid(self, fn):
+        # In the process pool: the transformed spectrum, phased with others in load_bruker
 
         try:
             print("Reading %s" % fn)
@@ -163,88 +236,21 @@ class NMRApp(ui.ImportDataApp):
             data = ng.bruker.remove_digital_filter(dic, data)
 
             # process the spectrum
-            data = ng.proc_base.zf_size(data, 32768)    # zero fill to 32768 points
-            data = ng.process.proc_bl.sol_boxcar(data, w=16, mode='same')  # Solvent removal
+            data = ng.proc_base.zf_size(data, self.fid_processing['zero_fill'])    # zero fill to 32768 points
+            data = ng.process.proc_bl.sol_boxcar(data, w=self.fid_processing['solvent_boxcar'], mode='same')  # Solvent removal
 
             data = ng.proc_base.fft(data)               # Fourier transform
 
-            data, pc = self.autophase(data, pc_init)  # Automatic phase correction
-
-            data = ng.proc_base.di(data)                # discard the imaginaries
-            data = ng.proc_base.rev(data)               # reverse the data
-
             #data = data / 10000000.
-            return dic, data, pc
-
-    def autophase(self, nmr_data, pc_init=None, algorithm='Peak_minima'):
-        if pc_init == None:
-            pc_init = [0, 0]
-
-        fn = {
-            'ACME': self.autophase_ACME,
-            'Peak_minima': self.autophase_PeakMinima,
-        }[algorithm]
-
-        opt = sp.optimize.fmin(fn, x0=pc_init, args=(nmr_data.reshape(1, -1)[:500], ))
-        print("Phase correction optimised to: %s" % opt)
-        return ng.process.proc_base.ps(nmr_data, p0=opt[0], p1=opt[1]), opt
+            return dic, data
 
     def autophase_ACME(self, x, s):
-        # Based on the ACME algorithm by Chen Li et al. Journal of Magnetic Resonance 158 (2002) 164–168
-
-        stepsize = 1
-
-        n, l = s.shape
-        phc0, phc1 = x
-
-        s0 = ng.process.proc_base.ps(s, p0=phc0, p1=phc1)
-        s = np.real(s0)
-        maxs = np.max(s)
-
-        # Calculation of first derivatives
-        ds1 = np.abs((s[2:l] - s[0:l - 1]) / (stepsize * 2))
-        p1 = ds1 / np.sum(ds1)
-
-        # Calculation of entropy
-        m, k = p1.shape
-
-        for i in range(0, m):
-            for j in range(0, k):
-                if (p1[i, j] == 0):  # %in case of ln(0)
-                    p1[i, j] = 1
-
-        h1 = -p1 * np.log(p1)
-        h1s = np.sum(h1)
-
-        # Calculation of penalty
-        pfun = 0.0
-        as_ = s - np.abs(s)
-        sumas = np.sum(as_)
-
-        if (sumas < 0):
-            pfun = pfun + np.sum((as_ / 2) ** 2)
-
-        p = 1000 * pfun
-
-        # The value of objective function
-        return h1s + p
+        # Objective for the phase correction x = (p0, p1) of spectrum s
+        return np.sum(acme(np.real(phase(s.reshape(1, -1), phase_ramp(s.size), x[0], x[1]))))
 
     def autophase_PeakMinima(self, x, s):
-        # Based on the ACME algorithm by Chen Li et al. Journal of Magnetic Resonance 158 (2002) 164–168
-
-        stepsize = 1
-
-        phc0, phc1 = x
-
-        s0 = ng.process.proc_base.ps(s, p0=phc0, p1=phc1)
-        s = np.real(s0).flatten()
-
-        i = np.argmax(s)
-        peak = s[i]
-        mina = np.min(s[i - 100:i])
-        minb = np.min(s[i:i + 100])
-
-        return np.abs(mina - minb)
+        w, ramp = peak_window(s.reshape(1, -1))
+        return np.sum(peak_minima(np.real(phase(w, ramp, x[0], x[1]))))
 
 
 class NMRGlue(ImportPlugin):
@@ -101,6 +101,8 @@ class PeakAdjConfigPanel(ui.ConfigPanel):
 
 class NMRPeakAdjApp( ui.DataApp ):
 
+    generate_in_process = True  # CPU-bound Python loops; run clear of the GIL
+
     def __init__(self, **kwargs):
         super(NMRPeakAdjApp, self).__init__(**kwargs)
         
@@ -163,6 +165,7 @@ class NMRPeakAdjApp( ui.DataApp ):
     def shiftandscale(self, dsi):
         # Get the target region from the spectra (will be using this for all calculations;
         # then applying the result to the original data)
+        dsi = dsi.as_copy()  # Shifted/scaled in place below; the input data is read-only
         scale = dsi.scales[1]
         
         target_ppm = self.config.get('peak_target_ppm')
@@ -188,6 +191,7 @@ class NMRPeakAdjApp( ui.DataApp ):
 
         reference_peaks = []
         for sdata in data:
+            self.checkpoint()
             baseline = np.max( sdata ) * .9 # 90% baseline of maximum peak within target region
             locations, scales, amps = ng.analysis.peakpick.pick(sdata, pthres=baseline, algorithm='connected', est_params = True, cluster=False, table=False)
             if len(locations) > 0:
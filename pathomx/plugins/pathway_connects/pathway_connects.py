@@ -49,57 +49,26 @@ class PathwayConnectsApp(ui.AnalysisApp):
             self.add_viewer()
             pass
 
-    def build_matrix(self, targets, target_links):
-
-        data = []
-        for mx in targets:
-            row = []
-            for my in targets:
-                n = len(list(target_links[my] & target_links[mx]))
-                row.append(n)
-
-            data.append(row)
-        return data, targets
+    def build_matrix(self, positions, via):
+        # Counts of the via objects (reactions, compounds) shared by each pair of the pathways
+        overlap = self.m.db.graph.overlap('pathway', via)
+        return overlap[positions][:, positions].toarray().astype(float)
 
     def generate(self, input=None):
 
-        pathways = list(self.m.db.pathways.keys())
-        pathway_compounds = dict()
-
-        for k, p in list(self.m.db.pathways.items()):
-            pathway_compounds[p.id] = set([m for m in p.compounds])
-
-        data_m, labels_m = self.build_matrix(pathways, pathway_compounds)
-
-        pathway_reactions = dict()
-
-        for k, p in list(self.m.db.pathways.items()):
-            pathway_reactions[p.id] = set([m for m in p.reactions])
-
-        data_r, labels_r = self.build_matrix(pathways, pathway_reactions)
-
-        pathway_active_reactions = dict()
-        pathway_active_compounds = dict()
-        active_pathways = input.entities[1]  # [self.parent.db.pathways[p] for p in self.parent.config.value('/Pathways/Show').split(',')]
-        active_pathways_id = []
-
-        for p in active_pathways:
-            pathway_active_reactions[p.id] = set([r for r in p.reactions])
-            pathway_active_compounds[p.id] = set([r for r in p.compounds])
-            active_pathways_id.append(p.id)
-
-        data_ar, labels_ar = self.build_matrix(active_pathways_id, pathway_active_reactions)
-        data_am, labels_am = self.build_matrix(active_pathways_id, pathway_active_compounds)
+        graph = self.m.db.graph
+        active_pathways = graph.positions('pathway', input.entities[1])
+        labels = [p.id for p in graph.select('pathway', active_pathways)]
 
-        dim = len(data_ar)
+        dim = len(labels)
 
         dso_r = DataSet(size=(dim, dim))
-        dso_r.data = data_ar
-        dso_r.labels[1] = labels_ar
+        dso_r.data = self.build_matrix(active_pathways, 'reaction')
+        dso_r.labels[1] = labels
 
         dso_m = DataSet(size=(dim, dim))
-        dso_m.data = data_am
-        dso_m.labels[1] = labels_am
+        dso_m.data = self.build_matrix(active_pathways, 'compound')
+        dso_m.labels[1] = labels
 
         return {'dso_r': dso_r, 'dso_m': dso_m}
 
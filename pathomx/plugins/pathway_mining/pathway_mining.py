@@ -12,11 +12,10 @@ from PyQt5.QtPrintSupport import *
 
 from pathomx.plugins import AnalysisPlugin
 
-from collections import defaultdict
-
 import os
 import pathomx.ui as ui
 import pathomx.utils as utils
+import pathomx.mining as mining
 
 from pathomx.db import Compound, Gene, Protein
 from pathomx.data import DataSet, DataDefinition
@@ -25,14 +24,8 @@ from pathomx.views import TableView
 import numpy as np
 
 
-METAPATH_MINING_TYPE_CODE = ('c', 'u', 'd', 'm', 't')
-METAPATH_MINING_TYPES = {
-    'c': 'Compound change scores for pathway',
-    'u': 'Compound up-regulation scores for pathway',
-    'd': 'Compound down-regulation scores for pathway',
-    'm': 'Number compounds with data per pathway',
-    't': 'Pathway overall tendency',
-}
+METAPATH_MINING_TYPE_CODE = mining.MINING_TYPE_CODE
+METAPATH_MINING_TYPES = mining.MINING_TYPES
 
 
 # Dialog box for Metabohunter search options
@@ -60,10 +53,52 @@ class PathwayMiningConfigPanel(ui.ConfigPanel):
         self.layout.addWidget(self.xb_miningShared)
         self.layout.addWidget(self.sb_miningDepth)
 
+        vw = QGridLayout()
+        self.sb_miningHops = QSpinBox()
+        self.sb_miningHops.setRange(0, 10)
+        self.config.add_handler('/Data/MiningHops', self.sb_miningHops)
+        tl = QLabel('Neighbour hops')
+        tl.setAlignment(Qt.AlignRight)
+        vw.addWidget(tl, 0, 0)
+        vw.addWidget(self.sb_miningHops, 0, 1)
+
+        self.sb_miningDecay = QDoubleSpinBox()
+        self.sb_miningDecay.setDecimals(2)
+        self.sb_miningDecay.setRange(0, 1)
+        self.sb_miningDecay.setSingleStep(0.05)
+        self.config.add_handler('/Data/MiningDecay', self.sb_miningDecay)
+        tl = QLabel('Score passed per hop')
+        tl.setAlignment(Qt.AlignRight)
+        vw.addWidget(tl, 1, 0)
+        vw.addWidget(self.sb_miningDecay, 1, 1)
+
+        self.sb_miningPermutations = QSpinBox()
+        self.sb_miningPermutations.setRange(0, 100000)
+        self.sb_miningPermutations.setSingleStep(100)
+        self.config.add_handler('/Data/MiningPermutations', self.sb_miningPermutations)
+        tl = QLabel('Permutations (0 for none)')
+        tl.setAlignment(Qt.AlignRight)
+        vw.addWidget(tl, 2, 0)
+        vw.addWidget(self.sb_miningPermutations, 2, 1)
+
+        gb = QGroupBox('Neighbours and significance')
+        gb.setLayout(vw)
+        self.layout.addWidget(gb)
+
         self.finalise()
 
 
 class PathwayMiningApp(ui.AnalysisApp):
+    '''
+    Scores pathways by the data of their compounds, genes and proteins, and outputs the top
+    scoring (MiningDepth). An entity's score is added to each of its pathways (shared between
+    them with MiningShared), as sparse entity x pathway matrix products over the database's
+    graph index. With MiningHops, scores first spread to neighbours through shared reactions:
+    each hop passes on MiningDecay times the mean score of an entity's neighbours. With
+    MiningPermutations, a permutation p-value is given for each pathway score, from scores of
+    the data shuffled between the measured entities (of each type, within each input).
+    '''
+
     def __init__(self, **kwargs):
         super(PathwayMiningApp, self).__init__(**kwargs)
 
@@ -77,6 +112,9 @@ class PathwayMiningApp(ui.AnalysisApp):
             '/Data/MiningType': 'c',
             '/Data/MiningRelative': False,
             '/Data/MiningShared': True,
+            '/Data/MiningHops': 0,
+            '/Data/MiningDecay': 0.5,
+            '/Data/MiningPermutations': 0,
         })
         #t = self.getCreatedToolbar('Pathway mining', 'pathway_mining')
         #miningSetup = QAction( QIcon( os.path.join( self.plugin.path, 'icon-16.png' ) ), 'Set up pathway mining \u2026', self.m)
@@ -115,112 +153,65 @@ class PathwayMiningApp(ui.AnalysisApp):
         self.finalise()
 
     def generate(self, input_1=None, input_2=None, input_3=None, input_4=None):
-        #dsi = input
-        # Iterate all the compounds in the current analysis
-        # Assign score to each of the compound's pathways
-        # Sum up, crop and return a list of pathway_ids to display
-        # Pass this in as the list to view
-        # + requested pathways, - excluded pathways
-
-        db = self.m.db
+        # Score every pathway from the compounds, genes and proteins in the inputs, then
+        # crop to the top scoring and return them for display (+ requested pathways,
+        # - excluded pathways, in the viewer)
+        graph = self.m.db.graph
 
         mining_depth = self.config.get('/Data/MiningDepth')
         mining_type = self.config.get('/Data/MiningType')
+        print("Mining using '%s'" % mining_type)
 
-        pathway_scores = defaultdict(int)
-
-        for dsi in input_1, input_2, input_3, input_4:
-            if dsi == None:
-                continue
-
-            print("Mining using '%s'" % mining_type)
-
-            for n, entity in enumerate(dsi.entities[1]):
-                if entity == None:
-                    continue  # Skip
-
-                score = dsi.data[0, n]
-                #score = self.analysis[ m_id ]['score']
-
-                # 1' neighbours; 2' neighbours etc. add score
-                # Get a list of methods in connected reactions, add their score % to this compound
-                # if m_id in db.compounds.keys():
-                #    n_compounds = [r.compounds for r in db.compounds[ m_id ].reactions ]
-                #     print n_compounds
-                #     n_compounds = [m for ml in n_compounds for m in ml if n_m.id in self.analysis and m.id != m_id ]
-                #     for n_m in n_compounds:
-                #         score += self.analysis[ n_m.id ]['score'] * 0.5
-
-                # Get the entity's pathways
-                pathways = entity.pathways
-                if pathways == []:
-                    continue
-
-                if self.config.get('/Data/MiningShared'):
-                    # Share the change score between the associated pathways
-                    # this prevents compounds having undue influence
-                    score = score / len(pathways)
-
-                for p in pathways:
-                    mining_val = {
-                        'c': abs(score),
-                        'u': max(0, score),
-                        'd': abs(min(0, score)),
-                        'm': 1.0,
-                        't': score,
-                        }
-                    pathway_scores[p] += mining_val[mining_type]
-
-
-            # If we're using tendency scaling; abs the scores here
-            if mining_type == 't':
-                for p, v  in list(pathway_scores.items()):
-                    pathway_scores[p] = abs(v)
-
-
-            # If we're pruning, then remove any pathways not in keep_pathways
-            if self.config.get('/Data/MiningRelative'):
-                print("Scaling pathway scores to pathway sizes...")
-                for p, v in list(pathway_scores.items()):
-                    pathway_scores[p] = float(v) / len(p.reactions)
-
-        
-        if not pathway_scores:
+        inputs = [dsi for dsi in (input_1, input_2, input_3, input_4) if dsi is not None]
+        measured = mining.measured_values(graph, inputs, mining_type)
+        if not measured:
             # No data
             raise BaseException
 
-        # Now take the accumulated scores; and create the output
-        pathway_scorest = list(pathway_scores.items())  # Switch it to a dict so we can sort
-        pathway_scorest = [(p, v) for p, v in pathway_scorest if v > 0]  # Remove any scores of 0
-        pathway_scorest.sort(key=lambda tup: tup[1], reverse=True)  # Sort by scores (either system)
+        options = self.mining_options()
+        scores = mining.pathway_scores(graph, measured, [v[:, None] for t, pos, v in measured], **options)[:, 0]
 
-        # Get top N defined by mining_depth parameter
-        keep_pathways = pathway_scorest[0:mining_depth]
-        remaining_pathways = pathway_scorest[mining_depth + 1:mining_depth + 100]
+        # Permutation p-values: how often scores of the shuffled data reach the observed
+        permutations = self.config.get('/Data/MiningPermutations')
+        if permutations:
+            pvalues = mining.permutation_pvalues(graph, measured, scores, permutations, **options)
 
-        print("Mining recommended %d out of %d" % (len(keep_pathways), len(pathway_scores)))
+        # Pathways with a score, best first (ties in database order); then the top N defined by mining_depth
+        scored = np.flatnonzero(scores > 0)
+        ranked = scored[np.argsort(-scores[scored], kind='stable')]
+        keep_pathways = ranked[0:mining_depth]
+        pathways = graph.select('pathway', keep_pathways)
 
-        for n, p in enumerate(keep_pathways):
-            print("- %d. %s [%.2f]" % (n + 1, p[0].name, p[1]))
+        print("Mining recommended %d out of %d" % (len(keep_pathways), np.count_nonzero(scores)))
 
-        #self.analysis['mining_ranked_remaining_pathways'] = []
+        for n, (p, v) in enumerate(zip(pathways, scores[keep_pathways])):
+            print("- %d. %s [%.2f]" % (n + 1, p.name, v))
 
-        #if remaining_pathways:
-        #    print "Note: Next pathways by current scoring method are..."
-        #    for n2,p in enumerate(remaining_pathways):
-        #        print "- %d. %s [%.2f]" % (n+n2+1, db.pathways[ p[0] ].name, p[1])
-        #        self.analysis['mining_ranked_remaining_pathways'].append( p[0] )
+        rows = [scores[keep_pathways]]
+        if permutations:
+            rows.append(pvalues[keep_pathways])
 
-        #self.analysis_suggested_pathways = [db.pathways[p[0]] for p in pathway_scorest]
-        dso = DataSet(size=(1, len(keep_pathways)))
-        dso.entities[1] = [k for k, v in keep_pathways]
-        dso.labels[1] = [k.name for k, v in keep_pathways]
-        dso.data = np.array([v for k, v in keep_pathways], ndmin=2)
+        dso = DataSet(size=(len(rows), len(keep_pathways)))
+        dso.entities[1] = pathways
+        dso.labels[1] = [p.name for p in pathways]
+        dso.data = np.array(rows, ndmin=2)
 
         dso.labels[0][0] = "Pathway mining scores"
+        if permutations:
+            dso.labels[0][1] = "Permutation p-value"
 
         return {'output': dso}
 
+    def mining_options(self):
+        # Scoring options for pathomx.mining.pathway_scores, from the config
+        return {
+            'mining_type': self.config.get('/Data/MiningType'),
+            'shared': self.config.get('/Data/MiningShared'),
+            'relative': self.config.get('/Data/MiningRelative'),
+            'hops': self.config.get('/Data/MiningHops'),
+            'decay': self.config.get('/Data/MiningDecay'),
+        }
+
     def onMiningSettings(self):
         """ Open the mining setup dialog to define conditions, ranges, class-comparisons, etc. """
         dialog = dialogMiningSettings(parent=self)
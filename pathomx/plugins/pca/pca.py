@@ -49,6 +49,8 @@ class PCAConfigPanel(ui.ConfigPanel):
 
 
 class PCAApp( ui.AnalysisApp ):
+    supports_append = True # New samples are scored on the existing model; recalculate to refit
+
     def __init__(self, **kwargs):
         super(PCAApp, self).__init__(**kwargs)
 
@@ -130,6 +132,20 @@ class PCAApp( ui.AnalysisApp ):
             'dso_z': dso_z,        
         }.items()) + list(dso_pc.items()) )
         
+    def generate_append(self, previous, start, input=None):
+        # The model is fitted to the samples (columns of data.T), so scores are the components;
+        # a new sample x projects onto them as weights . (x - mean(x)) / singular value ** 2
+        pca, weights = previous['pca'], np.hstack([previous['pc%d' % (n+1)].data.T for n in range(len(pca.components_))])
+        data = input.data[start:]
+        centred = data - np.mean(data, axis=1, keepdims=True)
+
+        scored = DataSet(size=(data.shape[0], len(pca.components_)))
+        scored.labels[0] = input.labels[0][start:]
+        scored.classes[0] = input.classes[0][start:]
+        scored.data = np.dot(centred, weights) / pca.singular_values_ ** 2
+
+        return dict( previous, dso=input, scores=previous['scores'].as_appended(scored) )
+
     def prerender(self, dso=None, pca=None, scores=None, pc1=None, pc2=None, pc3=None, pc4=None, pc5=None, **kwargs):
         return {
             'Scores':{'dso': scores}, 
@@ -91,6 +91,8 @@ class PythonHighlighter(QSyntaxHighlighter):
 
 class PythonScriptTool(ui.CodeEditorTool):
 
+    copy_inputs = True  # Scripts may modify input in place
+
     def __init__(self, **kwargs):
         super(PythonScriptTool, self).__init__(**kwargs)
 
@@ -22,7 +22,7 @@ import pathomx.threads as threads
 import pathomx.utils as utils
 import pathomx.qt5 as qt5
 
-from pathomx.data import DataSet, DataDefinition
+from pathomx.data import DataSet, DataDefinition, chunks, scratch_array
 from pathomx.views import MplSpectraView, MplDifferenceView
 
 
@@ -45,6 +45,10 @@ class SpectraNormConfigPanel(ui.ConfigPanel):
 
 
 class SpectraNormApp(ui.DataApp):
+    # New spectra are normalised against the reference (median) of the earlier ones; a full
+    # recalculation takes the reference from all spectra
+    supports_append = True
+
     def __init__(self, **kwargs):
         super(SpectraNormApp, self).__init__(**kwargs)
 
@@ -73,6 +77,11 @@ class SpectraNormApp(ui.DataApp):
             'PQN': self.pqn,
             'TSA': self.tsa,
         }
+        self.references = {
+            'PQN': self.pqn_reference,
+            'TSA': self.tsa_reference,
+        }
+        self._reference = None  # (output, reference) of the latest results
 
         self.config.set_defaults({
             'algorithm': 'PQN',
@@ -91,41 +100,67 @@ class SpectraNormApp(ui.DataApp):
                 'Difference': {'dso_a': input, 'dso_b': output},
                 }
 
-    def tsa(self, data):
-        # Abs the data (so account for negative peaks also)
-        data_a = np.abs(data)
-        # Sum each spectra (TSA)
-        data_as = np.sum(data_a, axis=1)
+    def tsa(self, data, reference=None):
+        # Work through the spectra in blocks of rows so file-mapped data is never fully loaded
+        # Abs the data (so account for negative peaks also); sum each spectra (TSA)
+        data_as = np.concatenate([np.sum(np.abs(data[s]), axis=1) for s in chunks(data)])
         # Identify median
-        median_s = np.median(data_as)
+        median_s = np.median(data_as) if reference is None else reference
         # Scale others to match (*(median/row))
-        scaling = median_s / data_as
+        scaling = (median_s / data_as).reshape(-1, 1)
         # Scale the spectra
-        return data * scaling.reshape(-1, 1)
+        out = scratch_array(data.shape)
+        for s in chunks(data):
+            out[s] = data[s] * scaling[s]
+        return out
+
+    def tsa_reference(self, data):
+        return np.median(np.concatenate([np.sum(np.abs(data[s]), axis=1) for s in chunks(data)]))
 
-    def pqn(self, data):  # 10.1021/ac051632c
+    def pqn(self, data, reference=None):  # 10.1021/ac051632c
         # Perform TSA normalization
-        data = self.tsa(data)
-        # Calculate median spectrum (median of each variable)
-        median_s = np.median(data, axis=0)
+        data = self.tsa(data, None if reference is None else reference[0])
+        # Calculate median spectrum (median of each variable); blocks of columns
+        median_s = np.concatenate([np.median(data[s], axis=0) for s in chunks(data, axis=1)]) if reference is None else reference[1]
         # For each variable of each spectrum, calculate ratio between median spectrum variable and that of the considered spectrum
-        spectra_r = median_s / np.abs(data)
         # Take the median of these scaling factors and apply to the entire considered spectrum
-        return data * spectra_r
+        for s in chunks(data):
+            data[s] = data[s] * (median_s / np.abs(data[s]))
+        return data
+
+    def pqn_reference(self, data):
+        # TSA median and the median spectrum of the TSA normalised data
+        tsa = self.tsa(data)
+        return self.tsa_reference(data), np.concatenate([np.median(tsa[s], axis=0) for s in chunks(tsa, axis=1)])
 
     # Normalise using scaling method
-    def normalise(self, dsi):
+    def normalise(self, dsi, reference=None):
         # Generate bin values for range start_scale to end_scale
         # Calculate the number of bins at binsize across range
         dso = DataSet(size=dsi.shape)
         dso.import_data(dsi)
 
-        dso.data = self.algorithms[self.config.get('algorithm')](dso.data)
+        dso.data = self.algorithms[self.config.get('algorithm')](dso.data, reference)
         # -- optionally use the line widths and take max within each of these for each spectra (peak shiftiness)
         # Filter the original data with those locations and output\
 
         return dso
 
+    def generate_append(self, previous, start, input=None):
+        # Normalise the new spectra against the reference of the earlier ones; it is worked
+        # out once for a series of appends (kept with the output it applies to)
+        output = previous['output']
+        if self._reference is not None and self._reference[0] is output:
+            reference = self._reference[1]
+        else:
+            reference = self.references[self.config.get('algorithm')](input.data[:start])
+
+        new = input.as_view()
+        new.select(0, np.arange(start, input.data.shape[0]))
+        output = output.as_appended(self.normalise(new, reference))
+        self._reference = (output, reference)
+        return {'output': output, 'input': input}
+
  
 class SpectraNorm(ProcessingPlugin):
 
@@ -101,7 +101,7 @@ class TransformGlobalMinima(TransformApp):
     def fn(self, dso):
         minima = np.min(dso.data[dso.data > 0]) / 2  # Half the smallest value by default
         # Get the dso filtered by class
-        dso.data[dso.data <= 0] = minima
+        dso.data = np.where(dso.data <= 0, minima, dso.data)
         return dso
 
 
@@ -113,7 +113,9 @@ class TransformLocalMinima(TransformApp):
         #dso.data[dso.data==0] = np.nan
         dmin = np.ma.masked_less_equal(dso.data, 0).min(0) / 2
         inds = np.where(np.logical_and(dso.data == 0, np.logical_not(np.ma.getmask(dmin))))
-        dso.data[inds] = np.take(dmin, inds[1])
+        data = dso.data.copy()  # Input data is read-only
+        data[inds] = np.take(dmin, inds[1])
+        dso.data = data
         return dso
 
 
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+'''
+Process-pool execution of tool generate() calls.
+
+Tools that set generate_in_process = True have generate() run in a worker process
+rather than on a thread, so CPU-bound pure-Python code doesn't hold the GIL of the
+application. The call still runs on a threads.Worker (which waits for the process),
+so results come back through the usual WorkerSignals.
+
+In the worker, generate() is called on a ProcessTool standing in for the tool: it
+has the tool's config (a snapshot) and its class's methods, but not attributes set
+up in __init__ or any widgets. DataSet data moves in and out through files in shared
+memory (/dev/shm where available), mapped at both ends rather than pickled; the
+annotations are passed as plain lists, with entities by database id. Input files are
+kept (up to shared_max_bytes) and reused while the input's content_hash is unchanged,
+so re-running a tool on the same inputs doesn't write them out again.
+
+Cancelling the worker waiting on the process sets a flag in shared memory that the
+tool's checkpoint() reads in the process, so a superseded generate stops there too.
+
+Other methods of a tool can be run the same way with submit(), e.g. to process many
+input files in parallel; their arguments and results are pickled.
+'''
+from __future__ import unicode_literals
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import threading
+import importlib.util
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from . import threads
+from .data import DataSet, CategoricalAnnotation, chunks, scratch_path
+
+_pool = None
+_shared_path = None
+_db = None
+
+shared_max_bytes = 512 * 1024 * 1024  # Input files kept for reuse (see share_input)
+_shared_inputs = OrderedDict()  # content hash: SharedInput; least recently used first
+_shared_lock = threading.Lock()
+
+
+def pool():
+    # Started on first use. Spawned rather than forked; the application has Qt threads running
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def shared_path():
+    global _shared_path
+    if _shared_path is None:
+        base = '/dev/shm' if os.access('/dev/shm', os.W_OK) else scratch_path()
+        _shared_path = tempfile.mkdtemp(prefix='pathomx-shm-', dir=base)
+        atexit.register(shutil.rmtree, _shared_path, True)
+    return _shared_path
+
+
+class SharedDataSet(object):
+    '''
+    Picklable description of a DataSet whose data is in a shared memory file.
+    '''
+
+    def __init__(self, dso, file=None):
+        # With file, the data is already there (see share_input)
+        self.dtype = dso.data.dtype.str
+        self.shape = dso.data.shape
+        if file is not None:
+            self.file = file
+        else:
+            fd, self.file = tempfile.mkstemp(suffix='.dat', dir=shared_path())
+            os.close(fd)
+
+        if file is None and dso.data.size:
+            a = np.memmap(self.file, dtype=self.dtype, mode='w+', shape=self.shape)
+            for s in chunks(dso.data):
+                a[s] = dso.data[s]
+            a.flush()
+            del a
+
+        self.name = dso.name
+        self.description = dso.description
+        self.type = dso.type
+        self.log = dso.log
+        self.labels = [l.tolist() for l in dso.labels]
+        self.scales = [s.tolist() for s in dso.scales]
+        self.classes = [(c.categories, c.codes) for c in dso.classes]
+        self.entities = [[getattr(e, 'id', None) for e in es] for es in dso.entities]
+
+    def get(self, db=None, mode='r'):
+        '''
+        DataSet with the data mapped from the shared file. mode is as for np.memmap; 'c' gives
+        private copy-on-write data that the generator can modify without touching the file.
+        '''
+        dso = DataSet(size=[0] * len(self.shape))
+        dso.name = self.name
+        dso.description = self.description
+        dso.type = self.type
+        dso.log = self.log
+
+        for d, n in enumerate(self.shape):
+            dso.labels[d] = self.labels[d]
+            dso.scales[d] = self.scales[d]
+            classes = CategoricalAnnotation()
+            classes.categories, classes.codes = self.classes[d]
+            dso.classes[d] = classes
+            if db is not None and any(e is not None for e in self.entities[d]):
+                dso.entities[d] = [db.index.get(e) if e is not None else None for e in self.entities[d]]
+            else:
+                dso.entities[d] = np.full(n, None, dtype=object)
+
+        dso.axes = [None] * len(self.shape)
+
+        if all(self.shape):
+            dso.data = np.memmap(self.file, dtype=self.dtype, mode=mode, shape=self.shape)
+        else:
+            dso.data = np.zeros(self.shape, dtype=self.dtype)
+        return dso
+
+    def release(self):
+        _remove(self.file)
+
+
+class SharedInput(object):
+    # A shared data file kept for reuse, and the number of calls using it
+    def __init__(self, file, nbytes):
+        self.file = file
+        self.nbytes = nbytes
+        self.users = 0
+
+
+def share_input(dso):
+    '''
+    SharedDataSet for a generate input, reusing the file written for an earlier call
+    with the same content_hash. Pass the key returned with it to unshare_input when done.
+    '''
+    key = dso.content_hash()
+    with _shared_lock:
+        entry = _shared_inputs.pop(key, None)
+        if entry is None:
+            shared = SharedDataSet(dso)
+            entry = SharedInput(shared.file, dso.data.nbytes)
+        else:
+            shared = SharedDataSet(dso, entry.file)
+
+        _shared_inputs[key] = entry  # Most recently used
+        entry.users += 1
+        return key, shared
+
+
+def unshare_input(key):
+    # Files not in use by a call are removed, least recently used first, down to shared_max_bytes
+    with _shared_lock:
+        _shared_inputs[key].users -= 1
+        nbytes = sum(e.nbytes for e in _shared_inputs.values())
+        for k, entry in list(_shared_inputs.items()):
+            if nbytes <= shared_max_bytes:
+                break
+            if entry.users == 0:
+                del _shared_inputs[k]
+                nbytes -= entry.nbytes
+                _remove(entry.file)
+
+
+def _remove(file):
+    try:
+        os.remove(file)  # Existing mappings stay valid (POSIX)
+    except OSError:
+        pass  # Windows; removed with the shared folder on exit
+
+
+class SharedFlag(object):
+    '''
+    Flag in a shared memory file: set in the application, read in a worker process.
+    '''
+
+    def __init__(self):
+        fd, self.file = tempfile.mkstemp(suffix='.flag', dir=shared_path())
+        os.write(fd, b'\0')
+        os.close(fd)
+        self._map = None
+
+    def __getstate__(self):
+        return {'file': self.file, '_map': None}
+
+    def _mapped(self):
+        if self._map is None:
+            self._map = np.memmap(self.file, dtype=np.uint8, mode='r+', shape=(1,))
+        return self._map
+
+    def set(self):
+        self._mapped()[0] = 1
+
+    def is_set(self):
+        return bool(self._mapped()[0])
+
+    def release(self):
+        self._map = None
+        _remove(self.file)
+
+
+class ProcessToken(object):
+    # threads.CancellationToken for the worker process, cancelled through a SharedFlag
+    def __init__(self, flag):
+        self.flag = flag
+        try:
+            flag.is_set()  # Mapped now; the file is removed once the call is over
+        except OSError:
+            raise threads.WorkerCancelled()  # Already over
+
+    @property
+    def cancelled(self):
+        return self.flag.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise threads.WorkerCancelled()
+
+
+class ProcessConfig(object):
+    # Snapshot of the tool's ConfigManager (config over defaults) for ProcessTool
+    def __init__(self, config):
+        self.config = config
+
+    def get(self, key):
+        return self.config.get(key)
+
+    def set(self, key, value, trigger_update=True):
+        self.config[key] = value
+
+
+class _NullSignal(object):
+    def emit(self, *args):
+        pass
+
+
+class ProcessMain(object):
+    # Stands in for the main window; the pathway database is loaded in the worker on first use
+    @property
+    def db(self):
+        return worker_db()
+
+
+class ProcessTool(object):
+    '''
+    Stands in for a tool inside the worker process (see module docstring).
+    '''
+
+    def __init__(self, cls, config):
+        self._cls = cls
+        self.config = ProcessConfig(config)
+        self.m = ProcessMain()
+        self.progress = self.status = _NullSignal()
+        self.name = None
+
+    def set_name(self, name):
+        self.name = name  # Applied to the tool when the result comes back
+
+    def __getattr__(self, name):
+        attr = getattr(self._cls, name)
+        return attr.__get__(self, self._cls) if hasattr(attr, '__get__') else attr
+
+
+def worker_db():
+    global _db
+    if _db is None:
+        from . import db
+        _db = db.databaseManager()
+    return _db
+
+
+def _tool_class(module, filename, name):
+    # Plugins are loaded from their folders by yapsy, not as package modules; load by file
+    if module not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module, filename)
+        m = importlib.util.module_from_spec(spec)
+        sys.modules[module] = m
+        try:
+            spec.loader.exec_module(m)
+        except:
+            del sys.modules[module]
+            raise
+    return getattr(sys.modules[module], name)
+
+
+def _generate(module, filename, name, config, kwargs, cancel):
+    # Runs in the worker process; checkpoint() in generate stops once cancel is set
+    tool = ProcessTool(_tool_class(module, filename, name), config)
+
+    db = None
+    for k, v in list(kwargs.items()):
+        if isinstance(v, SharedDataSet):
+            if db is None and any(e is not None for es in v.entities for e in es):
+                db = worker_db()
+            kwargs[k] = v.get(db=db, mode='c')
+
+    result = threads.run_with_token(ProcessToken(cancel), tool.generate, **kwargs)
+
+    if isinstance(result, dict):
+        result = dict((k, SharedDataSet(v) if isinstance(v, DataSet) else v) for k, v in result.items())
+    return result, tool.name
+
+
+def _call(module, filename, name, config, method, args):
+    # Runs in the worker process
+    tool = ProcessTool(_tool_class(module, filename, name), config)
+    return getattr(tool, method)(*args)
+
+
+def _config(app):
+    config = dict(app.config.defaults)
+    config.update(app.config.config)
+    return config
+
+
+def submit(app, method, *args):
+    '''
+    Start app.<method>(*args) in the process pool, on a ProcessTool standing in for app (see
+    the module docstring). Arguments and result are pickled. Returns a concurrent.futures.Future.
+    '''
+    cls = app.__class__
+    return pool().submit(_call, cls.__module__, sys.modules[cls.__module__].__file__, cls.__name__, _config(app), method, args)
+
+
+def as_completed(futures):
+    '''
+    Yield futures as they finish. If the worker running on this thread is cancelled, those
+    not yet started are dropped and WorkerCancelled is raised; any running finish in the background.
+    '''
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield f
+            threads.checkpoint()
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+def generate(app, kwargs_dict):
+    '''
+    Run app.generate(**kwargs_dict) in the process pool and wait for the result.
+    '''
+    cls = app.__class__
+
+    shared = dict((k, share_input(v)) for k, v in kwargs_dict.items() if isinstance(v, DataSet))
+    kwargs = dict(kwargs_dict, **dict((k, s) for k, (key, s) in shared.items()))
+    cancel = SharedFlag()
+    try:
+        future = pool().submit(_generate, cls.__module__, sys.modules[cls.__module__].__file__, cls.__name__, _config(app), kwargs, cancel)
+        for f in as_completed([future]):
+            result, name = f.result()
+    except threads.WorkerCancelled:
+        cancel.set()  # Stop the process at its next checkpoint
+        raise
+    finally:
+        for key, s in shared.values():
+            unshare_input(key)
+        cancel.release()
+
+    if name is not None:
+        app.set_name(name)
+
+    if isinstance(result, dict):
+        for k, v in list(result.items()):
+            if isinstance(v, SharedDataSet):
+                result[k] = v.get(db=app.m.db)
+                v.release()
+    return result
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+'''
+Execution profiling of tool generate() and prerender() calls.
+
+Every call records wall time, CPU time of the thread it ran on, peak memory allocated
+during the call and the shapes of the DataSets going in and out. Records are collected
+per run of the workflow (from going busy to going idle again; see WorkflowScheduler)
+in the main window's ProfileLog, which can be written out as a CSV or JSON report.
+
+Peak memory is traced with tracemalloc (numpy reports its allocations to it) when
+trace_memory is on: from the File menu, or by setting PATHOMX_TRACE_MEMORY=1 in the
+environment. Calls running at the same time share one peak, so for overlapping calls it
+is an upper bound.
+Work done in a worker process (generate_in_process tools) is not included in the CPU
+time or peak memory.
+'''
+from __future__ import unicode_literals
+
+import os
+import csv
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+from .data import DataSet
+from .threads import WorkerCancelled
+
+trace_memory = os.environ.get('PATHOMX_TRACE_MEMORY', '') not in ('', '0')  # Trace peak memory; adds overhead to allocation-heavy pure-Python code
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+_tracing = 0  # Profiled calls currently tracing
+
+FIELDS = ['run', 'tool', 'tool_id', 'kind', 'status', 'cached', 'started', 'wall', 'cpu', 'peak', 'inputs', 'outputs']
+
+
+class ProfileRecord(object):
+
+    def __init__(self, app, kind, inputs):
+        self.tool = app.name
+        self.tool_id = app.id
+        self.kind = kind  # 'generate', 'append', 'load' or 'prerender'
+        self.status = None  # 'done', 'error' or 'cancelled'
+        self.cached = False  # generate result came from the result cache
+        self.started = time.time()
+        self.wall = None  # seconds
+        self.cpu = None  # seconds
+        self.peak = None  # bytes; None if not traced
+        self.inputs = shapes(inputs)
+        self.outputs = {}
+        self.run = None
+
+    def as_dict(self):
+        return dict((f, getattr(self, f)) for f in FIELDS)
+
+    def label(self):
+        s = format_time(self.wall)
+        if self.cached:
+            s += ' (cached)'
+        elif self.status != 'done':
+            s += ' (%s)' % self.status
+        return s
+
+    def summary(self):
+        return '%s %s' % (self.kind, self.label())
+
+    def description(self):
+        lines = [self.summary(),
+                 'CPU %s' % format_time(self.cpu)]
+        if self.peak is not None:
+            lines.append('Peak memory %s' % format_bytes(self.peak))
+        for label, s in [('In', self.inputs), ('Out', self.outputs)]:
+            for k, shape in sorted(s.items()):
+                lines.append('%s %s: %s' % (label, k, format_shape(shape)))
+        return '\n'.join(lines)
+
+
+class ProfileLog(object):
+    '''
+    Profile records of the latest runs of the workflow (max_runs); safe to use from worker threads.
+    '''
+
+    def __init__(self, max_runs=20):
+        self.runs = deque(maxlen=max_runs)
+        self.run_count = 0
+        self.lock = threading.Lock()
+        self.new_run()
+
+    def new_run(self):
+        with self.lock:
+            if self.runs and not self.runs[-1]:
+                return  # Nothing recorded yet; carry on with it
+            self.run_count += 1
+            self.runs.append([])
+
+    def add(self, record):
+        with self.lock:
+            record.run = self.run_count
+            self.runs[-1].append(record)
+
+    def records(self, all_runs=False):
+        with self.lock:
+            if all_runs:
+                return [r for run in self.runs for r in run]
+            # The latest run with anything in it
+            return list(next((run for run in reversed(self.runs) if run), []))
+
+    def clear(self):
+        with self.lock:
+            self.runs.clear()
+            self.runs.append([])
+
+    def write(self, fn, all_runs=False):
+        # Format from the file extension: .json, otherwise CSV
+        records = self.records(all_runs)
+        if fn.lower().endswith('.json'):
+            with open(fn, 'w') as f:
+                json.dump([r.as_dict() for r in records], f, indent=1)
+            return
+
+        with open(fn, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for r in records:
+                d = r.as_dict()
+                d['started'] = datetime.fromtimestamp(r.started).isoformat()
+                d['inputs'] = '; '.join('%s=%s' % (k, format_shape(s)) for k, s in sorted(r.inputs.items()))
+                d['outputs'] = '; '.join('%s=%s' % (k, format_shape(s)) for k, s in sorted(r.outputs.items()))
+                writer.writerow([d[k] for k in FIELDS])
+
+
+def shapes(kwargs):
+    # Shapes of the DataSets in an input/result dict; one level of nesting for prerender results
+    s = {}
+    if isinstance(kwargs, dict):
+        for k, v in kwargs.items():
+            if isinstance(v, DataSet):
+                s[k] = list(v.data.shape)
+            elif isinstance(v, dict):
+                s.update(('%s.%s' % (k, kk), vv) for kk, vv in shapes(v).items())
+    return s
+
+
+def format_shape(shape):
+    return 'x'.join('%d' % n for n in shape)
+
+
+def format_time(t):
+    if t is None:
+        return '-'
+    return '%.0f ms' % (t * 1000) if t < 1 else '%.2f s' % t
+
+
+def format_bytes(n):
+    return '%.1f MB' % (n / (1024. * 1024.))
+
+
+def _trace_start():
+    global _tracing
+    if not trace_memory:
+        return None
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if _tracing == 0:
+            tracemalloc.reset_peak()
+        _tracing += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _trace_stop(base):
+    global _tracing
+    if base is None:
+        return None
+    with _trace_lock:
+        _tracing -= 1
+        peak = tracemalloc.get_traced_memory()[1]
+        if _tracing == 0:
+            tracemalloc.stop()  # No overhead between calls
+    return max(peak - base, 0)
+
+
+def current():
+    # Record of the profiled call running on this thread; None outside one
+    return getattr(_local, 'record', None)
+
+
+def profile(app, kind, fn, *args, **kwargs):
+    '''
+    Call fn(*args, **kwargs) for app, recording a ProfileRecord of the call in the main
+    window's ProfileLog and emitting it on app.profiled. Exceptions are recorded and re-raised.
+    '''
+    record = ProfileRecord(app, kind, kwargs)
+    previous, _local.record = current(), record
+    base = _trace_start()
+    t, c = time.perf_counter(), time.thread_time()
+    try:
+        result = fn(*args, **kwargs)
+        record.status = 'done'
+        record.outputs = shapes(result)
+        return result
+
+    except WorkerCancelled:
+        record.status = 'cancelled'
+        raise
+
+    except Exception:
+        record.status = 'error'
+        raise
+
+    finally:
+        record.wall = time.perf_counter() - t
+        record.cpu = time.thread_time() - c
+        record.peak = _trace_stop(base)
+        _local.record = previous
+
+        app.profile[kind] = record
+        app.m.profile_log.add(record)
+        app.profiled.emit(record)
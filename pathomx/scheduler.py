@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+class WorkflowScheduler(QObject):
+    '''
+    Coalesces regeneration of tools across the workflow.
+
+    A tool whose inputs or config change is marked dirty together with everything
+    downstream of it. Dirty tools are run once each, in topological order: a tool is
+    only started when none of its upstream tools are dirty or still running, so in
+    diamond-shaped workflows the bottom tool runs once, on fully updated inputs.
+    A tool that is marked while generating has that run cancelled and runs again.
+
+    Rows appended to a tool's input (DataManager.append) mark it as appended instead: once
+    its upstream tools are done it extends its results for the new rows (autogenerate_append),
+    and its descendants wait for the row-append it passes on. A tool marked both ways runs
+    in full.
+    '''
+
+    def __init__(self, parent, *args, **kwargs):
+        super(WorkflowScheduler, self).__init__(*args, **kwargs)
+
+        self.m = parent
+
+        self.dirty = set()
+        self.appended = {}  # tool: input interfaces with rows appended; empty while waiting on upstream
+        self.running = set()
+        self._run_pending = False
+
+    def upstream(self, app):
+        return set(dso.manager.v for dso in app.data.i.values() if dso and dso.manager)
+
+    def downstream(self, app):
+        return set(manager.v for watchers in app.data.watchers.values() for manager in watchers)
+
+    def mark_dirty(self, app):
+        # Mark the tool and all its descendants; the run is deferred to the event loop so
+        # changes arriving together are handled in one pass
+        if not self.busy():
+            self.m.profile_log.new_run()
+
+        stack = [app]
+        while stack:
+            a = stack.pop()
+            if a not in self.dirty:
+                self.dirty.add(a)
+                stack.extend(self.downstream(a))
+                if a in self.running:
+                    a.cancel_generate()  # Working on stale inputs; runs again once it stops
+
+        if not self._run_pending:
+            self._run_pending = True
+            QTimer.singleShot(0, self.run)
+
+    def mark_appended(self, app, interface):
+        if not self.busy():
+            self.m.profile_log.new_run()
+
+        self.appended.setdefault(app, set()).add(interface)
+        stack = list(self.downstream(app))
+        while stack:
+            a = stack.pop()
+            if a not in self.appended:
+                self.appended[a] = set()  # Waits for what app passes on; nothing to do if that's nothing
+                stack.extend(self.downstream(a))
+
+        if not self._run_pending:
+            self._run_pending = True
+            QTimer.singleShot(0, self.run)
+
+    def busy(self):
+        return bool(self.dirty or self.appended or self.running or self._run_pending)
+
+    def started(self, app):
+        # A tool running outside the scheduler (e.g. importing a file); its descendants wait for it
+        if not self.busy():
+            self.m.profile_log.new_run()
+        self.running.add(app)
+
+    def finished(self, app):
+        self.running.discard(app)
+        self.run()
+
+    def run(self):
+        self._run_pending = False
+        self.dirty &= set(self.m.apps)  # Drop deleted tools
+        for a in list(self.appended.keys()):
+            if a in self.dirty or a not in self.m.apps:
+                del self.appended[a]  # Runs in full
+
+        pending = self.dirty | set(self.appended.keys())
+        blocked = pending | self.running
+        ready = [a for a in pending if a not in self.running and not (self.upstream(a) & blocked)]
+        if not ready and pending and not self.running:
+            ready = [a for a in pending]  # Circular links; no order to keep
+
+        skipped = False
+        for app in ready:
+            self.dirty.discard(app)
+            interfaces = self.appended.pop(app, None)
+            if interfaces is not None and not interfaces:
+                skipped = True  # Nothing was appended to its inputs after all
+                continue
+
+            self.running.add(app)
+            if not (app.autogenerate() if interfaces is None else app.autogenerate_append(interfaces)):
+                self.running.discard(app)  # Paused or nothing to run
+                self.run()
+                return
+
+        if skipped:
+            self.run()  # Tools waiting on those may be ready now
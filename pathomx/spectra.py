@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+'''
+Processing of spectra (rows of a DataSet's data) shared by the spectral plugins.
+
+Binning: the bin of each point on the scale is worked out once (bin_index, or
+intelligent_bin_index for bins fitted to the peaks) and all spectra are then reduced
+together, in blocks of rows (bin_spectra).
+
+Phase correction: objectives are evaluated for many spectra (rows) at once, and
+autophase_batch refines the phase of every spectrum together from a shared starting
+estimate, PHASE_BLOCK spectra at a time.
+'''
+from __future__ import unicode_literals
+
+import numpy as np
+import scipy.optimize
+
+from . import threads
+from .data import chunks, scratch_array
+
+
+def bin_index(scale, edges):
+    '''
+    Bin of each point on scale, for bins between consecutive (ascending) edges; -1 outside
+    the edges. As np.histogram, the last bin includes its upper edge.
+    '''
+    scale = np.asarray(scale, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    idx = np.searchsorted(edges, scale, side='right') - 1
+    idx[scale == edges[-1]] = len(edges) - 2
+    idx[(scale < edges[0]) | (scale > edges[-1])] = -1
+    return idx
+
+
+def bin_spectra(data, idx, n, out=None):
+    '''
+    Mean of each row of data (spectra) within each of n bins, by the bin index of each
+    column (bin_index; -1 to leave out). Empty bins are NaN, as are all bins when no
+    column falls in one.
+
+    Columns are put in bin order once, which for a monotonic scale is a slice of the data
+    (no copy), and each block of rows is then reduced with a single np.add.reduceat.
+    '''
+    idx = np.asarray(idx)
+    cols = np.flatnonzero(idx >= 0)
+    counts = np.bincount(idx[cols], minlength=n)
+
+    if out is None:
+        out = scratch_array((data.shape[0], n))
+    if not len(cols):
+        out[:] = np.nan
+        return out
+
+    step = np.diff(idx[cols])
+    contiguous = cols[-1] - cols[0] + 1 == len(cols)
+    if contiguous and (step >= 0).all():
+        cols = slice(cols[0], cols[-1] + 1)
+    elif contiguous and (step <= 0).all():
+        cols = slice(cols[-1], cols[0] - 1 if cols[0] else None, -1)  # Descending scale (ppm)
+    else:
+        cols = cols[np.argsort(idx[cols], kind='mergesort')]
+
+    nonempty = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts[nonempty])[:-1]])
+
+    out[:, counts == 0] = np.nan
+    for s in chunks(data):
+        threads.checkpoint()
+        out[s[0], nonempty] = np.add.reduceat(data[s][:, cols], starts, axis=1) / counts[nonempty]
+    return out
+
+
+def uniform_bin_edges(scale, size, offset=0):
+    lo, hi = np.min(scale), np.max(scale)
+    return np.arange(lo + offset, hi + offset, size)
+
+
+def parse_bin_edges(s):
+    # Variable-width bin edges (ppm) entered as text, separated by commas or whitespace
+    return np.unique([float(x) for x in s.replace(',', ' ').split()])
+
+
+def intelligent_bin_index(ref, scale, resolution):
+    '''
+    Adaptive ('intelligent') bins from a reference spectrum, after De Meyer et al. (2008)
+    10.1021/ac7025964: bins are split recursively at the local minimum that best separates
+    peaks, while the split raises the total bin value (peak height over the bin ends) by
+    more than the noise and both halves stay at least resolution (ppm) wide.
+    Returns (bin index of each point, number of bins).
+    '''
+    ref = np.asarray(ref, dtype=float)
+    points = len(ref)
+    min_width = max(1, int(np.ceil(resolution / np.abs(np.median(np.diff(scale))))))
+    noise = 3 * 1.4826 * np.median(np.abs(np.diff(ref))) / np.sqrt(2)  # 3 SD, robust estimate
+
+    minima = np.zeros(points, dtype=bool)
+    minima[1:-1] = (ref[1:-1] <= ref[:-2]) & (ref[1:-1] <= ref[2:])
+
+    cuts = []
+    stack = [(0, points)]
+    while stack:
+        a, b = stack.pop()
+        k = np.flatnonzero(minima[a + min_width:b - min_width]) + a + min_width
+        if not len(k):
+            continue
+
+        r = ref[a:b]
+        value = r.max() - (r[0] + r[-1]) / 2
+        # Value of each candidate split: total of the two halves' values
+        left = np.maximum.accumulate(r)[k - a] - (r[0] + ref[k]) / 2
+        right = np.maximum.accumulate(r[::-1])[::-1][k - a] - (ref[k] + r[-1]) / 2
+        split = left + right
+
+        best = np.argmax(split)
+        if split[best] - value > noise:
+            cuts.append(k[best])
+            stack.extend([(a, k[best]), (k[best], b)])
+
+    cuts = np.sort(cuts)
+    return np.searchsorted(cuts, np.arange(points), side='right'), len(cuts) + 1
+
+
+# Phase correction
+PHASE_STEP = 8.  # Initial step of the phase refinement (degrees)
+PHASE_TOLERANCE = 0.05  # Step at which refinement stops (degrees)
+PHASE_MAX_STEPS = 400  # Limit on refinement steps; as for fmin, a spectrum stays near its starting phase
+PHASE_BLOCK = 64  # Spectra refined at a time, to bound memory for full-width objectives
+PEAK_MINIMA_WIDTH = 100  # Points either side of the largest peak compared by Peak_minima
+
+
+def phase_ramp(points):
+    return np.arange(points) / float(points)
+
+
+def phase(s, ramp, p0, p1):
+    # Spectra s (rows) phased by p0 + p1 * ramp degrees, as ng.proc_base.ps; p0, p1 per row
+    return s * np.exp(1j * np.deg2rad(np.reshape(p0, (-1, 1)) + np.reshape(p1, (-1, 1)) * ramp))
+
+
+def peak_window(s, width=PEAK_MINIMA_WIDTH):
+    # Points either side of the largest peak of each spectrum (rows), with their phase ramp.
+    # The peak is found on the magnitude, which does not change with the phase
+    points = s.shape[1]
+    i = np.argmax(np.abs(s), axis=1)
+    idx = np.clip(i[:, None] + np.arange(-width, width), 0, points - 1)
+    return np.take_along_axis(s, idx, axis=1), phase_ramp(points)[idx]
+
+
+def acme(s):
+    # Based on the ACME algorithm by Chen Li et al. Journal of Magnetic Resonance 158 (2002) 164–168
+    # Entropy of the first derivative, with a penalty on negative intensities; per row of s (real)
+    ds1 = np.abs((s[:, 2:] - s[:, :-2]) / 2.)
+    # Entropy of p1 = ds1 / sum(ds1), as log(sum) - sum(ds1 log ds1) / sum; 0 log 0 = 0
+    total = np.sum(ds1, axis=1)
+    h1 = np.log(total) - np.sum(ds1 * np.log(np.where(ds1 == 0, 1, ds1)), axis=1) / total
+    return h1 + 1000 * np.sum(np.minimum(s, 0) ** 2, axis=1)
+
+
+def peak_minima(w, width=PEAK_MINIMA_WIDTH):
+    # Difference between the minima either side of the largest peak; per row of w (real, from peak_window).
+    # The peak itself must be positive (it is the maximum of the phased spectrum)
+    peak = w[:, width]
+    return np.abs(np.min(w[:, :width], axis=1) - np.min(w[:, width:], axis=1)) + np.abs(peak) - peak
+
+
+def autophase_batch(spectra, pc_init=None, algorithm='Peak_minima'):
+    '''
+    Phase correct spectra (rows, complex) together. Without pc_init, a shared estimate
+    is found first by optimising the summed objective of a sample of the spectra. Each
+    spectrum is then refined from it by a compass search, run on blocks of spectra at once:
+    every step tries p0 and p1 either side of the current phase, widening the step of
+    spectra that improve and narrowing it for those that don't. Moves rotate the currently
+    phased spectra rather than phasing from scratch.
+    Returns the phased spectra and the phase correction (p0, p1) of each.
+
+    Peak_minima only compares the region around the largest peak, where p1 can't be told
+    apart from p0, so only p0 is optimised; p1 keeps its starting value.
+    '''
+    n, points = spectra.shape
+    if algorithm == 'Peak_minima':
+        s, ramp = peak_window(spectra)  # Only the region around the peak is compared
+        objective, fit_p1 = peak_minima, False
+    else:
+        s, ramp = spectra, phase_ramp(points).reshape(1, -1)
+        objective, fit_p1 = {'ACME': acme}[algorithm], True
+
+    if pc_init is None:
+        sample = np.unique(np.linspace(0, n - 1, min(n, 8)).astype(int))
+        sramp = ramp if len(ramp) == 1 else ramp[sample]
+        fn = lambda x: np.sum(objective(np.real(phase(s[sample], sramp, x[0], x[1] if fit_p1 else 0))))
+        pc_init = scipy.optimize.fmin(fn, x0=[0, 0] if fit_p1 else [0], disp=False)
+        pc_init = [pc_init[0], pc_init[1] if fit_p1 else 0]
+
+    pc = np.tile(np.asarray(pc_init, dtype=float), (n, 1))
+    for b in range(0, n, PHASE_BLOCK):
+        r = slice(b, b + PHASE_BLOCK)
+        pc[r] = _refine_phase(s[r], ramp if len(ramp) == 1 else ramp[r], pc[r], objective, fit_p1)
+
+    return phase(spectra, phase_ramp(points), pc[:, 0], pc[:, 1]), pc
+
+
+def _refine_phase(s, ramp, pc, objective, fit_p1=True):
+    # Compass search for autophase_batch on a block of spectra
+    z = phase(s, ramp, pc[:, 0], pc[:, 1])  # Phased at the current pc
+    value = objective(np.real(z))
+    step = np.full(len(s), PHASE_STEP)
+
+    # p1 is moved about the intensity-weighted centre of each spectrum, so the phase
+    # there stays put; this takes out most of the correlation between p0 and p1
+    a = np.abs(s)
+    pivot = np.sum(a * ramp, axis=1) / np.sum(a, axis=1)
+
+    active = np.arange(len(s))
+    for i in range(PHASE_MAX_STEPS):
+        if not len(active):
+            break
+
+        threads.checkpoint()
+        za, d = z[active], np.deg2rad(step[active])
+
+        # Rotations for p0 + step, p0 - step, p1 + step, p1 - step
+        rotations = [np.exp(1j * d)[:, None], np.exp(-1j * d)[:, None]]
+        if fit_p1:
+            r1 = np.exp(1j * d[:, None] * ((ramp if len(ramp) == 1 else ramp[active]) - pivot[active, None]))
+            rotations += [r1, np.conj(r1)]
+        values = np.array([objective(np.real(za * rot)) for rot in rotations])
+        best = np.argmin(values, axis=0)
+        improved = values[best, np.arange(len(active))] < value[active]
+
+        for m, rot in enumerate(rotations):
+            moved = improved & (best == m)
+            if moved.any():
+                rows = active[moved]
+                z[rows] = za[moved] * rot[moved]
+                value[rows] = values[m, moved]
+                move = step[rows] * (1 if m % 2 == 0 else -1)
+                pc[rows, m // 2] += move
+                if m >= 2:
+                    pc[rows, 0] -= move * pivot[rows]
+
+        step[active[improved]] *= 2  # Speed up while moving; back down when not
+        step[active[~improved]] /= 4
+        active = active[step[active] > PHASE_TOLERANCE]
+
+    return pc
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+Synonym index for resolving labels (metabolite names, gene ids, database references) to
+database entities in bulk.
+
+Labels are matched in turn by:
+
+- exact synonym, as databaseManager.synrev or synrev_by_type (the label, then in lower case)
+- normalised synonym: case-folded, Greek letters spelt out (α -> alpha), accents dropped
+  and anything but letters and digits removed, so e.g. 'D-Glucose 6-phosphate' and
+  'd-glucose-6-phosphate' match, as do 'α-D-glucose' and 'alpha-D-glucose'
+- fuzzy: the normalised synonyms sharing the most trigrams (runs of three characters)
+  with the label, scored by their Dice coefficient. Most trigrams of the longer of the two
+  must be shared (MIN_COVERAGE), so a short label isn't matched to longer names containing
+  it: 'Glucose' shares 6 of the 9 trigrams of 'glucose6p', though their Dice is 0.75
+
+For a whole list of labels the fuzzy scores are one sparse matrix product, of the
+labels' trigrams with the synonyms' trigrams.
+'''
+from __future__ import unicode_literals
+
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import scipy.sparse as sp
+
+# Greek letters to their names; after NFKC, which also maps e.g. the micro sign to mu
+GREEK = dict(
+    (c, unicodedata.name(chr(c)).split(' ')[-1].lower())
+    for c in range(0x03b1, 0x03ca) if unicodedata.name(chr(c), '').startswith('GREEK SMALL LETTER')
+)
+GREEK[0x03c2] = 'sigma'  # Final sigma
+
+_strip = re.compile(r'[\W_]+', re.UNICODE)
+
+CHUNK_LABELS = 2000  # Labels scored per matrix product, to bound the size of the product
+MIN_COVERAGE = 0.7  # Fraction of the trigrams of the longer of a label and synonym that must be shared
+
+
+def normalise(label):
+    s = unicodedata.normalize('NFKC', label).lower().translate(GREEK)
+    s = ''.join(c for c in unicodedata.normalize('NFKD', s) if not unicodedata.combining(c))
+    return _strip.sub('', s)
+
+
+def trigrams(key):
+    key = ' %s ' % key
+    return set(key[n:n + 3] for n in range(len(key) - 2))
+
+
+class SynonymIndex(object):
+    '''
+    Index of the synonyms in synrev and synrev_by_type (synonym: entity), for resolve_many.
+    '''
+
+    def __init__(self, synrev, synrev_by_type):
+        self.synrev = synrev
+        self.synrev_by_type = synrev_by_type
+
+        # Normalised synonym: entities, in the order first seen
+        entities = defaultdict(list)
+        for lookup in [synrev] + list(synrev_by_type.values()):
+            for synonym, e in lookup.items():
+                key = normalise(synonym)
+                if key and e not in entities[key]:
+                    entities[key].append(e)
+
+        self.keys = list(entities.keys())
+        self.key_index = dict((k, n) for n, k in enumerate(self.keys))
+        self.entities = [entities[k] for k in self.keys]
+
+        # Synonym x trigram incidence
+        self.vocabulary = {}
+        indices, indptr = [], [0]
+        for k in self.keys:
+            indices.extend(self.vocabulary.setdefault(t, len(self.vocabulary)) for t in trigrams(k))
+            indptr.append(len(indices))
+        self.trigram_keys = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(self.keys), len(self.vocabulary))).T.tocsr()
+        self.key_lengths = np.diff(indptr)
+
+    def exact(self, label, type=None):
+        lookups = [self.synrev] if type is None else [self.synrev_by_type.get(type, {}), self.synrev]
+        for lookup in lookups:
+            for s in (label, label.lower()):
+                e = lookup.get(s)
+                if e is not None and (type is None or e.type == type):
+                    return [e]
+        return []
+
+    def normalised(self, label, type=None):
+        n = self.key_index.get(normalise(label))
+        if n is None:
+            return []
+        return [e for e in self.entities[n] if type is None or e.type == type]
+
+    def resolve_many(self, labels, type=None, fuzzy=True, limit=5, threshold=0.6):
+        '''
+        Resolve each of labels to a list of up to limit (entity, score) candidates, best first.
+        Exact and normalised matches score 1; fuzzy matches (if none of those) score their
+        trigram similarity, from threshold to 1. type limits the candidates to entities of a
+        type ('compound', 'gene', 'protein', ...). Labels with no match give an empty list.
+        '''
+        results = []
+        unmatched = []
+        for n, label in enumerate(labels):
+            if not label:
+                results.append([])
+                continue
+
+            candidates = self.exact(label, type)
+            candidates.extend(e for e in self.normalised(label, type) if e not in candidates)
+            results.append([(e, 1.) for e in candidates[:limit]])
+            if not candidates and fuzzy:
+                unmatched.append(n)
+
+        for s in range(0, len(unmatched), CHUNK_LABELS):
+            chunk = unmatched[s:s + CHUNK_LABELS]
+            for n, candidates in zip(chunk, self.fuzzy([labels[n] for n in chunk], type, limit, threshold)):
+                results[n] = candidates
+
+        return results
+
+    def fuzzy(self, labels, type, limit, threshold):
+        # Label x trigram incidence; trigrams no synonym has still count to a label's length
+        lengths = []
+        indices, indptr = [], [0]
+        for label in labels:
+            t = trigrams(normalise(label))
+            lengths.append(len(t))
+            indices.extend(self.vocabulary[g] for g in t if g in self.vocabulary)
+            indptr.append(len(indices))
+        label_trigrams = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(labels), len(self.vocabulary)))
+
+        # Trigrams shared by each label and synonym, as their Dice coefficient
+        shared = (label_trigrams * self.trigram_keys).tocsr()
+        rows = np.repeat(np.arange(len(labels)), np.diff(shared.indptr))
+        label_lengths, key_lengths = np.asarray(lengths)[rows], self.key_lengths[shared.indices]
+        scores = 2 * shared.data / (label_lengths + key_lengths)
+
+        keep = (scores >= threshold) & (shared.data >= MIN_COVERAGE * np.maximum(label_lengths, key_lengths))
+        rows, keys, scores = rows[keep], shared.indices[keep], scores[keep]
+        order = np.lexsort((-scores, rows))  # By label, best first
+        rows, keys, scores = rows[order], keys[order], scores[order]
+
+        results = [[] for label in labels]
+        for r, k, score in zip(rows.tolist(), keys.tolist(), scores.tolist()):
+            candidates = results[r]
+            for e in self.entities[k]:
+                if len(candidates) < limit and (type is None or e.type == type) and e not in [c for c, s in candidates]:
+                    candidates.append((e, score))
+        return results
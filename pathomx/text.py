@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+Reading DataSets from delimited (comma or tab separated) text files.
+
+Text files are read in blocks of lines of about CHUNK_BYTES. The numeric cells of each
+block are parsed together by np.loadtxt and written straight into the (file-mapped if
+large) data array of the DataSet, so no Python float is made per cell and the file is
+never held as lists.
+'''
+from __future__ import unicode_literals
+
+import os
+import csv
+
+import numpy as np
+
+from . import threads
+from .data import DataSet, CHUNK_BYTES
+
+
+def count_lines(filename):
+    # Upper bound on the number of lines (rows) of the file, for preallocating the data
+    n, last = 0, b'\n'
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b''):
+            n += block.count(b'\n')
+            last = block[-1:]
+    return n + (last != b'\n')
+
+
+def text_delimiter(filename, line):
+    # Comma for .csv, tab for .tsv; otherwise tab if the header has any
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.csv', '.tsv'):
+        return ',' if ext == '.csv' else '\t'
+    return '\t' if '\t' in line else ','
+
+
+def read_blocks(f):
+    # Blocks of non-blank lines of about CHUNK_BYTES
+    while True:
+        lines = f.readlines(CHUNK_BYTES)
+        if not lines:
+            return
+        lines = [l for l in lines if not l.isspace()]
+        if lines:
+            yield lines
+
+
+def split_fields(line, delimiter, n):
+    # First n fields of a line, and the rest unsplit; csv only for quoted lines
+    if line.startswith('"'):
+        row = next(csv.reader([line], delimiter=delimiter))
+        return row[:n]
+    return line.rstrip('\r\n').split(delimiter, n)[:n]
+
+
+def parse_block(lines, delimiter, usecols):
+    '''
+    Numeric cells of lines in columns usecols, as a 2d float array. Cells that aren't
+    numbers (blank or text) are read as 0.
+    '''
+    try:
+        return np.loadtxt(lines, delimiter=delimiter, usecols=usecols, quotechar='"', comments=None, ndmin=2)
+    except ValueError:
+        # Something other than a number in the block; cell by cell
+        out = np.zeros((len(lines), len(usecols)))
+        for n, row in enumerate(csv.reader(lines, delimiter=delimiter)):
+            for m, c in enumerate(usecols):
+                try:
+                    out[n, m] = float(row[c])
+                except (ValueError, IndexError):
+                    pass
+        return out
+
+
+def scales_and_labels(names):
+    # Variables named by a number (e.g. ppm) have that as their scale, others as their label
+    try:
+        return np.array(names, dtype=float), [None] * len(names)
+    except ValueError:
+        pass
+
+    scales, labels = [], []
+    for m in names:
+        try:
+            scales.append(float(m))
+            labels.append(None)
+        except ValueError:
+            scales.append(None)
+            labels.append(m)
+    return scales, labels
+
+
+def read_columns(filename, delimiter=',', progress=None):
+    '''
+    DataSet of a text file with samples in columns and variables (e.g. metabolites) in rows:
+    sample names on the first row, their classes ('.' to leave the sample out) on the second,
+    then a row per variable of its name and values. progress is called with the fraction read.
+    '''
+    fsize = os.path.getsize(filename)
+    rows = count_lines(filename)
+
+    with open(filename, encoding='utf-8-sig', errors='replace') as f:
+        reader = csv.reader(iter(f.readline, ''), delimiter=delimiter)
+        samples = next(reader)[1:]  # Top row: sample no's
+        classesa = next(reader)[1:]  # 2nd row: classes; '.' to exclude the sample
+        keep = [n for n, c in enumerate(classesa) if c != '.']
+        usecols = [n + 1 for n in keep]
+
+        # Samples are columns of the file and rows of the data; metabolites are filled in a block at a time
+        dso = DataSet(size=(len(keep), max(rows - 2, 0)))
+        metabolites = []
+        read = 0
+        for lines in read_blocks(f):
+            threads.checkpoint()
+            block = parse_block(lines, delimiter, usecols)
+            dso.data[:, len(metabolites):len(metabolites) + len(lines)] = block.T
+            metabolites.extend(split_fields(l, delimiter, 1)[0] for l in lines)
+
+            read += sum(len(l) for l in lines)
+            if progress:
+                progress(float(read) / fsize)
+
+    if len(metabolites) < dso.data.shape[1]:
+        dso.crop((len(keep), len(metabolites)))  # Blank lines
+
+    scales, mlabels = scales_and_labels(metabolites)
+
+    dso.labels[0] = [samples[n] for n in keep]
+    dso.classes[0] = [classesa[n] for n in keep]
+
+    dso.scales[1] = scales
+    dso.labels[1] = mlabels
+
+    return dso
+
+def read_rows(filename, delimiter=',', progress=None):
+    '''
+    DataSet of a text file with samples in rows and variables in columns: variable names on
+    the first row (after two cells), then a row per sample of its name, class ('.' to leave
+    the sample out) and values. progress is called with the fraction read.
+    '''
+    fsize = os.path.getsize(filename)
+    rows = count_lines(filename)
+
+    with open(filename, encoding='utf-8-sig', errors='replace') as f:
+        hrow = next(csv.reader([f.readline()], delimiter=delimiter))  # Get top row
+        metabolites = hrow[2:]
+        usecols = list(range(2, len(hrow)))
+
+        # Spectra are written straight into the (file-mapped if large) data, a block of rows at a time
+        dso = DataSet(size=(max(rows - 1, 0), len(metabolites)))
+        samples = []
+        classes = []
+        read = 0
+        for lines in read_blocks(f):
+            threads.checkpoint()
+            dso.data[len(samples):len(samples) + len(lines)] = parse_block(lines, delimiter, usecols)
+            for l in lines:
+                sample, cls = (split_fields(l, delimiter, 2) + ['', ''])[:2]
+                samples.append(sample)
+                classes.append(cls)
+
+            read += sum(len(l) for l in lines)
+            if progress:
+                progress(float(read) / fsize)
+
+    if len(samples) < dso.data.shape[0]:
+        dso.crop((len(samples), len(metabolites)))  # Blank lines
+
+    dso.labels[0] = samples
+    dso.classes[0] = classes
+
+    keep = [n for n, c in enumerate(classes) if c != '.']  # Skip excluded classes
+    if len(keep) < len(samples):
+        dso.select(0, keep)
+
+    scales, mlabels = scales_and_labels(metabolites)
+    dso.scales[1] = scales
+    dso.labels[1] = mlabels
+
+    return dso
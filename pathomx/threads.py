@@ -4,8 +4,68 @@ from __future__ import unicode_literals
 # Import PyQt5 classes
 from PyQt5.QtCore import Qt, QObject, QRunnable, pyqtSignal, pyqtSlot
 import sys
+import threading
 import traceback
 
+_local = threading.local()
+
+
+class WorkerCancelled(Exception):
+    '''
+    Raised at a checkpoint in a worker whose run has been cancelled.
+    '''
+    pass
+
+
+class CancellationToken(object):
+    '''
+    Cooperative cancellation flag for a Worker.
+
+    Cancelling does not stop the callback; long-running code polls it at checkpoints
+    (see checkpoint), and a cancelled worker's result is dropped.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise WorkerCancelled()
+
+
+def current_token():
+    # Token of the worker running on this thread; None outside workers
+    return getattr(_local, 'token', None)
+
+
+def run_with_token(token, callback, *args, **kwargs):
+    '''
+    Call callback with token as the current token, for code cancelled from outside a Worker
+    (e.g. generate in a worker process; see processes.py).
+    '''
+    previous, _local.token = current_token(), token
+    try:
+        return callback(*args, **kwargs)
+    finally:
+        _local.token = previous
+
+
+def checkpoint():
+    '''
+    Stop here if the worker running this code has been cancelled; call from long loops.
+    '''
+    token = current_token()
+    if token is not None:
+        token.check()
+
+
 
 class WorkerSignals(QObject):
     '''
@@ -44,6 +104,9 @@ class Worker(QRunnable):
     :param args: Arguments to pass to the callback function
     :param kwargs: Keywords to pass to the callback function
 
+    Call cancel() to supersede the run: the callback stops at its next checkpoint() and
+    no result is emitted. finished is always emitted.
+
     '''
 
     def __init__(self, callback, *args, **kwargs):
@@ -53,6 +116,10 @@ class Worker(QRunnable):
         self.args = args
         self.kwargs = kwargs
         self.signals = WorkerSignals()
+        self.token = CancellationToken()
+
+    def cancel(self):
+        self.token.cancel()
 
     @pyqtSlot()
     def run(self):
@@ -61,15 +128,23 @@ class Worker(QRunnable):
         '''
 
         # Retrieve args/kwargs here; and fire processing using them
+        _local.token = self.token
         try:
+            self.token.check()  # Superseded while queued
             result = self.callback(*self.args, **self.kwargs)
+        except WorkerCancelled:
+            pass
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         else:
-            self.signals.result.emit(result)  # Return the result of the processing
+            # Only dict results can be emitted; others (e.g. None from a callback run for its
+            # side effects, as databaseManager.preload) are dropped
+            if not self.token.cancelled and isinstance(result, dict):
+                self.signals.result.emit(result)  # Return the result of the processing
         finally:
+            _local.token = None
             self.signals.finished.emit()  # Done
 
     # Stub to be over-wridden on subclass
@@ -16,6 +16,7 @@ import os
 import copy
 import re
 import json
+import hashlib
 import importlib
 import sys
 import numpy as np
@@ -23,6 +24,8 @@ from . import utils
 from . import data
 from . import config
 from . import threads
+from . import processes
+from . import profiling
 from .data import DataSet
 
 from .views import HTMLView, StaticHTMLView, ViewManager, MplSpectraView, TableView
@@ -564,9 +567,14 @@ class GenericApp(QMainWindow):
     available to add further additional defaults (e.g. data tables, views, etc.)
     """
     help_tab_html_filename = None
+    cache_results = False  # Reuse results for repeated inputs/config; only for tools without side-effects in generate
+    generate_in_process = False  # Run generate in a worker process; see processes.py for what generate can use
+    supports_append = False  # Can extend its results for rows appended to an input; see generate_append
+    copy_inputs = False  # Give generate private copies of its DataSet inputs, for tools that write to them in place
     status = pyqtSignal(str)
     progress = pyqtSignal(float)
     complete = pyqtSignal()
+    profiled = pyqtSignal(object)  # profiling.ProfileRecord of each generate/prerender call
 
     nameChanged = pyqtSignal(str)
 
@@ -583,6 +591,12 @@ class GenericApp(QMainWindow):
         self._pause_analysis_flag = False
         self._latest_dock_widget = None
         self._latest_generator_result = None
+        self._latest_exception = None
+        self._generate_worker = None  # Latest generate run; earlier runs are cancelled
+        self.prerender_worker = None
+        self.generated_hash = None  # generate_hash of the inputs/config the current outputs came from
+        self.generated_rows = {}  # input: rows of the input the current outputs came from
+        self.profile = {}  # kind: latest profiling.ProfileRecord
         self._auto_consume_data = auto_consume_data
 
         self.data = data.DataManager(self.m, self)
@@ -626,7 +640,8 @@ class GenericApp(QMainWindow):
 
     def finalise(self):
 
-        self.data.source_updated.connect(self.autogenerate)  # Auto-regenerate if the source data is modified
+        self.data.source_updated.connect(self.schedule_generate)  # Auto-regenerate if the source data is modified
+        self.data.source_appended.connect(self.schedule_append)  # or extend if rows were only appended
         if self._auto_consume_data:
             self.data.consume_any_of(self.m.datasets[::-1])  # Try consume any dataset; work backwards
         self.config.updated.connect(self.autoconfig)  # Auto-regenerate if the configuration changes
@@ -651,7 +666,7 @@ class GenericApp(QMainWindow):
 
     def autoconfig(self, signal):
         if signal == config.RECALCULATE_ALL or self._latest_generator_result == None:
-            self.autogenerate()
+            self.schedule_generate()
 
         elif signal == config.RECALCULATE_VIEW:
             self.autoprerender(self._latest_generator_result)
@@ -662,7 +677,35 @@ class GenericApp(QMainWindow):
             return False
 
         self.views.autoSelect()  # Unfocus the help file if we've done something here
-        self.thread_generate()
+        return self.thread_generate()
+
+    def schedule_generate(self, *args, **kwargs):
+        # Regenerate through the workflow scheduler; runs once, after any upstream tools have updated
+        self.m.scheduler.mark_dirty(self)
+
+    def schedule_append(self, interface, start):
+        # Rows appended to an input; tools that can extend their results for the new rows
+        # do so once upstream tools have updated (see autogenerate_append)
+        if self.supports_append:
+            self.m.scheduler.mark_appended(self, interface)
+        else:
+            self.schedule_generate()
+
+    def autogenerate_append(self, interfaces):
+        if self._pause_analysis_flag or not self.can_append(interfaces):
+            return self.autogenerate()
+
+        self.views.autoSelect()
+        return self.thread_generate_append(list(interfaces)[0])
+
+    def can_append(self, interfaces):
+        # Results are extended for rows appended to a single input since they were generated
+        if not self.supports_append or self._latest_generator_result is None or len(interfaces) != 1:
+            return False
+
+        interface = list(interfaces)[0]
+        dso = self.data.i.get(interface)
+        return interface in self.generated_rows and dso is not None and dso.data.shape[0] > self.generated_rows[interface]
 
     def thread_generate(self):
         # Automatically trigger generator using inputs
@@ -671,29 +714,193 @@ class GenericApp(QMainWindow):
             kwargs_dict[i] = self.data.get(i)  # Will be 'None' if not available
 
         self.progress.emit(0.)
-        self.worker = threads.Worker(self.generate, **kwargs_dict)
+        self.cancel_generate()  # Superseded; its result is dropped
+        self.generated_rows = {}  # Until this run completes, the outputs can't be extended
+        self.worker = threads.Worker(self._generate_run, 'generate', self._generate_copy_on_write, **kwargs_dict)
+        self.worker.signals.finished.connect(lambda w=self.worker: self._generate_finished_callback(w))
+        self._generate_worker = self.worker
         self.start_worker_thread(self.worker, callback=self._generate_worker_result_callback)
+        return True
+
+    def thread_generate_append(self, interface):
+        # As thread_generate, extending the latest results with generate_append
+        kwargs_dict = {}
+        for i in list(self.data.i.keys()):
+            kwargs_dict[i] = self.data.get(i)
+
+        start = self.generated_rows[interface]
+        previous = self._latest_generator_result
+
+        self.progress.emit(0.)
+        self.cancel_generate()
+        self.generated_rows = {}
+        self.worker = threads.Worker(self._generate_run, 'append', self._generate_append, previous, start, **kwargs_dict)
+        self.worker.signals.finished.connect(lambda w=self.worker: self._generate_finished_callback(w))
+        self._generate_worker = self.worker
+        self.start_worker_thread(self.worker, callback=self._generate_worker_result_callback)
+        return True
+
+    def cancel_generate(self):
+        if self._generate_worker is not None:
+            self._generate_worker.cancel()
+
+    def checkpoint(self):
+        '''
+        Stop generate here if it has been superseded by a newer run; call from long loops.
+        '''
+        threads.checkpoint()
+
+    def _generate_run(self, kind, fn, *args, **kwargs):
+        '''
+        Run fn(run, *args, **kwargs) on the worker, profiled as kind. fn fills run with the state
+        of this run: 'hash' (generate_hash; None for results of generate_append) and 'rows'
+        (input_rows) of the inputs the result comes from, and 'appended' (output: first new row) for outputs that only gained rows.
+
+        The state travels with the result to _generate_worker_result_callback rather than on
+        the tool, where a superseded run still finishing could overwrite that of the latest.
+        '''
+        run = {'hash': None, 'rows': {}, 'appended': {}}
+        result = profiling.profile(self, kind, fn, run, *args, **kwargs)
+        return dict(run, result=result)
+
+    def _generate_copy_on_write(self, run, **kwargs):
+        '''
+        Run generate on the copy-on-write input views from DataManager.get.
+
+        Input data is shared read-only with the upstream tool, so a generator that writes
+        to its input in place fails with numpy's read-only ValueError. Tools that write to
+        their inputs call as_copy() on them in generate, or set copy_inputs to be given
+        private copies of every DataSet input.
+
+        For tools that set cache_results, results are kept in the main window's result cache
+        under generate_hash, so returning to an earlier input/config state doesn't run
+        generate again.
+        '''
+        run['hash'] = self.generate_hash(kwargs)
+        run['rows'] = self.input_rows(kwargs)
+        run['appended'] = {}
+        if self.cache_results:
+            result = self.m.result_cache.get(run['hash'])
+            if result is not None:
+                profiling.current().cached = True
+                return result  # Same inputs and config as an earlier run
+
+        if self.copy_inputs:
+            kwargs = {k: v.as_copy() if isinstance(v, DataSet) else v for k, v in kwargs.items()}
+
+        result = self._run_generate(kwargs)
+
+        if self.cache_results and isinstance(result, dict):
+            self.m.result_cache.put(run['hash'], result)
+        return result
+
+    def _generate_append(self, run, previous, start, **kwargs):
+        '''
+        Extend the previous results for the rows appended to an input from start on, with
+        generate_append; a full generate is run if the tool can't (generate_append returns None).
+
+        Outputs that only gained rows are passed downstream as row-appends (DataManager.append).
+        The extended results are not put in the result cache, or given a hash to be stored
+        with saved workflows under: tools may process the new rows against a reference taken
+        from the earlier ones, so they can differ from a full generate.
+        '''
+        result = self.generate_append(previous, start, **kwargs)
+        if result is None:
+            return self._generate_copy_on_write(run, **kwargs)
+
+        run['hash'] = None
+        run['rows'] = self.input_rows(kwargs)
+        run['appended'] = dict((o, previous[o].data.shape[0]) for o in list(self.data.o.keys())
+                                   if isinstance(result.get(o), DataSet) and isinstance(previous.get(o), DataSet))
+        return result
+
+    def generate_append(self, previous, start, **kwargs):
+        '''
+        Extend previous (the latest results of generate) for rows appended to an input from
+        start on. kwargs are the full inputs, as for generate. Called only for tools that set
+        supports_append.
+
+        Return the full results, with output DataSets that keep their earlier rows unchanged,
+        e.g. previous['output'].as_appended(new_rows); or None to run generate instead.
+        '''
+        return None
+
+    def input_rows(self, kwargs_dict):
+        return dict((k, v.data.shape[0]) for k, v in kwargs_dict.items() if isinstance(v, DataSet))
+
+    def _run_generate(self, kwargs):
+        if self.generate_in_process:
+            return processes.generate(self, kwargs)  # Waits on this worker thread for the process
+        return self.generate(**kwargs)
+
+    def generate_hash(self, kwargs_dict):
+        '''
+        Hash of this tool, its config and the content of its inputs.
+
+        Outputs generated under the same hash are the same, so they can be reused
+        (e.g. when re-opening a saved workflow) without running generate.
+        '''
+        h = hashlib.sha1(('%s.%s' % (self.plugin.__class__.__name__, self.__class__.__name__)).encode('utf-8'))
+        h.update(json.dumps(self.config.config, sort_keys=True, default=str).encode('utf-8'))
+        for k, v in sorted(kwargs_dict.items()):
+            h.update(k.encode('utf-8'))
+            h.update((v.content_hash() if isinstance(v, DataSet) else repr(v)).encode('utf-8'))
+        return h.hexdigest()
+
+    def restore(self, kwargs_dict, generated_hash):
+        '''
+        Bring the tool up with previously generated results (generate output dict) without
+        running generate. Downstream tools are not notified; their own results are restored
+        or regenerated separately.
+        '''
+        for o in list(self.data.o.keys()):
+            if o in kwargs_dict:
+                self.data.put(o, kwargs_dict[o], update_consumers=False)
+
+        self.generated_hash = generated_hash
+        self.generated_rows = self.input_rows(self.data.i)
+        self._latest_generator_result = kwargs_dict
+        self.autoprerender(kwargs_dict)
 
     # Callback function for threaded generators; see _worker_result_callback and start_worker_thread
-    def generated(self, **kwargs):
-        # Automated pass on generated data if matching output port names
+    def generated(self, appended=None, **kwargs):
+        # Automated pass on generated data if matching output port names; outputs that only
+        # gained rows (appended, output: first new row) are passed on as row-appends
+        appended = appended or {}
         for o in list(self.data.o.keys()):
             if o in kwargs:
-                self.data.put(o, kwargs[o])
+                if o in appended:
+                    self.data.append(o, kwargs[o], appended[o])
+                else:
+                    self.data.put(o, kwargs[o])
 
     def prerender(self, output=None, **kwargs):
         return {'View': dict(list({'dso': output}.items()) + list(kwargs.items()))}
 
-    def _generate_worker_result_callback(self, kwargs_dict):
-        self.__latest_generator_result = kwargs_dict
+    def _generate_worker_result_callback(self, run):
+        # run as returned by _generate_run: the result, with the state it was generated under
+        kwargs_dict = run['result']
+        self._latest_generator_result = kwargs_dict
+        self.generated_hash = run['hash']
+        self.generated_rows = run['rows']
 
-        self.generated(**kwargs_dict)
+        self.generated(run['appended'], **kwargs_dict)
         self.progress.emit(1.)
         self.autoprerender(kwargs_dict)
 
+    def _generate_finished_callback(self, worker):
+        if worker is self._generate_worker:
+            self._generate_worker = None
+            self.m.scheduler.finished(self)
+
     def autoprerender(self, kwargs_dict):
+        if self.m.headless:
+            return  # Nothing to show
+
         self.status.emit('render')
-        self.prerender_worker = threads.Worker(self.prerender, **kwargs_dict)
+        if self.prerender_worker is not None:
+            self.prerender_worker.cancel()
+        self.prerender_worker = threads.Worker(profiling.profile, self, 'prerender', self.prerender, **kwargs_dict)
         self.start_worker_thread(self.prerender_worker, callback=self._prerender_worker_result_callback)
 
     def _prerender_worker_result_callback(self, kwargs):
@@ -719,7 +926,8 @@ class GenericApp(QMainWindow):
         if callback == None:
             callback = self._generate_worker_result_callback
 
-        worker.signals.result.connect(callback)
+        # Results queued from a worker that was cancelled after it finished are dropped here
+        worker.signals.result.connect(lambda result, w=worker: None if w.token.cancelled else callback(result))
         worker.signals.error.connect(self._worker_error_callback)
 
         self.status.emit('active')
@@ -991,14 +1199,32 @@ class DataApp(GenericApp):
 # Import Data viewer
 
 class ImportDataApp(DataApp):
+    '''
+    Base for tools importing data from a file (or folder) into their 'output'.
+
+    With watching turned on (External Data toolbar) the file, or the folder and the folders
+    under it, are watched and re-imported once changes settle. If the re-imported data is the
+    current output with samples (rows) appended, e.g. new spectra during an acquisition run,
+    it is passed on as a row-append so downstream tools that support it process only the new
+    samples (see GenericApp.generate_append).
+    '''
 
     import_type = tr('Data')
     import_filename_filter = tr("All Files") + " (*.*);;"
     import_description = tr("Open experimental data from file")
+    watch_settle_time = 2000  # ms without further changes before a watched source is re-imported
 
     def __init__(self, filename=None, **kwargs):
         super(ImportDataApp, self).__init__(**kwargs)
 
+        self.source = None  # (filename, type) of the latest import
+        self._autoload_source_files_on_change = False
+        self.file_watcher.directoryChanged.connect(self.onFileChanged)
+        self._watch_timer = QTimer()
+        self._watch_timer.setSingleShot(True)
+        self._watch_timer.setInterval(self.watch_settle_time)
+        self._watch_timer.timeout.connect(self.onWatchedSourceChanged)
+
         self.data.add_output('output')  # Add output slot
         self.table.setModel(self.data.o['output'].as_table)
         self.views.addTab(MplSpectraView(self), 'View')
@@ -1011,11 +1237,50 @@ class ImportDataApp(DataApp):
 
     # Data file import handlers (#FIXME probably shouldn't be here)
     def thread_load_datafile(self, filename, type=None):
-        if type:
-            self.worker = threads.Worker(self.load_datafile_by_type, filename, type)
-        else:
-            self.worker = threads.Worker(self.load_datafile, filename)
+        self.cancel_generate()  # Superseded by this load
+        self.source = (filename, type)
+        self.worker = threads.Worker(self._generate_run, 'load', self._load_datafile, filename, type)
+        self.worker.signals.finished.connect(lambda w=self.worker: self._generate_finished_callback(w))
+        self._generate_worker = self.worker
+        self.m.scheduler.started(self)  # Downstream tools wait for the load
         self.start_worker_thread(self.worker)
+        self.watch_source()
+
+    def _load_datafile(self, run, filename, type=None):
+        # On the load worker. If only samples were appended to the current output, pass it on as a row-append
+        run['hash'] = self.generate_hash({})  # Of the source; the imported data is kept with saved workflows
+        result = self.load_datafile_by_type(filename, type) if type else self.load_datafile(filename)
+
+        previous = self.data.o['output']
+        if isinstance(result, dict) and isinstance(result.get('output'), DataSet) and previous.data.size:
+            start = data.appended_rows(result['output'], previous)
+            if start is not None:
+                run['appended']['output'] = start
+        return result
+
+    def generate_hash(self, kwargs_dict):
+        # Imported data changes with the source, not the (absent) inputs: hash the path, type, and
+        # the modification time and size of the file, or of each file under the folder
+        h = hashlib.sha1(super(ImportDataApp, self).generate_hash(kwargs_dict).encode('utf-8'))
+        if self.source:
+            filename, type = self.source
+            h.update(json.dumps([filename, type]).encode('utf-8'))
+            for path, stamp in utils.file_stamps(filename):
+                h.update(('%s %s' % (path, stamp)).encode('utf-8'))
+        return h.hexdigest()
+
+    def watch_source(self):
+        # Watch the imported file, or folder and the folders under it (new data arrives in new subfolders)
+        watched = self.file_watcher.files() + self.file_watcher.directories()
+        if watched:
+            self.file_watcher.removePaths(watched)
+
+        if self._autoload_source_files_on_change and self.source:
+            filename = self.source[0]
+            if os.path.isdir(filename):
+                self.file_watcher.addPaths([r for r, d, f in os.walk(filename)])
+            elif os.path.exists(filename):
+                self.file_watcher.addPath(filename)
 
     def prerender(self, output=None):
         return {'View': {'dso': output}}
@@ -1025,18 +1290,21 @@ class ImportDataApp(DataApp):
         filename, _ = QFileDialog.getOpenFileName(self, self.import_description, '', self.import_filename_filter)
         if filename:
             self.thread_load_datafile(filename)
-
-            self.file_watcher = QFileSystemWatcher()
-            self.file_watcher.fileChanged.connect(self.onFileChanged)
-            self.file_watcher.addPath(filename)
-
             self.set_name(os.path.basename(filename))
 
         return False
 
+    def onWatchSourceDataToggle(self, checked):
+        self._autoload_source_files_on_change = checked
+        self.watch_source()
+
     def onFileChanged(self, file):
-        self.load_datafile(file)
-        pass
+        # Files are often written in several steps; wait for the changes to settle
+        if self._autoload_source_files_on_change and self.source:
+            self._watch_timer.start()
+
+    def onWatchedSourceChanged(self):
+        self.thread_load_datafile(*self.source)
 
     def addImportDataToolbar(self):
         t = self.getCreatedToolbar(tr('External Data'), 'external-data')
@@ -1089,7 +1357,7 @@ class ExportDataApp(GenericApp):
             self.worker = threads.Worker(self.save_datafile_by_type, filename, dso, type)
         else:
             self.worker = threads.Worker(self.save_datafile, filename, dso)
-        self.start_worker_thread(self.worker)
+        self.start_worker_thread(self.worker, callback=lambda result: None)  # Nothing to pass on
 
     def onExportData(self):
         """ Open a data file"""
@@ -1127,10 +1395,13 @@ class AnalysisApp(GenericApp):
         #data = data.as_class_grouped(classes=classes)
         data = np.zeros((len(classes), len(objs)))
 
+        # Row/column of each class/label (the first, as list.index)
+        rows = dict(reversed([(c, n) for n, c in enumerate(dso.classes[0])]))
+        columns = dict(reversed([(l, n) for n, l in enumerate(dso.labels[1])]))
         for x, l in enumerate(objs):  # [u'PYRUVATE', u'PHOSPHO-ENOL-PYRUVATE']
             for y, c in enumerate(classes):
                 #e = self.m.db.index[o] # Get entity for lookup
-                data[y, x] = dso.data[dso.classes[0].index(c), dso.labels[1].index(l)]
+                data[y, x] = dso.data[rows[c], columns[l]]
 
         return data.T
 
@@ -1147,12 +1418,13 @@ class AnalysisApp(GenericApp):
         #data = data.as_class_grouped(classes=classes)
         data = np.zeros((len(objs), len(entityt)))
 
+        # Column of each entity id (the first, as list.index)
+        columns = dict(reversed([(getattr(e, 'id', None), n) for n, e in enumerate(dso.entities[1])]))
         for y, obj in enumerate(objs):  # [u'PYRUVATE', u'PHOSPHO-ENOL-PYRUVATE']
             for x, o in enumerate(obj):
                 try:
-                    e = self.m.db.index[o]  # Get entity for lookup
-                    data[y, x] = dso.data[0, dso.entities[1].index(e)]
-                except:  # Can't find it
+                    data[y, x] = dso.data[0, columns[o]]
+                except (KeyError, IndexError):  # Can't find it
                     pass
 
         return data
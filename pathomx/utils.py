@@ -204,6 +204,24 @@ def mkdir_p(path):
             raise
 
 
+def file_stamps(filename):
+    # (path, stamp) of the file, or of each file under the folder (paths relative to it), where the
+    # stamp is the modification time and size; changes to the files change their stamps
+    if os.path.isdir(filename):
+        paths = sorted(os.path.join(r, f) for r, d, fs in os.walk(filename) for f in fs)
+    else:
+        paths = [filename]
+
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            stamp = 'missing'
+        else:
+            stamp = '%d:%d' % (st.st_mtime_ns, st.st_size)
+        yield os.path.relpath(path, filename), stamp
+
+
 def find_packager():
 
     import sys
@@ -177,6 +177,9 @@ setup(
     entry_points = {
         'gui_scripts': [
             'Pathomx = pathomx.Pathomx:main',
+        ],
+        'console_scripts': [
+            'pathomx-batch = pathomx.batch:main',
         ]
     },
 
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''
+Benchmarks for the spectral processing plugins, on synthetic NMR-like data.
+
+    python tests/benchmark.py [options]
+
+Each case is timed on generated spectra of each --size (samples x ppm points), with the
+same random seed every run so results are comparable between checkouts. Plugin methods
+are called headlessly on a stand-in for the tool (processes.ProcessTool; the config is
+given per case), with the input as the read-only view tools get from DataManager.get.
+
+Save results with --save and compare a later run against them with --compare; cases
+slower than the saved time by more than --tolerance are reported and the exit status
+is 1. Cases whose plugin can't be imported (missing dependencies) are skipped.
+'''
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import platform
+from optparse import OptionParser
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import processes, spectra, text
+from pathomx.data import DataSet
+
+PLUGINS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pathomx', 'plugins')
+
+
+def synthetic_nmr(samples=20, points=32768, classes=('control', 'test'), peaks=60, seed=0):
+    '''
+    DataSet of 1D NMR-like spectra: Lorentzian peaks with per-sample intensities and small
+    shifts, on a sloping baseline with noise. Samples are assigned to classes in turn; the
+    classes after the first change a fifth of the peaks' intensities.
+    '''
+    rng = np.random.RandomState(seed)
+
+    ppm = np.linspace(10., -0.5, points)  # Descending, as from Bruker processing
+    data = np.empty((samples, points))
+    data[:] = np.linspace(0., 0.2, points) * rng.uniform(0.5, 1.5, (samples, 1))  # Baseline
+    data += rng.normal(0, 0.01, (samples, points))
+
+    cls = np.arange(samples) % len(classes)
+    step = ppm[0] - ppm[1]
+    for centre, height, width in zip(rng.uniform(0.5, 9.5, peaks), rng.lognormal(0, 1, peaks), rng.uniform(0.002, 0.01, peaks)):
+        heights = height * rng.uniform(0.8, 1.2, samples)
+        if rng.uniform() < 0.2:
+            heights *= 1 + 0.5 * (cls > 0)  # Class effect
+
+        # Only evaluate the peak near its centre
+        lo, hi = np.searchsorted(-ppm, [-(centre + 50 * width), -(centre - 50 * width)])
+        centres = centre + rng.normal(0, 2 * step, (samples, 1))
+        data[:, lo:hi] += heights[:, None] * width ** 2 / ((ppm[lo:hi] - centres) ** 2 + width ** 2)
+
+    dso = DataSet(size=(samples, points))
+    dso.name = 'Synthetic NMR'
+    dso.data = data
+    dso.labels[0] = ['Sample %d' % n for n in range(samples)]
+    dso.classes[0] = [classes[c] for c in cls]
+    dso.scales[1] = ppm
+    dso.labels[1] = ['%.4f' % p for p in ppm]
+    return dso
+
+
+def tool(plugin, name, config):
+    # Stand-in for the tool class in plugins/<plugin>/<plugin>.py with the given config
+    cls = processes._tool_class(plugin, os.path.join(PLUGINS, plugin, '%s.py' % plugin), name)
+    return processes.ProcessTool(cls, config)
+
+
+def append_case(plugin, name, config):
+    # generate_append for the last tenth of the samples, after generate on the rest
+    def case(dso):
+        t = tool(plugin, name, config)
+        start = dso.data.shape[0] - max(1, dso.data.shape[0] // 10)
+        earlier = dso.as_view()
+        earlier.select(0, np.arange(start))
+        previous = t.generate(input=earlier)
+        return lambda: t.generate_append(previous, start, input=dso)
+    return case
+
+
+def bin_spectra_case(dso):
+    # The binning engine on its own (no plugin import), with the binning tool's 0.01 ppm bins
+    scale = np.asarray(dso.scales[1], dtype=float)
+    edges = spectra.uniform_bin_edges(scale, 0.01)
+    idx = spectra.bin_index(scale, edges)
+    return lambda: spectra.bin_spectra(dso.data, idx, len(edges) - 1)
+
+
+def autophase_case(algorithm):
+    # Phase correction of the Bruker import on its own, on the spectra dephased by 30 degrees;
+    # the dispersion part is the Hilbert transform of the absorption spectrum
+    def case(dso):
+        import scipy.signal
+        z = np.conj(scipy.signal.hilbert(dso.data)) * np.exp(-1j * np.deg2rad(30))
+        return lambda: spectra.autophase_batch(z, algorithm=algorithm)
+    return case
+
+
+def spectra_csv(dso):
+    # Samples-in-rows CSV of the spectra, written once for the size
+    path = tempfile.mkdtemp(prefix='pathomx-benchmark-')
+    atexit.register(shutil.rmtree, path, True)
+    fn = os.path.join(path, 'spectra.csv')
+    with open(fn, 'w') as f:
+        f.write('Sample,Class,%s\n' % ','.join(dso.labels[1]))
+        for label, cls, row in zip(dso.labels[0], dso.classes[0], dso.data):
+            f.write('%s,%s,%s\n' % (label, cls, ','.join('%.6g' % v for v in row)))
+    return fn
+
+
+def import_case(dso):
+    fn = spectra_csv(dso)
+    return lambda: tool('import_text', 'ImportTextApp', {}).load_datafile(fn)
+
+
+def read_rows_case(dso):
+    # The text reader on its own (no plugin import)
+    fn = spectra_csv(dso)
+    return lambda: text.read_rows(fn)
+
+
+EXPERIMENT = {'experiment_control': 'control', 'experiment_test': 'test'}
+
+# name: function of the input DataSet (a read-only view) returning the callable to time
+CASES = [
+    ('binning', lambda dso: lambda: tool('binning', 'BinningApp', {'bin_mode': 'uniform', 'bin_size': 0.01, 'bin_offset': 0}).generate(input=dso)),
+    ('binning.append', append_case('binning', 'BinningApp', {'bin_mode': 'uniform', 'bin_size': 0.01, 'bin_offset': 0})),
+    ('spectra.bin_spectra', bin_spectra_case),
+    ('spectra.autophase_batch', autophase_case('Peak_minima')),
+    ('spectra.autophase_batch.acme', autophase_case('ACME')),
+    ('binning.intelligent', lambda dso: lambda: tool('binning', 'BinningApp', {'bin_mode': 'intelligent', 'bin_resolution': 0.005}).generate(input=dso)),
+    ('import_text', import_case),
+    ('text.read_rows', read_rows_case),
+    ('spectra_norm.tsa', lambda dso: lambda: tool('spectra_norm', 'SpectraNormApp', {}).tsa(dso.data)),
+    ('spectra_norm.pqn', lambda dso: lambda: tool('spectra_norm', 'SpectraNormApp', {}).pqn(dso.data)),
+    ('baseline_correction', lambda dso: lambda: tool('baseline_correction', 'BaselineCorrectionTool', {
+        'algorithm': 'median', 'med_mw': 24, 'med_sf': 16, 'med_sigma': 5.0,
+        'cbf_last_pc': 10, 'cbf_explicit_start': 0, 'cbf_explicit_end': 100}).baseline_correct(dso)),
+    ('icoshift', lambda dso: lambda: tool('icoshift_', 'IcoshiftApp', {
+        'target': 'average', 'alignment_mode': 'whole', 'maximum_shift': 'f'}).icoshift(dso.as_copy())),
+    ('pca', lambda dso: lambda: tool('pca', 'PCAApp', {'number_of_components': 2}).generate(input=dso)),
+    ('pls_da', lambda dso: lambda: tool('pls_da', 'PLSDAApp', dict(EXPERIMENT, **{
+        'number_of_components': 2, 'autoscale': False, 'algorithm': 'NIPALS'})).generate(input=dso)),
+    ('fold_change', lambda dso: lambda: tool('fold_change', 'FoldChangeApp', dict(EXPERIMENT, **{
+        'use_baseline_minima': True})).generate(input=dso)),
+    ('DataSet.as_summary', lambda dso: lambda: dso.as_summary(dim=0, match_attribs=['classes'])),
+    ('DataSet.as_filtered', lambda dso: lambda: dso.as_filtered(dim=0, classes=['control'])),
+]
+
+
+def time_case(fn, repeat):
+    times = []
+    for n in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+
+
+def run(sizes, repeat=3, only=None):
+    results = {}
+    for samples, points in sizes:
+        dso = synthetic_nmr(samples, points)
+        for name, case in CASES:
+            if only and name not in only:
+                continue
+            key = '%s %dx%d' % (name, samples, points)
+            try:
+                fn = case(dso.as_view())
+                fn()  # Warm up; also imports the plugin
+            except ImportError as e:
+                print('%-40s skipped (%s)' % (key, e))
+                continue
+            results[key] = time_case(fn, repeat)
+            print('%-40s %10.4f s' % (key, results[key]['min']))
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Cases slower than the baseline by more than tolerance (ratio of minimum times)
+    slower = []
+    for key, r in sorted(results.items()):
+        if key in baseline:
+            ratio = r['min'] / baseline[key]['min']
+            print('%-40s %10.4f s  %5.2fx' % (key, r['min'], ratio))
+            if ratio > tolerance:
+                slower.append((key, ratio))
+    return slower
+
+
+def parse_size(s):
+    samples, points = s.lower().split('x')
+    return int(samples), int(points)
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-s", "--size", dest="sizes", action="append", default=[],
+                      help="data size as samples x points, e.g. 20x32768 (repeatable; default 20x32768)")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                      help="times to run each case; the minimum is compared (default 3)")
+    parser.add_option("-c", "--case", dest="cases", action="append", default=[],
+                      help="only run this case (repeatable): %s" % ', '.join(n for n, c in CASES))
+    parser.add_option("--save", dest="save", default=None,
+                      help="write results to this JSON file")
+    parser.add_option("--compare", dest="compare", default=None,
+                      help="compare against results saved with --save")
+    parser.add_option("--tolerance", dest="tolerance", type="float", default=1.25,
+                      help="slow-down ratio reported as a regression (default 1.25)")
+    (options, args) = parser.parse_args()
+
+    sizes = [parse_size(s) for s in options.sizes] or [(20, 32768)]
+    results = run(sizes, options.repeat, options.cases)
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=1, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        print('\nCompared with %s (%s)' % (options.compare, ', '.join('%s %s' % i for i in sorted(baseline['environment'].items()))))
+        slower = compare(results, baseline['results'], options.tolerance)
+        for key, ratio in slower:
+            print('Slower: %s (%.2fx)' % (key, ratio))
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
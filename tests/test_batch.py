@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx.batch import BatchRunner
+from pathomx.data import DataSet
+
+
+class ProfileLog(object):
+    def write(self, fn):
+        open(fn, 'w').close()
+
+
+class MainWindow(object):
+    def __init__(self, apps):
+        self.apps = apps
+        self.profile_log = ProfileLog()
+
+
+class DataManager(object):
+    def __init__(self, outputs):
+        self.o = outputs
+
+
+class Tool(object):
+    # Stands in for a GenericApp with the results of its latest run
+    def __init__(self, name, id, outputs, exception=None):
+        self.name = name
+        self.id = id
+        self.data = DataManager(outputs)
+        self._latest_generator_result = dict(outputs)
+        self._latest_exception = exception
+
+
+def dataset(size=(2, 3)):
+    dso = DataSet(size=size)
+    dso.data[:] = 1.
+    return dso
+
+
+class Test(unittest.TestCase):
+    """Unit tests for batch.BatchRunner"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.runner = BatchRunner.__new__(BatchRunner)  # Without opening a workflow
+        self.runner.written = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def write(self, apps):
+        self.runner.m = MainWindow(apps)
+        self.runner.write_outputs(self.path)
+        files = sorted(os.listdir(self.path))
+        for fn in files:
+            os.remove(os.path.join(self.path, fn))
+        return files
+
+    def test_write_outputs(self):
+        """Each non-empty output is written, named by tool and interface, with the profile"""
+        tool = Tool('Mean/Centre', 'ab12', {'output': dataset(), 'empty': dataset((0, 0))})
+        self.assertEqual(self.write([tool]), ['Mean_Centre-ab12.output.npz', 'profile.csv'])
+
+    def test_errors(self):
+        """Tools that failed, or have no results, are left out"""
+        failed = Tool('Failed', '1', {'output': dataset()}, exception=ValueError())
+        none = Tool('None', '2', {'output': dataset()})
+        none._latest_generator_result = None
+        self.assertEqual(self.write([failed, none]), ['profile.csv'])
+
+    def test_new_results_only(self):
+        """Results already written are not written again"""
+        tool = Tool('Tool', '1', {'output': dataset()})
+        self.write([tool])
+        self.assertEqual(self.write([tool]), ['profile.csv'])
+
+        tool._latest_generator_result = {'output': dataset()}
+        self.assertEqual(self.write([tool]), ['Tool-1.output.npz', 'profile.csv'])
+
+    def test_find_tool(self):
+        """Tools are found by name or id"""
+        tool = Tool('Tool', '1', {})
+        self.runner.m = MainWindow([tool])
+        self.assertIs(self.runner.find_tool('Tool'), tool)
+        self.assertIs(self.runner.find_tool('1'), tool)
+        self.assertRaises(ValueError, self.runner.find_tool, 'Other')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx.cache import ResultCache, FileCache, result_nbytes
+from pathomx.data import DataSet
+
+
+def dataset(value, size=(10, 100)):
+    dso = DataSet(size=size)
+    dso.data[:] = value
+    return dso
+
+
+class Test(unittest.TestCase):
+    """Unit tests for cache.ResultCache"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.nbytes = result_nbytes({'output': dataset(0)})
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def test_nbytes(self):
+        """Every array of a result is counted, not only DataSet data"""
+        dso = dataset(0)
+        self.assertGreater(result_nbytes(dso), dso.data.nbytes)
+        extra = {'output': dso, 'weights': np.zeros(50), 'parts': [np.zeros(10)], 'name': 'x'}
+        self.assertEqual(result_nbytes(extra), result_nbytes(dso) + 60 * 8)
+
+    def test_get_put(self):
+        """Results come back as read-only views; misses are None"""
+        cache = ResultCache()
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', {'output': dataset(1)})
+
+        result = cache.get('a')
+        self.assertEqual(result['output'].data.sum(), 1000)
+        self.assertFalse(result['output'].data.flags.writeable)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_existing_key(self):
+        """A result already held is not replaced"""
+        cache = ResultCache()
+        cache.put('a', {'output': dataset(1)})
+        cache.put('a', {'output': dataset(2)})
+        self.assertEqual(cache.get('a')['output'].data[0, 0], 1)
+        self.assertEqual(cache.nbytes, self.nbytes)
+
+    def test_lru(self):
+        """The least recently used results are evicted first"""
+        cache = ResultCache(max_bytes=2 * self.nbytes)
+        cache.put('a', {'output': dataset(1)})
+        cache.put('b', {'output': dataset(2)})
+        cache.get('a')
+        cache.put('c', {'output': dataset(3)})
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_spill(self):
+        """Evicted results are spilled to disk and read back"""
+        cache = ResultCache(max_bytes=self.nbytes, spill_max_bytes=self.nbytes, spill_path=self.path)
+        cache.put('a', {'output': dataset(1)})
+        cache.put('b', {'output': dataset(2)})
+        self.assertEqual(list(cache.spilled.keys()), ['a'])
+
+        result = cache.get('a')
+        self.assertEqual(result['output'].data[0, 0], 1)
+        self.assertEqual(list(cache.spilled.keys()), ['b'])
+
+    def test_clear(self):
+        """Clearing removes held and spilled results"""
+        cache = ResultCache(max_bytes=self.nbytes, spill_max_bytes=self.nbytes, spill_path=self.path)
+        cache.put('a', {'output': dataset(1)})
+        cache.put('b', {'output': dataset(2)})
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class TestFileCache(unittest.TestCase):
+    """Unit tests for cache.FileCache"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = FileCache(os.path.join(self.path, 'fid'), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def test_get_put(self):
+        """Arrays put under a key are returned by name; missing keys give None"""
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', data=np.arange(5.), pc=np.array([1., 2.]))
+        result = self.cache.get('a')
+        self.assertEqual(sorted(result.keys()), ['data', 'pc'])
+        np.testing.assert_array_equal(result['data'], np.arange(5.))
+        self.assertEqual(os.listdir(self.cache.path), ['a.npz'])
+
+    def test_unreadable(self):
+        """Entries that can't be read are misses"""
+        self.cache.put('a', data=np.arange(5.))
+        with open(self.cache._file('a'), 'wb') as f:
+            f.write(b'not an archive')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_trim(self):
+        """Least recently read or written entries are removed first, down to max_bytes"""
+        for n, key in enumerate(['a', 'b', 'c']):
+            self.cache.put(key, data=np.zeros(100))
+            os.utime(self.cache._file(key), (1000 + n, 1000 + n))
+        self.cache.get('a')  # Most recently used
+
+        self.cache.max_bytes = 2 * os.path.getsize(self.cache._file('a'))
+        self.cache.trim()
+        self.assertEqual(sorted(os.listdir(self.cache.path)), ['a.npz', 'c.npz'])
+
+        self.cache.max_bytes = 0
+        self.cache.trim()
+        self.assertEqual(os.listdir(self.cache.path), [])
+        FileCache(os.path.join(self.path, 'missing'), 0).trim()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import data
+from pathomx.data import DataSet, DataManager, Annotation, CategoricalAnnotation, group_reduce
+
+
+class View(object):
+    id = 'view'
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    """Unit tests for the copy-on-write views of DataSets handed to consumers"""
+
+    def setUp(self):
+        self.dso = DataSet(size=(2, 3))
+        self.dso.data[:] = np.arange(6.).reshape(2, 3)
+
+    def test_view_is_read_only(self):
+        """Views share the data read-only; writes through them raise"""
+        view = self.dso.as_view()
+        self.assertTrue(np.shares_memory(view.data, self.dso.data))
+        self.assertFalse(view.data.flags.writeable)
+        with self.assertRaises(ValueError):
+            view.data[0, 0] = 10.
+        self.assertEqual(self.dso.data[0, 0], 0.)
+
+    def test_copy_is_writable(self):
+        """Copies of a view have their own writable data"""
+        dso = self.dso.as_view().as_copy()
+        dso.data[0, 0] = 10.
+        self.assertEqual(self.dso.data[0, 0], 0.)
+
+    def test_get_returns_view(self):
+        """DataManager.get hands out views of the input, not the input itself"""
+        dm = DataManager(None, View())
+        dm.i['input'] = self.dso
+        dso = dm.get('input')
+        self.assertIsNot(dso, self.dso)
+        self.assertFalse(dso.data.flags.writeable)
+        np.testing.assert_array_equal(dso.data, self.dso.data)
+
+
+class TestAnnotation(unittest.TestCase):
+    """Unit tests for data.Annotation and data.CategoricalAnnotation"""
+
+    def test_list_operations(self):
+        """Annotations support the list operations plugins use"""
+        a = Annotation(['a', 'b', 'c'])
+        a.append('d')
+        self.assertEqual(len(a), 4)
+        self.assertEqual(a[3], 'd')
+        self.assertEqual(a[1:3], ['b', 'c'])
+        self.assertEqual(a.index('c'), 2)
+        self.assertIn('b', a)
+        self.assertEqual(a + ['e'], ['a', 'b', 'c', 'd', 'e'])
+
+    def test_select(self):
+        """Masks and index arrays select entries, as for numpy arrays"""
+        a = Annotation([1., 2., 3.])
+        self.assertEqual(a[np.array([True, False, True])], [1., 3.])
+        self.assertEqual(a[[2, 0]], [3., 1.])
+        np.testing.assert_array_equal(a.isin([2., 'x']), [False, True, False])
+
+    def test_float_becomes_object(self):
+        """Assigning a non-float to a float annotation keeps both values"""
+        a = Annotation([1., 2.])
+        a[0] = 'x'
+        self.assertEqual(a, ['x', 2.])
+
+    def test_categorical(self):
+        """Categorical annotations store codes into their categories"""
+        c = CategoricalAnnotation(['x', 'y', 'x', None])
+        self.assertEqual(c.categories, ['x', 'y', None])
+        np.testing.assert_array_equal(c.codes, [0, 1, 0, 2])
+        self.assertEqual(c[[0, 1]], ['x', 'y'])
+        np.testing.assert_array_equal(c.isin(['x']), [True, False, True, False])
+        c[3] = 'z'
+        self.assertEqual(c.unique(), ['x', 'y', 'z'])
+
+    def test_copied_on_assignment(self):
+        """Annotations assigned to a DataSet axis are copied"""
+        a = DataSet(size=(2, 2))
+        b = DataSet(size=(2, 2))
+        a.labels[0] = ['p', 'q']
+        a.classes[0] = ['x', 'y']
+        b.labels[0] = a.labels[0]
+        b.classes[0] = a.classes[0]
+
+        b.labels[0][0] = 'changed'
+        b.classes[0][0] = 'changed'
+        self.assertEqual(a.labels[0], ['p', 'q'])
+        self.assertEqual(a.classes[0], ['x', 'y'])
+        self.assertIsInstance(b.classes[0], CategoricalAnnotation)
+
+
+class TestGroupReduce(unittest.TestCase):
+    """Unit tests for data.group_reduce()"""
+
+    def setUp(self):
+        self.data = np.arange(12.).reshape(4, 3)
+        self.groups = [0, 1, 0, 1]
+
+    def test_mean(self):
+        """Mean of each group's rows; groups with no rows are NaN"""
+        result = group_reduce(self.data, self.groups, 3)
+        np.testing.assert_array_equal(result[:2], [[3, 4, 5], [6, 7, 8]])
+        self.assertTrue(np.isnan(result[2]).all())
+
+    def test_sum_and_std(self):
+        """Sum and std match numpy on each group"""
+        for fn in [np.sum, np.std]:
+            result = group_reduce(self.data, self.groups, 2, fn=fn)
+            expected = [fn(self.data[[0, 2]], axis=0), fn(self.data[[1, 3]], axis=0)]
+            np.testing.assert_allclose(result, expected)
+
+    def test_median_axis(self):
+        """Other functions are applied per group, along the given axis"""
+        result = group_reduce(self.data, [0, 0, 1], 2, fn=np.median, axis=1)
+        np.testing.assert_array_equal(result, [[0.5, 2], [3.5, 5], [6.5, 8], [9.5, 11]])
+
+    def test_masked(self):
+        """Masked entries are left out, as for np.ma reductions"""
+        mask = np.zeros(self.data.shape, dtype=bool)
+        mask[[0, 2], 0] = True  # Every entry of group 0 in the first column
+        mask[1, 1] = True
+        data = np.ma.masked_array(self.data, mask=mask)
+
+        for fn in [np.mean, np.sum, np.std, np.median]:
+            result = group_reduce(data, self.groups, 2, fn=fn)
+            self.assertTrue(np.ma.isMaskedArray(result))
+            self.assertTrue(result.mask[0, 0])
+            ma_fn = getattr(np.ma, fn.__name__)
+            expected = np.ma.vstack([ma_fn(data[[0, 2]], axis=0), ma_fn(data[[1, 3]], axis=0)])
+            np.testing.assert_allclose(result[:, 1:].filled(np.nan), expected[:, 1:].filled(np.nan))
+
+    def test_empty_axis(self):
+        """An axis with no entries gives NaN for every group"""
+        result = group_reduce(np.zeros((0, 3)), [], 2)
+        self.assertEqual(result.shape, (2, 3))
+        self.assertTrue(np.isnan(result).all())
+
+
+class TestFileMapped(unittest.TestCase):
+    """Unit tests for the file-mapped arrays and chunked operations of large DataSets"""
+
+    def setUp(self):
+        # Treat anything over 1 kB as large, in 256 byte chunks
+        self.threshold, self.chunk_bytes = data.MEMMAP_THRESHOLD, data.CHUNK_BYTES
+        data.MEMMAP_THRESHOLD, data.CHUNK_BYTES = 1024, 256
+        self.a = np.arange(400.).reshape(20, 20)
+
+    def tearDown(self):
+        data.MEMMAP_THRESHOLD, data.CHUNK_BYTES = self.threshold, self.chunk_bytes
+
+    def test_scratch_array(self):
+        """Large arrays are file-mapped, others are in memory; both are zeroed"""
+        self.assertNotIsInstance(data.scratch_array((4, 4)), np.memmap)
+        a = data.scratch_array((20, 20))
+        self.assertIsInstance(a, np.memmap)
+        self.assertTrue((a == 0).all())
+
+    def test_chunks(self):
+        """Chunks cover the axis in order, each within CHUNK_BYTES"""
+        rows = [list(range(20))[s[0]] for s in data.chunks(self.a)]
+        self.assertEqual(sum(rows, []), list(range(20)))
+        self.assertTrue(all(self.a[s].nbytes <= 256 for s in data.chunks(self.a)))
+
+        columns = list(data.chunks(self.a, axis=1))
+        self.assertEqual(columns[0][0], slice(None))
+        self.assertEqual(sum(self.a[s].shape[1] for s in columns), 20)
+
+    def test_copy_array(self):
+        """Copies of large arrays are file-mapped and independent of the original"""
+        c = data.copy_array(self.a)
+        self.assertIsInstance(c, np.memmap)
+        np.testing.assert_array_equal(c, self.a)
+        c[0, 0] = -1
+        self.assertEqual(self.a[0, 0], 0)
+
+    def test_take_array(self):
+        """Selections by mask or index match np.take on either axis"""
+        mask = np.arange(20) % 3 != 0
+        index = np.array([19, 0, 5, 5])
+        for axis in [0, 1]:
+            np.testing.assert_array_equal(data.take_array(self.a, mask, axis), np.compress(mask, self.a, axis))
+            np.testing.assert_array_equal(data.take_array(self.a, index, axis), np.take(self.a, index, axis))
+
+    def test_select_and_crop(self):
+        """select and crop keep the annotations on the axis in step with the data"""
+        dso = DataSet(size=(20, 20))
+        dso.data[:] = self.a
+        dso.labels[0] = [str(n) for n in range(20)]
+        dso.scales[1] = list(range(20))
+
+        dso.select(0, np.arange(20) >= 10)
+        self.assertEqual(dso.labels[0], [str(n) for n in range(10, 20)])
+        np.testing.assert_array_equal(dso.data, self.a[10:])
+
+        dso.crop((5, 15))
+        self.assertEqual(dso.data.shape, (5, 15))
+        self.assertEqual(dso.labels[0], [str(n) for n in range(10, 15)])
+        self.assertEqual(dso.scales[1], list(range(15)))
+        np.testing.assert_array_equal(dso.data, self.a[10:15, :15])
+
+
+class TestSaveLoad(unittest.TestCase):
+    """Unit tests for DataSet.save() and DataSet.load() (NPZ archives)"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fn = os.path.join(self.path, 'dataset.npz')
+
+        self.dso = DataSet(size=(3, 4))
+        self.dso.name = 'Test'
+        self.dso.data[:] = np.arange(12.).reshape(3, 4)
+        self.dso.labels[0] = ['a', 'b', 'c']
+        self.dso.scales[1] = [0.5, 1., 1.5, 2.]
+        self.dso.classes[0] = [('x', 1), ('y', 2), ('x', 1)]
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def test_round_trip(self):
+        """Data and annotations come back as saved"""
+        self.dso.save(self.fn)
+        dso = DataSet().load(self.fn)
+        np.testing.assert_array_equal(dso.data, self.dso.data)
+        self.assertEqual(dso.name, 'Test')
+        self.assertEqual(dso.labels[0], ['a', 'b', 'c'])
+        self.assertEqual(dso.scales[1], [0.5, 1., 1.5, 2.])
+        self.assertEqual(dso.content_hash(), self.dso.content_hash())
+
+    def test_tuple_categories(self):
+        """Tuple class categories are loaded as tuples"""
+        self.dso.save(self.fn)
+        dso = DataSet().load(self.fn)
+        self.assertEqual(dso.classes[0].categories, [('x', 1), ('y', 2)])
+        self.assertEqual(dso.classes[0][2], ('x', 1))
+
+    def test_unserialisable(self):
+        """Values that can't be stored raise, leaving no file behind"""
+        self.dso.labels[1] = [object(), 'b', 'c', 'd']
+        self.assertRaises(TypeError, self.dso.save, self.fn)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+class TestContentHash(unittest.TestCase):
+    """Unit tests for DataSet.content_hash()"""
+
+    def setUp(self):
+        self.dso = DataSet(size=(2, 3))
+        self.dso.data[:] = np.arange(6.).reshape(2, 3)
+        self.dso.labels[0] = ['a', 'b']
+
+    def test_same_content(self):
+        """Copies and views hash as the original"""
+        h = self.dso.content_hash()
+        self.assertEqual(self.dso.as_copy().content_hash(), h)
+        self.assertEqual(self.dso.as_view().content_hash(), h)
+
+    def test_changed_content(self):
+        """Changes to the data or the annotations change the hash"""
+        h = self.dso.content_hash()
+        dso = self.dso.as_copy()
+        dso.data[0, 0] = 10.
+        self.assertNotEqual(dso.content_hash(), h)
+
+        dso = self.dso.as_copy()
+        dso.labels[0] = ['a', 'c']
+        self.assertNotEqual(dso.content_hash(), h)
+
+    def test_new_data(self):
+        """Assigning new data to a DataSet holding a read-only view rehashes it"""
+        view = self.dso.as_view()
+        h = view.content_hash()
+        view.data = view.data * 2
+        self.assertNotEqual(view.content_hash(), h)
+
+
+class TestAppend(unittest.TestCase):
+    """Unit tests for DataSet.as_appended() and data.appended_rows()"""
+
+    def setUp(self):
+        self.dso = self.dataset(0, 3)
+        self.dso.data[1, 1] = np.nan
+
+    def dataset(self, start, n):
+        dso = DataSet(size=(n, 4))
+        dso.data[:] = np.arange(start * 4., (start + n) * 4.).reshape(n, 4)
+        dso.labels[0] = ['s%d' % r for r in range(start, start + n)]
+        dso.classes[0] = ['x' if r % 2 else 'y' for r in range(start, start + n)]
+        dso.scales[1] = [0.5, 1., 1.5, 2.]
+        return dso
+
+    def test_as_appended(self):
+        """Rows and their annotations are added after the existing ones"""
+        dso = self.dso.as_appended(self.dataset(3, 2))
+        self.assertEqual(dso.data.shape, (5, 4))
+        np.testing.assert_array_equal(dso.data[3:], self.dataset(3, 2).data)
+        self.assertEqual(dso.labels[0], ['s0', 's1', 's2', 's3', 's4'])
+        self.assertEqual(dso.classes[0], ['y', 'x', 'y', 'x', 'y'])
+        self.assertEqual(dso.scales[1], [0.5, 1., 1.5, 2.])
+        self.assertEqual(self.dso.data.shape, (3, 4))
+
+    def test_appended_rows(self):
+        """Appended datasets give the number of earlier rows (NaN equal to NaN)"""
+        dso = self.dso.as_appended(self.dataset(3, 2))
+        self.assertEqual(data.appended_rows(dso, self.dso), 3)
+        self.assertEqual(data.appended_rows(self.dso.as_copy(), self.dso), 3)
+
+    def test_not_appended(self):
+        """Changes to earlier rows or the other axes, or fewer rows, are not appends"""
+        dso = self.dso.as_appended(self.dataset(3, 2))
+        changed = dso.as_copy()
+        changed.data[0, 0] = -1
+        self.assertIsNone(data.appended_rows(changed, self.dso))
+
+        changed = dso.as_copy()
+        changed.labels[0][1] = 'other'
+        self.assertIsNone(data.appended_rows(changed, self.dso))
+
+        changed = dso.as_copy()
+        changed.scales[1] = [1., 2., 3., 4.]
+        self.assertIsNone(data.appended_rows(changed, self.dso))
+
+        self.assertIsNone(data.appended_rows(self.dso, dso))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import db
+
+
+class TestSnapshot(unittest.TestCase):
+    """Unit tests for the compiled database snapshot"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fn = os.path.join(self.path, 'database', 'snapshot.pickle')
+        self.snapshot_file, self.source_stamp = db.snapshot_file, db.source_stamp
+        db.snapshot_file = lambda: self.fn
+
+    def tearDown(self):
+        db.snapshot_file, db.source_stamp = self.snapshot_file, self.source_stamp
+        shutil.rmtree(self.path, True)
+
+    def loaded(self):
+        # Database loaded from the snapshot alone, or None if it can't be
+        database = db.databaseManager.__new__(db.databaseManager)
+        return database if database.load_snapshot() else None
+
+    def test_round_trip(self):
+        """The snapshot holds the core with the links between objects"""
+        built = db.databaseManager(snapshot=False)
+        built.save_snapshot()
+        database = self.loaded()
+
+        for name in ['pathways', 'compounds', 'reactions', 'proteins', 'genes']:
+            self.assertEqual(sorted(getattr(database, name).keys()), sorted(getattr(built, name).keys()))
+        self.assertEqual(sorted(database.synrev.keys()), sorted(built.__dict__['synrev'].keys()))
+
+        for r in database.reactions.values():
+            self.assertTrue(all(m is database.index[m.id] for m in r.mtins + r.mtouts))
+            self.assertTrue(all(p is database.pathways[p.id] for p in r.pathways))
+        self.assertNotIn('_db', next(iter(database.index.values())).__dict__)
+
+    def test_created(self):
+        """The snapshot is written when the database is built, and used the next time"""
+        db.databaseManager()
+        self.assertTrue(os.path.exists(self.fn))
+
+        build = db.databaseManager.build
+        db.databaseManager.build = None  # Fails if called
+        try:
+            database = db.databaseManager()
+        finally:
+            db.databaseManager.build = build
+        self.assertTrue(database.compounds)
+        self.assertEqual(database.pending_sections, database.sections)
+
+    def test_stale(self):
+        """Snapshots of other source files or versions, or unreadable ones, are not used"""
+        db.databaseManager(snapshot=False).save_snapshot()
+        self.assertIsNotNone(self.loaded())
+
+        db.source_stamp = lambda: []
+        self.assertIsNone(self.loaded())
+        db.source_stamp = self.source_stamp
+
+        version = db.SNAPSHOT_VERSION
+        db.SNAPSHOT_VERSION += 1
+        try:
+            self.assertIsNone(self.loaded())
+        finally:
+            db.SNAPSHOT_VERSION = version
+
+        with open(self.fn, 'wb') as f:
+            f.write(b'not a snapshot')
+        self.assertIsNone(self.loaded())
+
+
+class TestSections(unittest.TestCase):
+    """Unit tests for the database sections loaded on demand"""
+
+    def setUp(self):
+        self.db = db.databaseManager(snapshot=False)
+
+    def test_pending(self):
+        """Only the core is loaded on creation"""
+        self.assertEqual(self.db.pending_sections, self.db.sections)
+        for name in ['graph', 'synonym_index']:
+            self.assertNotIn(name, self.db.__dict__)
+
+    def test_in_order(self):
+        """Using what a section adds loads it, and the sections before it, only"""
+        compound = next(iter(self.db.compounds.values()))
+        compound.databases
+        self.assertEqual(self.db.pending_sections, ['gibbs', 'synonym_index'])
+        self.assertIn('graph', self.db.__dict__)
+
+        self.db.graph
+        self.db.synrev
+        self.assertEqual(self.db.pending_sections, ['gibbs', 'synonym_index'])
+
+        self.assertTrue(any(hasattr(c, 'gibbs') for c in self.db.compounds.values()))
+        self.assertEqual(self.db.pending_sections, ['synonym_index'])
+
+    def test_preload(self):
+        """preload loads every section and returns nothing (see threads.Worker)"""
+        self.assertIsNone(self.db.preload())
+        self.assertEqual(self.db.pending_sections, [])
+        self.assertIn('synonym_index', self.db.__dict__)
+
+    def test_threads(self):
+        """Threads needing a section being loaded wait for it; it is loaded once"""
+        load_graph, calls = self.db.load_graph, []
+
+        def slow_load_graph():
+            calls.append(True)
+            time.sleep(0.2)
+            load_graph()
+
+        self.db.load_graph = slow_load_graph
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(self.db.graph is not None)) for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(calls, [True])
+        self.assertEqual(seen, [True] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
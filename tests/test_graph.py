@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx.graph import GraphIndex
+
+
+class Obj(object):
+    # Stands in for a database object
+    def __init__(self, id, **links):
+        self.id = id
+        self.__dict__.update(links)
+
+    def __repr__(self):
+        return self.id
+
+
+class Database(object):
+    '''
+    A -> B (r1, in p1), B -> C (r2, in p1 and p2), C -> D (r3, in p2); ATP is a secondary
+    substrate of r1. r1 is catalysed by protein e1 (gene g1), r3 by e2 (gene g2).
+    '''
+
+    def __init__(self):
+        c = dict((k, Obj(k)) for k in ['A', 'B', 'C', 'D', 'ATP'])
+        p = dict((k, Obj(k)) for k in ['p1', 'p2'])
+        g = dict((k, Obj(k)) for k in ['g1', 'g2'])
+        e = dict((k, Obj(k, genes=[g[gk]])) for k, gk in [('e1', 'g1'), ('e2', 'g2')])
+
+        def reaction(id, ins, outs, pathways, proteins=(), secondary=()):
+            return Obj(id, mtins=[c[k] for k in ins], mtouts=[c[k] for k in outs],
+                       smtins=[c[k] for k in secondary], smtouts=[],
+                       pathways=[p[k] for k in pathways], proteins=[e[k] for k in proteins])
+
+        r = [reaction('r1', ['A'], ['B'], ['p1'], ['e1'], ['ATP']),
+             reaction('r2', ['B'], ['C'], ['p1', 'p2']),
+             reaction('r3', ['C'], ['D'], ['p2'], ['e2'])]
+
+        self.compounds = OrderedDict((k, c[k]) for k in ['A', 'B', 'C', 'D', 'ATP'])
+        self.reactions = OrderedDict((o.id, o) for o in r)
+        self.pathways = OrderedDict((k, p[k]) for k in ['p1', 'p2'])
+        self.proteins = OrderedDict((k, e[k]) for k in ['e1', 'e2'])
+        self.genes = OrderedDict((k, g[k]) for k in ['g1', 'g2'])
+
+
+def ids(objs):
+    return [o.id for o in objs]
+
+
+class Test(unittest.TestCase):
+    """Unit tests for graph.GraphIndex"""
+
+    def setUp(self):
+        self.db = Database()
+        self.index = GraphIndex(self.db)
+
+    def test_incidence(self):
+        """Stored links are compound x reaction incidence matrices of 0/1"""
+        m = self.index.incidence('compound', 'reaction').toarray()
+        np.testing.assert_array_equal(m, [[1, 0, 0], [1, 1, 0], [0, 1, 1], [0, 0, 1], [0, 0, 0]])
+        m = self.index.incidence('secondary_substrate', 'reaction').toarray()
+        self.assertEqual(m.sum(), 1)
+        self.assertEqual(m[4, 0], 1)
+
+    def test_derived(self):
+        """Links between other types are made by multiplying through, and transposed"""
+        m = self.index.incidence('compound', 'pathway').toarray()
+        np.testing.assert_array_equal(m, [[1, 0], [1, 1], [1, 1], [0, 1], [0, 0]])
+        np.testing.assert_array_equal(self.index.incidence('pathway', 'compound').toarray(), m.T)
+        self.assertEqual(ids(self.index.linked([self.db.genes['g2']], 'gene', 'pathway')), ['p2'])
+        self.assertRaises(KeyError, self.index.incidence, 'compound', 'nothing')
+
+    def test_linked(self):
+        """Objects linked to any of the given ones, by object or id"""
+        self.assertEqual(ids(self.index.linked(['B'], 'compound', 'reaction')), ['r1', 'r2'])
+        self.assertEqual(ids(self.index.linked([self.db.reactions['r3'], 'missing'], 'reaction', 'compound')), ['C', 'D'])
+
+    def test_neighbours(self):
+        """Neighbours within a number of hops, not including the start"""
+        self.assertEqual(ids(self.index.neighbours(['A'], 'compound', 'reaction')), ['B'])
+        self.assertEqual(ids(self.index.neighbours(['A'], 'compound', 'reaction', hops=2)), ['B', 'C'])
+        self.assertEqual(ids(self.index.neighbours(['ATP'], 'compound', 'reaction')), [])
+
+    def test_overlap(self):
+        """Counts of shared objects; the diagonal counts each one's own"""
+        m = self.index.overlap('pathway', 'compound').toarray()
+        np.testing.assert_array_equal(m, [[3, 2], [2, 3]])
+
+    def test_vector(self):
+        """Dense vectors by id; unknown ids are left out"""
+        np.testing.assert_array_equal(self.index.vector('pathway', {'p2': 2., 'px': 1.}), [0, 2])
+
+    def test_table(self):
+        """Tables are built once per index"""
+        calls = []
+        build = lambda index: calls.append(index) or len(calls)
+        self.assertEqual(self.index.table('t', build), 1)
+        self.assertEqual(self.index.table('t', build), 1)
+        self.assertEqual(calls, [self.index])
+
+
+if __name__ == "__main__":
+    unittest.main()
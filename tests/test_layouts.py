@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import copy
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+from optparse import Values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import layouts
+
+# As graphviz renders the elements below: a node, and an edge of two colours with a two-run label
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+<g id="graph0" class="graph">
+<g id="n0" class="node"><polygon fill="#eeeeee" stroke="#000000" points="0,0 1,1"/><text fill="#111111">A</text></g>
+<g id="n1" class="node"><ellipse fill="none" stroke="#000000"/><text fill="#111111">B</text></g>
+<g id="e0" class="edge"><path fill="none" stroke="#aaaaaa" d="M0,0"/><path fill="none" stroke="#aaaaaa" d="M1,1"/>
+<polygon fill="#aaaaaa" stroke="#aaaaaa" points="0,0 1,1"/><text fill="#888888">to </text><text fill="#0000ff">B</text></g>
+</g>
+</svg>'''
+
+
+def colors(svg, id):
+    # (tag, fill, stroke) of each shape and text in the SVG group id
+    root = ET.fromstring(svg)
+    g = [g for g in root.iter('{%s}g' % layouts.SVG_NS) if g.get('id') == id][0]
+    return [(e.tag.split('}')[-1], e.get('fill'), e.get('stroke')) for e in g.iter() if e is not g]
+
+
+class Test(unittest.TestCase):
+    """Unit tests for layouts.layout_signature() and layouts.restyle_svg()"""
+
+    def setUp(self):
+        self.elements = {
+            'graph': {'splines': 'true'},
+            'clusters': [],
+            'nodes': [
+                ('A', {'id': 'n0', 'shape': 'box', 'label': 'A', 'color': '#ff0000', 'fillcolor': '#00ff00', 'fontcolor': '#0000ff'}),
+                ('B', {'id': 'n1', 'shape': 'oval', 'label': 'B', 'color': '#ff0000', 'fillcolor': '#00ff00', 'fontcolor': '#0000ff'}),
+            ],
+            'edges': [
+                ('A', 'B', {'id': 'e0', 'style': 'solid', 'color': '"#111111:#222222"', 'fontcolor': '#333333',
+                            'label': '<to <font color="#444444">B</font>>'}),
+            ],
+        }
+
+    def test_label_colors(self):
+        """Each text run of a label has its font colour, or the label's"""
+        self.assertEqual(layouts.label_colors('<a<br /><font color="#f00">b</font> c>', '#888'), ['#888', '#f00', '#888'])
+        self.assertEqual(layouts.edge_colors('"#111:#222"'), ['#111', '#222'])
+
+    def test_signature(self):
+        """Signatures ignore colours, but not what places or sizes the elements"""
+        restyled = copy.deepcopy(self.elements)
+        restyled['nodes'][0][1].update(color='#000000', fillcolor='#ffffff', shape='rect')
+        restyled['edges'][0][2].update(color='"#555555:#666666"', label='<to <font color="#777777">B</font>>')
+        self.assertEqual(layouts.layout_signature(restyled), layouts.layout_signature(self.elements))
+
+        for attributes, change in [(restyled['edges'][0][2], {'color': '"#555555"'}),
+                                   (restyled['edges'][0][2], {'label': '<to C>'}),
+                                   (restyled['nodes'][1][1], {'shape': 'box'})]:
+            attributes.update(change)
+            self.assertNotEqual(layouts.layout_signature(restyled), layouts.layout_signature(self.elements))
+
+    def test_restyle(self):
+        """Nodes, edges, arrows and label runs take the colours of the elements"""
+        svg = layouts.restyle_svg(SVG, self.elements)
+        self.assertEqual(colors(svg, 'n0'), [('polygon', '#00ff00', '#ff0000'), ('text', '#0000ff', None)])
+        self.assertEqual(colors(svg, 'n1'), [('ellipse', 'none', '#ff0000'), ('text', '#0000ff', None)])
+        self.assertEqual(colors(svg, 'e0'), [('path', 'none', '#111111'), ('path', 'none', '#222222'),
+                                             ('polygon', '#111111', '#111111'),
+                                             ('text', '#333333', None), ('text', '#444444', None)])
+
+    def test_invisible(self):
+        """Invisible edges are left as they are"""
+        self.elements['edges'][0][2]['style'] = 'invis'
+        self.assertEqual(colors(layouts.restyle_svg(SVG, self.elements), 'e0'), colors(SVG, 'e0'))
+
+    def test_mismatch(self):
+        """SVG that doesn't match up with the elements isn't re-styled"""
+        self.elements['edges'][0][2]['color'] = '"#111111"'
+        self.assertIsNone(layouts.restyle_svg(SVG, self.elements))
+        self.elements['nodes'][0][1]['id'] = 'n9'
+        self.assertIsNone(layouts.restyle_svg(SVG, self.elements))
+
+    def test_layout_key(self):
+        """Keys differ by pathways, options and layout hints"""
+        class Obj(object):
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+
+        pathways = [Obj(id='p1'), Obj(id='p2')]
+        options = Values({'output': 'svg', 'cluster_by': 'pathway'})
+        key = layouts.layout_key(pathways, options)
+        self.assertEqual(key, layouts.layout_key(pathways, Values({'cluster_by': 'pathway', 'output': 'svg'})))
+        self.assertNotEqual(key, layouts.layout_key(pathways[:1], options))
+        self.assertNotEqual(key, layouts.layout_key(pathways, Values({'output': 'png', 'cluster_by': 'pathway'})))
+        self.assertNotEqual(key, layouts.layout_key(pathways, options, Obj(objects={'A': '0,0!'})))
+
+
+if __name__ == "__main__":
+    unittest.main()
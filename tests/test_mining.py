@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import mining, threads
+from pathomx.data import DataSet
+from pathomx.graph import GraphIndex
+
+from test_graph import Database
+
+
+def dataset(entities, values):
+    # One row DataSet of values for entities
+    dso = DataSet(size=(1, len(entities)))
+    dso.entities[1] = entities
+    dso.data = np.array([values], dtype=float)
+    return dso
+
+
+class Test(unittest.TestCase):
+    """Unit tests for mining.measured_values() and mining.pathway_scores()"""
+
+    def setUp(self):
+        self.db = Database()
+        for type, objs in [('compound', self.db.compounds), ('gene', self.db.genes), ('protein', self.db.proteins)]:
+            for o in objs.values():
+                o.type = type
+        self.graph = GraphIndex(self.db)
+        # A (p1) up, B (p1 and p2) down
+        self.inputs = [dataset([self.db.compounds['A'], self.db.compounds['B']], [2, -3])]
+
+    def scores(self, inputs=None, mining_type='c', **options):
+        measured = mining.measured_values(self.graph, inputs or self.inputs, mining_type)
+        return mining.pathway_scores(self.graph, measured, [v[:, None] for t, pos, v in measured],
+                                     mining_type=mining_type, **options)[:, 0]
+
+    def test_types(self):
+        """Each mining type scores its value of the entities, shared between their pathways"""
+        np.testing.assert_allclose(self.scores(mining_type='c'), [3.5, 1.5])
+        np.testing.assert_allclose(self.scores(mining_type='u'), [2, 0])
+        np.testing.assert_allclose(self.scores(mining_type='d'), [1.5, 1.5])
+        np.testing.assert_allclose(self.scores(mining_type='t'), [0.5, 1.5])
+
+    def test_counts(self):
+        """Counts of measured entities are whole, however shared"""
+        np.testing.assert_allclose(self.scores(mining_type='m'), [2, 1])
+
+    def test_not_shared(self):
+        """Without sharing each pathway gets the entity's whole score"""
+        np.testing.assert_allclose(self.scores(shared=False), [5, 3])
+
+    def test_relative(self):
+        """Relative scores are divided by the pathway's number of reactions"""
+        np.testing.assert_allclose(self.scores(relative=True), [1.75, 0.75])
+
+    def test_hops(self):
+        """Each hop passes decay times the mean score of an entity's neighbours"""
+        # A, B, C, D = 2, 3, 0, 0 + 0.5 * (3, (2 + 0) / 2, (3 + 0) / 2, 0)
+        np.testing.assert_allclose(self.scores(shared=False, hops=1, decay=0.5), [7.75, 4.25])
+        np.testing.assert_allclose(self.scores(shared=False, hops=1, decay=0), [5, 3])
+
+    def test_entity_types(self):
+        """Genes and proteins score their pathways; entities not in the database are left out"""
+        g1, e2 = self.db.genes['g1'], self.db.proteins['e2']
+        unknown = type(g1)('X')
+        unknown.type = 'compound'
+        inputs = [dataset([g1, e2, unknown, 'label'], [1, 2, 4, 8])]
+        np.testing.assert_allclose(self.scores(inputs, shared=False), [1, 2])
+
+    def test_repeated(self):
+        """Entities measured more than once count each time"""
+        inputs = self.inputs + [dataset([self.db.compounds['A']], [1])]
+        np.testing.assert_allclose(self.scores(inputs), [4.5, 1.5])
+
+    def test_columns(self):
+        """Each column of values is scored independently"""
+        measured = mining.measured_values(self.graph, self.inputs)
+        scores = mining.pathway_scores(self.graph, measured, [np.array([[2, 3], [3, 2]])])
+        np.testing.assert_allclose(scores, [[3.5, 4], [1.5, 1]])
+
+
+class TestPermutations(unittest.TestCase):
+    """Unit tests for mining.permutation_pvalues()"""
+
+    def setUp(self):
+        self.db = Database()
+        for o in self.db.compounds.values():
+            o.type = 'compound'
+        self.graph = GraphIndex(self.db)
+        inputs = [dataset([self.db.compounds['A'], self.db.compounds['B']], [2, -3])]
+        self.measured = mining.measured_values(self.graph, inputs)
+        self.scores = mining.pathway_scores(self.graph, self.measured, [v[:, None] for t, pos, v in self.measured])[:, 0]
+
+    def test_pvalues(self):
+        """p-values are the share of permutations scoring at least the observed"""
+        # Swapping A and B scores p1 4 (>= 3.5) and p2 1 (< 1.5)
+        pvalues = mining.permutation_pvalues(self.graph, self.measured, self.scores, 1000)
+        self.assertEqual(pvalues[0], 1)
+        self.assertAlmostEqual(pvalues[1], 0.5, delta=0.05)
+
+    def test_repeatable(self):
+        """The same data gives the same p-values"""
+        a = mining.permutation_pvalues(self.graph, self.measured, self.scores, 300)
+        b = mining.permutation_pvalues(self.graph, self.measured, self.scores, 300)
+        np.testing.assert_array_equal(a, b)
+
+    def test_cancelled(self):
+        """Permutations stop at their checkpoints once the worker is cancelled"""
+        token = threads.CancellationToken()
+        token.cancel()
+        self.assertRaises(threads.WorkerCancelled, threads.run_with_token, token,
+                          mining.permutation_pvalues, self.graph, self.measured, self.scores, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
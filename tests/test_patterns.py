@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import patterns
+from pathomx.graph import GraphIndex
+
+from test_graph import Obj
+
+
+class Database(object):
+    '''
+    X -> Y (r1) oxidises NADH to NAD, Y -> Z (r2) reduces NAD to NADH, Z <-> W (r3) takes
+    a phosphate from ATP to ADP. GLC is not in any reaction.
+    '''
+
+    def __init__(self):
+        c = OrderedDict((k, Obj(k, type='compound')) for k in ['X', 'Y', 'Z', 'W', 'NAD', 'NADH', 'ATP', 'ADP', 'GLC'])
+
+        def reaction(id, ins, outs, smtins, smtouts, dir='forward'):
+            return Obj(id, mtins=[c[k] for k in ins], mtouts=[c[k] for k in outs], dir=dir,
+                       smtins=[c[k] for k in smtins], smtouts=[c[k] for k in smtouts], pathways=[], proteins=[])
+
+        r = [reaction('r1', ['X'], ['Y'], ['NADH'], ['NAD']),
+             reaction('r2', ['Y'], ['Z'], ['NAD'], ['NADH']),
+             reaction('r3', ['Z'], ['W'], ['ATP'], ['ADP'], dir='both')]
+
+        self.compounds = c
+        self.reactions = OrderedDict((o.id, o) for o in r)
+        self.pathways = OrderedDict()
+        self.proteins = OrderedDict()
+        self.genes = OrderedDict()
+        self.index = dict(c)
+
+
+def equilibrium_scan(db, carriers):
+    # Reference: carrier balance of each reaction, by scanning the reactions
+    result = []
+    for r in db.reactions.values():
+        balance = sum(carriers.get(m.id, 0) for m in r.smtins) - sum(carriers.get(m.id, 0) for m in r.smtouts)
+        if balance:
+            ins, outs = (r.mtins, r.mtouts) if balance > 0 else (r.mtouts, r.mtins)
+            result.extend([mtin.id, mtout.id] for mtin in ins for mtout in outs)
+    return result
+
+
+class Test(unittest.TestCase):
+    """Unit tests for the reaction-pattern tables in patterns"""
+
+    def setUp(self):
+        self.db = Database()
+        self.graph = GraphIndex(self.db)
+
+    def test_equilibrium(self):
+        """Main compound pairs follow the carriers; reactions moving them back are reversed"""
+        self.assertEqual(patterns.equilibrium_table(self.graph, patterns.PROTON_CARRIERS), [['X', 'Y'], ['Z', 'Y']])
+        self.assertEqual(patterns.equilibrium_table(self.graph, patterns.PHOSPHATE_CARRIERS), [['Z', 'W']])
+
+    def test_equilibrium_scan(self):
+        """Tables match a scan of the reactions"""
+        for carriers in [patterns.PROTON_CARRIERS, patterns.PHOSPHATE_CARRIERS]:
+            self.assertEqual(patterns.equilibrium_table(self.graph, carriers), equilibrium_scan(self.db, carriers))
+
+    def test_cofactor(self):
+        """Reactions converting a cofactor pair give their main compound pairs, in database order"""
+        self.assertEqual(patterns.cofactor_table(self.graph, [['NAD', 'NADH']]), [['Y', 'X'], ['Y', 'Z']])
+        self.assertEqual(patterns.cofactor_table(self.graph, [['NAD', 'MISSING']]), [])
+
+    def test_endpoints(self):
+        """Endpoints are compounds never a substrate, nor in a bidirectional reaction"""
+        self.assertEqual(patterns.endpoint_table(self.graph), ['NAD', 'NADH', 'ATP', 'ADP', 'GLC'])
+
+    def test_predefined_tables(self):
+        """Each view's rows come with the entities of the ids in the database"""
+        tables = patterns.predefined_tables(self.db, self.graph)
+        rows, entities = tables['redox']
+        self.assertEqual(rows, [['X', 'Y'], ['Z', 'Y']])
+        self.assertEqual([e.id for e in entities], ['X', 'Y', 'Z', 'Y'])
+        self.assertIs(tables['energy'][0], patterns.ENERGY)
+
+
+if __name__ == "__main__":
+    unittest.main()
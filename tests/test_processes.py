@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import processes, threads
+from pathomx.data import DataSet
+
+
+class Config(object):
+    def __init__(self, **config):
+        self.defaults = {}
+        self.config = config
+
+
+class Main(object):
+    db = None
+
+
+class Tool(object):
+    # Stands in for a GenericApp; in the worker process these methods run on a ProcessTool
+    def __init__(self, **config):
+        self.config = Config(**config)
+        self.m = Main()
+        self.name = None
+
+    def set_name(self, name):
+        self.name = name
+
+
+class ScaleTool(Tool):
+
+    def generate(self, input):
+        input.data *= self.config.get('factor')  # Copy-on-write mapping of the input
+        self.set_name('Scaled')
+        return {'output': input, 'pid': os.getpid()}
+
+    def double(self, x):
+        return 2 * x
+
+
+class WaitTool(Tool):
+
+    def generate(self, marker):
+        open(marker + '.started', 'w').close()
+        try:
+            for n in range(200):
+                threads.checkpoint()
+                time.sleep(0.05)
+        finally:
+            open(marker, 'w').close()
+        return {}
+
+
+def dataset():
+    dso = DataSet(size=(2, 3))
+    dso.data[:] = np.arange(6.).reshape(2, 3)
+    dso.labels[0] = ['a', 'b']
+    dso.scales[1] = [1., 2., 3.]
+    dso.classes[0] = ['x', 'y']
+    return dso
+
+
+def tearDownModule():
+    if processes._pool is not None:
+        processes._pool.shutdown()
+        processes._pool = None
+
+
+class TestSharedDataSet(unittest.TestCase):
+    """Unit tests for processes.SharedDataSet and processes.share_input()"""
+
+    def setUp(self):
+        self.dso = dataset()
+        self.max_bytes = processes.shared_max_bytes
+
+    def tearDown(self):
+        processes.shared_max_bytes = self.max_bytes
+
+    def test_round_trip(self):
+        """Data and annotations come back as shared"""
+        shared = processes.SharedDataSet(self.dso)
+        dso = shared.get()
+        np.testing.assert_array_equal(dso.data, self.dso.data)
+        self.assertEqual(dso.labels[0], ['a', 'b'])
+        self.assertEqual(dso.scales[1], [1., 2., 3.])
+        self.assertEqual(dso.classes[0], ['x', 'y'])
+        self.assertEqual(dso.content_hash(), self.dso.content_hash())
+        shared.release()
+
+    def test_copy_on_write(self):
+        """Writes to a copy-on-write mapping don't reach the file"""
+        shared = processes.SharedDataSet(self.dso)
+        dso = shared.get(mode='c')
+        dso.data[:] = 0
+        np.testing.assert_array_equal(shared.get().data, self.dso.data)
+        shared.release()
+
+    def test_share_input(self):
+        """Inputs with the same content share a file, removed once unused beyond shared_max_bytes"""
+        key, shared = processes.share_input(self.dso)
+        key2, shared2 = processes.share_input(self.dso.as_copy())
+        self.assertEqual(key, key2)
+        self.assertEqual(shared.file, shared2.file)
+
+        other = self.dso.as_copy()
+        other.data[0, 0] = 10.
+        key3, shared3 = processes.share_input(other)
+        self.assertNotEqual(shared3.file, shared.file)
+
+        processes.shared_max_bytes = 0
+        processes.unshare_input(key)
+        self.assertTrue(os.path.exists(shared.file))  # Still used by the second call
+        processes.unshare_input(key2)
+        processes.unshare_input(key3)
+        self.assertFalse(os.path.exists(shared.file))
+        self.assertFalse(os.path.exists(shared3.file))
+
+
+class TestCancellation(unittest.TestCase):
+    """Unit tests for processes.SharedFlag and processes.ProcessToken"""
+
+    def test_token(self):
+        """Setting the flag cancels the token reading it"""
+        flag = processes.SharedFlag()
+        token = processes.ProcessToken(flag)
+        self.assertFalse(token.cancelled)
+        token.check()
+
+        flag.set()
+        self.assertTrue(token.cancelled)
+        self.assertRaises(threads.WorkerCancelled, token.check)
+        flag.release()
+
+    def test_released(self):
+        """Tokens for a call that is already over are cancelled"""
+        flag = processes.SharedFlag()
+        flag.release()
+        self.assertRaises(threads.WorkerCancelled, processes.ProcessToken, flag)
+
+
+class TestGenerate(unittest.TestCase):
+    """Unit tests for processes.generate() and processes.submit()"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def test_generate(self):
+        """generate runs in another process, with the tool's config, leaving the input as it was"""
+        dso = dataset()
+        tool = ScaleTool(factor=2.)
+        result = processes.generate(tool, {'input': dso.as_view()})
+
+        self.assertNotEqual(result['pid'], os.getpid())
+        np.testing.assert_array_equal(result['output'].data, dso.data * 2)
+        self.assertEqual(result['output'].labels[0], ['a', 'b'])
+        np.testing.assert_array_equal(dso.data, np.arange(6.).reshape(2, 3))
+        self.assertEqual(tool.name, 'Scaled')
+
+    def test_submit(self):
+        """Other methods run in the pool with pickled arguments and results"""
+        self.assertEqual(processes.submit(ScaleTool(), 'double', 21).result(), 42)
+
+    def test_cancel(self):
+        """Cancelling the waiting worker stops generate in the process at its next checkpoint"""
+        marker = os.path.join(self.path, 'stopped')
+        token = threads.CancellationToken()
+        raised = []
+
+        def run():
+            try:
+                threads.run_with_token(token, processes.generate, WaitTool(), {'marker': marker})
+            except threads.WorkerCancelled:
+                raised.append(True)
+
+        t = threading.Thread(target=run)
+        t.start()
+        start = time.time()
+        while not os.path.exists(marker + '.started') and time.time() - start < 30:
+            time.sleep(0.05)
+
+        start = time.time()
+        token.cancel()
+        t.join(5)
+        self.assertEqual(raised, [True])
+
+        while not os.path.exists(marker) and time.time() - start < 5:
+            time.sleep(0.05)
+        self.assertTrue(os.path.exists(marker))
+        self.assertLess(time.time() - start, 5)  # Not the 10 s it runs for uncancelled
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import profiling
+from pathomx.data import DataSet
+from pathomx.threads import WorkerCancelled
+
+
+class Signal(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, *args):
+        self.emitted.append(args)
+
+
+class MainWindow(object):
+    def __init__(self):
+        self.profile_log = profiling.ProfileLog()
+
+
+class Tool(object):
+    # Stands in for a GenericApp
+    def __init__(self, m, name='Tool', id='1'):
+        self.m = m
+        self.name = name
+        self.id = id
+        self.profile = {}
+        self.profiled = Signal()
+
+
+def generate(input):
+    return {'output': DataSet(size=(2, 5)), 'record': profiling.current()}
+
+
+class TestProfile(unittest.TestCase):
+    """Unit tests for profiling.profile()"""
+
+    def setUp(self):
+        self.m = MainWindow()
+        self.tool = Tool(self.m)
+        self.trace_memory = profiling.trace_memory
+
+    def tearDown(self):
+        profiling.trace_memory = self.trace_memory
+
+    def test_done(self):
+        """Calls are recorded with their time and the shapes going in and out"""
+        result = profiling.profile(self.tool, 'generate', generate, input=DataSet(size=(2, 3)))
+        record = self.tool.profile['generate']
+        self.assertIs(result['record'], record)  # Current during the call
+        self.assertIsNone(profiling.current())
+
+        self.assertEqual(record.status, 'done')
+        self.assertEqual(record.inputs, {'input': [2, 3]})
+        self.assertEqual(record.outputs, {'output': [2, 5]})
+        self.assertGreaterEqual(record.wall, 0)
+        self.assertEqual(self.m.profile_log.records(), [record])
+        self.assertEqual(self.tool.profiled.emitted, [(record,)])
+
+    def test_error(self):
+        """Errors and cancellations are recorded and raised"""
+        def fail():
+            raise ValueError()
+
+        def cancelled():
+            raise WorkerCancelled()
+
+        self.assertRaises(ValueError, profiling.profile, self.tool, 'generate', fail)
+        self.assertEqual(self.tool.profile['generate'].status, 'error')
+        self.assertRaises(WorkerCancelled, profiling.profile, self.tool, 'prerender', cancelled)
+        self.assertEqual(self.tool.profile['prerender'].status, 'cancelled')
+        self.assertTrue(self.tool.profile['prerender'].label().endswith(' (cancelled)'))
+
+    def test_peak_memory(self):
+        """Peak memory is traced only when trace_memory is set"""
+        def allocate():
+            return {'sum': np.ones(1024 * 1024).sum()}
+
+        profiling.trace_memory = False
+        profiling.profile(self.tool, 'generate', allocate)
+        self.assertIsNone(self.tool.profile['generate'].peak)
+
+        profiling.trace_memory = True
+        profiling.profile(self.tool, 'generate', allocate)
+        self.assertGreaterEqual(self.tool.profile['generate'].peak, 8 * 1024 * 1024)
+
+
+class TestProfileLog(unittest.TestCase):
+    """Unit tests for profiling.ProfileLog"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.m = MainWindow()
+        self.log = self.m.profile_log
+        self.tool = Tool(self.m, name='Mean, centre')
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def record(self):
+        profiling.profile(self.tool, 'generate', generate, input=DataSet(size=(2, 3)))
+        return self.tool.profile['generate']
+
+    def test_runs(self):
+        """Records are kept per run; empty runs are not started again"""
+        first = self.record()
+        self.log.new_run()
+        self.log.new_run()
+        second = self.record()
+        self.assertEqual(self.log.records(), [second])
+        self.assertEqual(self.log.records(all_runs=True), [first, second])
+        self.assertEqual((first.run, second.run), (1, 2))
+
+        self.log.new_run()
+        self.assertEqual(self.log.records(), [second])  # Latest run with records
+
+    def test_max_runs(self):
+        """Only the latest max_runs runs are kept"""
+        log = profiling.ProfileLog(max_runs=2)
+        self.m.profile_log = log
+        for n in range(3):
+            log.new_run()
+            self.record()
+        self.assertEqual([r.run for r in log.records(all_runs=True)], [2, 3])
+
+    def test_write(self):
+        """Records are written as CSV, or JSON by extension"""
+        self.record()
+        fn = os.path.join(self.path, 'profile.csv')
+        self.log.write(fn)
+        with open(fn, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['tool'], 'Mean, centre')
+        self.assertEqual(rows[0]['inputs'], 'input=2x3')
+        self.assertEqual(rows[0]['outputs'], 'output=2x5')
+
+        fn = os.path.join(self.path, 'profile.json')
+        self.log.write(fn)
+        with open(fn) as f:
+            records = json.load(f)
+        self.assertEqual(records[0]['status'], 'done')
+        self.assertEqual(records[0]['inputs'], {'input': [2, 3]})
+
+
+if __name__ == "__main__":
+    unittest.main()
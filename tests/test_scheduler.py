@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+from collections import defaultdict
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyQt5.QtCore import QCoreApplication
+
+from pathomx.scheduler import WorkflowScheduler
+
+app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+
+class ProfileLog(object):
+    def new_run(self):
+        pass
+
+
+class MainWindow(object):
+    def __init__(self):
+        self.apps = []
+        self.profile_log = ProfileLog()
+
+
+class Output(object):
+    def __init__(self, manager):
+        self.manager = manager
+
+
+class DataManager(object):
+    def __init__(self, view):
+        self.v = view
+        self.i = {}
+        self.watchers = defaultdict(set)
+
+
+class Tool(object):
+    # Stands in for a GenericApp; records its runs in the log and reports whether it started
+    def __init__(self, m, name, *upstream):
+        self.m = m
+        self.name = name
+        self.data = DataManager(self)
+        self.starts = True
+        self.cancelled = 0
+        for n, u in enumerate(upstream):
+            self.data.i['input%d' % n] = Output(u.data)
+            u.data.watchers['output'].add(self.data)
+        m.apps.append(self)
+
+    def autogenerate(self):
+        self.m.log.append(self.name)
+        return self.starts
+
+    def autogenerate_append(self, interfaces):
+        self.m.log.append((self.name, sorted(interfaces)))
+        return self.starts
+
+    def cancel_generate(self):
+        self.cancelled += 1
+
+    def __repr__(self):
+        return self.name
+
+
+class Test(unittest.TestCase):
+    """Unit tests for scheduler.WorkflowScheduler"""
+
+    def setUp(self):
+        self.m = MainWindow()
+        self.m.log = []
+        self.scheduler = WorkflowScheduler(self.m)
+
+        # Diamond: a -> b, c -> d
+        self.a = Tool(self.m, 'a')
+        self.b = Tool(self.m, 'b', self.a)
+        self.c = Tool(self.m, 'c', self.a)
+        self.d = Tool(self.m, 'd', self.b, self.c)
+
+    def finish(self):
+        # Run the deferred pass, then finish running tools until the workflow is done
+        app.processEvents()
+        while self.scheduler.running:
+            self.scheduler.finished(sorted(self.scheduler.running, key=repr)[0])
+        self.assertFalse(self.scheduler.busy())
+
+    def test_order(self):
+        """Tools run once each, after all their upstream tools"""
+        self.scheduler.mark_dirty(self.a)
+        self.finish()
+        self.assertEqual(self.m.log[0], 'a')
+        self.assertEqual(sorted(self.m.log[1:3]), ['b', 'c'])
+        self.assertEqual(self.m.log[3:], ['d'])
+
+    def test_coalesced(self):
+        """Changes arriving together are run in one pass"""
+        self.scheduler.mark_dirty(self.b)
+        self.scheduler.mark_dirty(self.c)
+        self.scheduler.mark_dirty(self.b)
+        self.finish()
+        self.assertEqual(sorted(self.m.log[:2]), ['b', 'c'])
+        self.assertEqual(self.m.log[2:], ['d'])
+
+    def test_marked_while_running(self):
+        """A tool marked while generating is cancelled and runs again"""
+        self.scheduler.mark_dirty(self.a)
+        app.processEvents()
+        self.assertEqual(self.scheduler.running, set([self.a]))
+
+        self.scheduler.mark_dirty(self.a)
+        self.assertEqual(self.a.cancelled, 1)
+        self.finish()
+        self.assertEqual(self.m.log.count('a'), 2)
+        self.assertEqual(self.m.log.count('d'), 1)
+
+    def test_not_started(self):
+        """Tools that don't start (paused) don't hold up the others"""
+        self.b.starts = False
+        self.scheduler.mark_dirty(self.a)
+        self.finish()
+        self.assertEqual(sorted(self.m.log), ['a', 'b', 'c', 'd'])
+
+    def test_started_outside(self):
+        """Descendants of a tool running outside the scheduler wait for it"""
+        self.scheduler.started(self.a)
+        self.scheduler.mark_dirty(self.b)
+        app.processEvents()
+        self.assertEqual(self.m.log, [])
+
+        self.scheduler.finished(self.a)
+        self.finish()
+        self.assertEqual(self.m.log, ['b', 'd'])
+
+    def test_appended(self):
+        """Appended tools extend their results; descendants run for what is passed on"""
+        self.scheduler.mark_appended(self.a, 'input')
+        app.processEvents()
+        self.assertEqual(self.m.log, [('a', ['input'])])
+
+        # a passes appended rows on to b only, and b passes none on: c and d have nothing to do
+        self.scheduler.mark_appended(self.b, 'input0')
+        self.finish()
+        self.assertEqual(self.m.log, [('a', ['input']), ('b', ['input0'])])
+
+    def test_appended_and_dirty(self):
+        """A tool marked both appended and dirty runs in full"""
+        self.scheduler.mark_appended(self.a, 'input')
+        self.scheduler.mark_dirty(self.a)
+        self.finish()
+        self.assertEqual(self.m.log[0], 'a')
+        self.assertEqual(len(self.m.log), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
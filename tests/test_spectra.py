@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+import scipy.optimize
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import spectra, threads
+
+
+class TestBinning(unittest.TestCase):
+    """Unit tests for spectra.bin_index() and spectra.bin_spectra()"""
+
+    def setUp(self):
+        self.scale = np.linspace(0, 10, 11)
+        self.data = np.tile(self.scale, (3, 1))
+
+    def test_bin_index(self):
+        """Points are placed in the bin they fall in; the last bin includes its upper edge"""
+        idx = spectra.bin_index(self.scale, [2, 5, 8])
+        np.testing.assert_array_equal(idx, [-1, -1, 0, 0, 0, 1, 1, 1, 1, -1, -1])
+
+    def test_bin_spectra(self):
+        """Each bin is the mean of its points; empty bins are NaN"""
+        idx = spectra.bin_index(self.scale, [0, 5, 5.5, 6, 10])
+        result = spectra.bin_spectra(self.data, idx, 4)
+        np.testing.assert_array_equal(result[:, [0, 1, 3]], [[2, 5, 8]] * 3)
+        self.assertTrue(np.isnan(result[:, 2]).all())
+
+    def test_descending_scale(self):
+        """Descending (ppm) scales bin as ascending ones"""
+        idx = spectra.bin_index(self.scale[::-1], [0, 5, 10])
+        result = spectra.bin_spectra(self.data[:, ::-1], idx, 2)
+        np.testing.assert_array_equal(result, [[2, 7.5]] * 3)
+
+    def test_unordered_scale(self):
+        """Columns out of bin order are sorted into their bins"""
+        order = np.random.RandomState(0).permutation(len(self.scale))
+        idx = spectra.bin_index(self.scale[order], [0, 5, 10])
+        result = spectra.bin_spectra(self.data[:, order], idx, 2)
+        np.testing.assert_array_equal(result, [[2, 7.5]] * 3)
+
+    def test_out(self):
+        """Bins are written into out when given"""
+        out = np.zeros((3, 2))
+        result = spectra.bin_spectra(self.data, spectra.bin_index(self.scale, [0, 5, 10]), 2, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, [[2, 7.5]] * 3)
+
+    def test_no_columns_in_edges(self):
+        """With no column inside the edges every bin is NaN"""
+        idx = spectra.bin_index(self.scale, [20, 21, 22])
+        result = spectra.bin_spectra(self.data, idx, 2)
+        self.assertEqual(result.shape, (3, 2))
+        self.assertTrue(np.isnan(result).all())
+
+    def test_edges(self):
+        """Uniform edges span the scale; entered edges are parsed and sorted"""
+        np.testing.assert_allclose(spectra.uniform_bin_edges(self.scale, 2.5), [0, 2.5, 5, 7.5])
+        np.testing.assert_array_equal(spectra.parse_bin_edges('5, 1 3,1'), [1, 3, 5])
+
+    def test_intelligent_bins(self):
+        """Intelligent bins are split at the minima between peaks"""
+        x = np.arange(300)
+        ref = np.exp(-(x - 75) ** 2 / 50.) + np.exp(-(x - 225) ** 2 / 50.)
+        idx, n = spectra.intelligent_bin_index(ref, x * 0.001, 0.01)
+        self.assertEqual(n, 2)
+        self.assertEqual(idx[75], 0)
+        self.assertEqual(idx[225], 1)
+        self.assertTrue(100 < np.flatnonzero(idx == 1)[0] < 200)
+
+
+class TestPhase(unittest.TestCase):
+    """Unit tests for spectra.autophase_batch()"""
+
+    def setUp(self):
+        # Complex Lorentzians, dephased by p0 + p1 * ramp (degrees)
+        x = np.arange(4096.)
+        lorentzian = lambda x0, width, height: height / (width - 1j * (x - x0))
+        self.spectra = np.tile(lorentzian(1000, 3, 1) + lorentzian(2500, 4, 0.6) + lorentzian(3200, 2, 0.3), (6, 1))
+        self.ramp = spectra.phase_ramp(4096)
+        self.p0 = np.array([30, -45, 10, 60, -20, 5.])
+        self.p1 = np.array([20, -10, 0, 15, 5, -30.])
+        self.block = spectra.PHASE_BLOCK
+
+    def tearDown(self):
+        spectra.PHASE_BLOCK = self.block
+
+    def test_phase(self):
+        """Phasing by the negated correction undoes a phase correction"""
+        z = spectra.phase(spectra.phase(self.spectra, self.ramp, self.p0, self.p1), self.ramp, -self.p0, -self.p1)
+        np.testing.assert_allclose(z, self.spectra)
+
+    def test_acme(self):
+        """ACME recovers p0 and p1"""
+        dephased = spectra.phase(self.spectra, self.ramp, -self.p0, -self.p1)
+        z, pc = spectra.autophase_batch(dephased, algorithm='ACME')
+        np.testing.assert_allclose(pc, np.c_[self.p0, self.p1], atol=0.5)
+        np.testing.assert_allclose(z, spectra.phase(dephased, self.ramp, pc[:, 0], pc[:, 1]))
+
+    def test_peak_minima(self):
+        """Peak_minima recovers p0, keeping p1 at its starting value"""
+        dephased = spectra.phase(self.spectra, self.ramp, -self.p0, 0)
+        for pc_init in [None, [0, 0]]:
+            z, pc = spectra.autophase_batch(dephased, pc_init)
+            np.testing.assert_allclose(pc[:, 0], self.p0, atol=0.5)
+            np.testing.assert_array_equal(pc[:, 1], 0)
+
+    def test_matches_fmin(self):
+        """With noise, each spectrum reaches the minimum fmin finds for it alone"""
+        noise = 0.001 * np.random.RandomState(0).randn(*self.spectra.shape)
+        dephased = spectra.phase(self.spectra + noise, self.ramp, -self.p0, -self.p1)
+        z, pc = spectra.autophase_batch(dephased, algorithm='ACME')
+        for s, p in zip(dephased, pc):
+            fn = lambda x: spectra.acme(np.real(spectra.phase(s.reshape(1, -1), self.ramp, x[0], x[1])))[0]
+            self.assertLess(fn(p) - fn(scipy.optimize.fmin(fn, [0, 0], disp=False)), 1e-4)
+
+    def test_blocks(self):
+        """Spectra are refined the same in any block size"""
+        dephased = spectra.phase(self.spectra, self.ramp, -self.p0, -self.p1)
+        z, pc = spectra.autophase_batch(dephased, algorithm='ACME')
+        spectra.PHASE_BLOCK = 4
+        np.testing.assert_array_equal(spectra.autophase_batch(dephased, algorithm='ACME')[1], pc)
+
+    def test_cancelled(self):
+        """Refinement stops at its checkpoints once the worker is cancelled"""
+        token = threads.CancellationToken()
+        token.cancel()
+        self.assertRaises(threads.WorkerCancelled, threads.run_with_token, token,
+                          spectra.autophase_batch, self.spectra, [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx.synonyms import SynonymIndex, normalise
+
+
+class Entity(object):
+    # Stands in for a database entity; only the type is used
+    def __init__(self, id, type='compound'):
+        self.id = id
+        self.type = type
+
+    def __repr__(self):
+        return self.id
+
+
+class Test(unittest.TestCase):
+    """Unit tests for synonyms.SynonymIndex.resolve_many()"""
+
+    def setUp(self):
+        self.glucose = Entity('GLC')
+        self.g6p = Entity('GLC-6-P')
+        self.pyruvate = Entity('PYRUVATE')
+        self.gene = Entity('PK', type='gene')
+        synrev = {
+            'D-Glucose': self.glucose,
+            'alpha-D-glucose': self.glucose,
+            'D-Glucose 6-phosphate': self.g6p,
+            'Pyruvate': self.pyruvate,
+        }
+        synrev_by_type = {'gene': {'PK': self.gene}, 'compound': {'pk': self.pyruvate}}
+        self.index = SynonymIndex(synrev, synrev_by_type)
+
+    def test_normalise(self):
+        """Case, Greek letters, accents and punctuation are normalised away"""
+        self.assertEqual(normalise('α-D-Glucose'), 'alphadglucose')
+        self.assertEqual(normalise('Glücose 6-phosphate'), 'glucose6phosphate')
+
+    def test_exact(self):
+        """Exact and lower case synonyms score 1"""
+        result = self.index.resolve_many(['D-Glucose', 'pyruvate'])
+        self.assertEqual(result, [[(self.glucose, 1.)], [(self.pyruvate, 1.)]])
+
+    def test_normalised(self):
+        """Synonyms equal once normalised score 1"""
+        result = self.index.resolve_many(['d-glucose-6-phosphate', 'α-D-glucose'])
+        self.assertEqual(result, [[(self.g6p, 1.)], [(self.glucose, 1.)]])
+
+    def test_type(self):
+        """Candidates are limited to the given type"""
+        self.assertEqual(self.index.resolve_many(['PK'], type='gene'), [[(self.gene, 1.)]])
+        self.assertEqual(self.index.resolve_many(['PK'], type='compound'), [[(self.pyruvate, 1.)]])
+
+    def test_fuzzy(self):
+        """Near misses are matched by trigram similarity, best first"""
+        result = self.index.resolve_many(['D-Glucose 6-phosphat'])
+        entity, score = result[0][0]
+        self.assertIs(entity, self.g6p)
+        self.assertTrue(0.6 <= score < 1)
+
+        self.assertEqual(self.index.resolve_many(['D-Glucose 6-phosphat'], fuzzy=False), [[]])
+
+    def test_substring(self):
+        """A label contained in a longer synonym is not matched to it"""
+        index = SynonymIndex({'D-Glucose 6-phosphate': self.g6p, 'Glucose 6P': self.g6p}, {})
+        self.assertEqual(index.resolve_many(['Glucose', 'D-Glucose']), [[], []])
+
+    def test_unmatched(self):
+        """Empty and unmatched labels give no candidates"""
+        self.assertEqual(self.index.resolve_many(['', None, 'Cholesterol']), [[], [], []])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import text
+
+
+class Test(unittest.TestCase):
+    """Unit tests for text.read_rows() and text.read_columns()"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.chunk_bytes = text.CHUNK_BYTES
+
+    def tearDown(self):
+        text.CHUNK_BYTES = self.chunk_bytes
+        shutil.rmtree(self.path, True)
+
+    def write(self, content, name='data.csv'):
+        fn = os.path.join(self.path, name)
+        with open(fn, 'w') as f:
+            f.write(content)
+        return fn
+
+    def test_rows(self):
+        """Samples in rows; numeric variable names become the scale, others labels"""
+        fn = self.write('Sample,Class,1.5,2.5,Glucose\ns1,x,1,2,3\n\ns2,y,4,5,6\n')
+        progress = []
+        dso = text.read_rows(fn, progress=progress.append)
+        np.testing.assert_array_equal(dso.data, [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(dso.labels[0], ['s1', 's2'])
+        self.assertEqual(dso.classes[0], ['x', 'y'])
+        self.assertEqual(dso.scales[1][:2], [1.5, 2.5])
+        self.assertEqual(dso.labels[1][2], 'Glucose')
+        self.assertTrue(progress and all(0 < p <= 1 for p in progress))
+
+    def test_columns(self):
+        """Samples in columns; samples of class '.' are left out"""
+        fn = self.write('Sample\ts1\ts2\ts3\nClass\tx\t.\ty\n1.5\t1\t2\t3\n2.5\t4\t5\t6\n', 'data.tsv')
+        dso = text.read_columns(fn, '\t')
+        np.testing.assert_array_equal(dso.data, [[1, 4], [3, 6]])
+        self.assertEqual(dso.labels[0], ['s1', 's3'])
+        self.assertEqual(dso.classes[0], ['x', 'y'])
+        self.assertEqual(dso.scales[1], [1.5, 2.5])
+
+    def test_excluded_rows(self):
+        """Samples of class '.' are left out of row files"""
+        dso = text.read_rows(self.write('Sample,Class,1,2\ns1,.,1,2\ns2,y,3,4\n'))
+        np.testing.assert_array_equal(dso.data, [[3, 4]])
+        self.assertEqual(dso.labels[0], ['s2'])
+
+    def test_cells(self):
+        """Quoted fields are read; cells that aren't numbers are 0"""
+        dso = text.read_rows(self.write('Sample,Class,1,2\n"s,1",x,1,n/a\ns2,y,,4\n'))
+        np.testing.assert_array_equal(dso.data, [[1, 0], [0, 4]])
+        self.assertEqual(dso.labels[0], ['s,1', 's2'])
+
+    def test_blocks(self):
+        """Files are read the same in blocks of any size"""
+        rows = ''.join('s%d,x,%d,%d\n' % (n, n, -n) for n in range(100))
+        fn = self.write('Sample,Class,1,2\n' + rows)
+        text.CHUNK_BYTES = 64
+        dso = text.read_rows(fn)
+        np.testing.assert_array_equal(dso.data, np.c_[np.arange(100), -np.arange(100)])
+        self.assertEqual(dso.labels[0][-1], 's99')
+
+    def test_helpers(self):
+        """Delimiters are chosen by extension, then header; lines are counted with or without a final newline"""
+        self.assertEqual(text.text_delimiter('a.csv', 'a\tb'), ',')
+        self.assertEqual(text.text_delimiter('a.tsv', 'a,b'), '\t')
+        self.assertEqual(text.text_delimiter('a.txt', 'a\tb'), '\t')
+        self.assertEqual(text.count_lines(self.write('a\nb\n')), 2)
+        self.assertEqual(text.count_lines(self.write('a\nb')), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
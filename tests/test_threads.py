@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import threading
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PyQt5.QtCore import QCoreApplication, QThreadPool
+
+from pathomx import threads
+
+app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+
+def run(worker):
+    # Run worker on a thread pool; returns the results and errors it emitted
+    results, errors, finished = [], [], []
+    worker.signals.result.connect(results.append)
+    worker.signals.error.connect(errors.append)
+    worker.signals.finished.connect(lambda: finished.append(True))
+
+    pool = QThreadPool()
+    pool.start(worker)
+    pool.waitForDone()
+    app.processEvents()
+    assert finished, "Worker did not finish"
+    return results, errors
+
+
+class TestWorker(unittest.TestCase):
+    """Unit tests for threads.Worker"""
+
+    def test_result(self):
+        """Dict results are emitted"""
+        results, errors = run(threads.Worker(lambda x: {'output': x}, 1))
+        self.assertEqual(results, [{'output': 1}])
+        self.assertEqual(errors, [])
+
+    def test_none_result(self):
+        """A callback returning None finishes without emitting a result"""
+        results, errors = run(threads.Worker(lambda: None))
+        self.assertEqual(results, [])
+        self.assertEqual(errors, [])
+
+    def test_error(self):
+        """Exceptions in the callback are emitted as errors"""
+        def fail():
+            raise ValueError('failed')
+
+        results, errors = run(threads.Worker(fail))
+        self.assertEqual(results, [])
+        self.assertEqual(errors[0][0], ValueError)
+
+    def test_cancelled_while_queued(self):
+        """Workers cancelled before they start don't run the callback"""
+        called = []
+        worker = threads.Worker(lambda: called.append(True) or {})
+        worker.cancel()
+        self.assertEqual(run(worker), ([], []))
+        self.assertEqual(called, [])
+
+    def test_cancelled_while_running(self):
+        """Cancelled callbacks stop at their next checkpoint and emit no result"""
+        started, checkpoints = threading.Event(), []
+
+        def callback():
+            started.set()
+            while True:
+                threads.checkpoint()
+                checkpoints.append(True)
+
+        worker = threads.Worker(callback)
+        pool = QThreadPool()
+        pool.start(worker)
+        started.wait(5)
+        worker.cancel()
+        self.assertTrue(pool.waitForDone(5000))
+        self.assertTrue(checkpoints)
+
+    def test_result_dropped(self):
+        """Results of a worker cancelled after its last checkpoint are dropped"""
+        worker = threads.Worker(lambda: worker.cancel() or {'output': 1})
+        self.assertEqual(run(worker), ([], []))
+
+
+class TestCancellationToken(unittest.TestCase):
+    """Unit tests for threads.CancellationToken, checkpoint() and run_with_token()"""
+
+    def test_token(self):
+        """check() raises once the token is cancelled"""
+        token = threads.CancellationToken()
+        token.check()
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertRaises(threads.WorkerCancelled, token.check)
+
+    def test_checkpoint(self):
+        """checkpoint() checks the current token, and does nothing outside workers"""
+        threads.checkpoint()
+        token = threads.CancellationToken()
+        token.cancel()
+        self.assertRaises(threads.WorkerCancelled, threads.run_with_token, token, threads.checkpoint)
+
+    def test_run_with_token(self):
+        """The token is current during the call only"""
+        token = threads.CancellationToken()
+        self.assertIs(threads.run_with_token(token, threads.current_token), token)
+        self.assertIsNone(threads.current_token())
+
+
+if __name__ == "__main__":
+    unittest.main()
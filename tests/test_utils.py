@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pathomx import utils
+
+
+class TestFileStamps(unittest.TestCase):
+    """Unit tests for utils.file_stamps()"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write('a.txt', '1 2 3')
+
+    def tearDown(self):
+        shutil.rmtree(self.path, True)
+
+    def write(self, name, content):
+        fn = os.path.join(self.path, name)
+        if not os.path.isdir(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        with open(fn, 'w') as f:
+            f.write(content)
+        return fn
+
+    def test_file(self):
+        """A file is stamped with its modification time and size"""
+        fn = os.path.join(self.path, 'a.txt')
+        st = os.stat(fn)
+        self.assertEqual(list(utils.file_stamps(fn)), [('.', '%d:%d' % (st.st_mtime_ns, st.st_size))])
+
+    def test_changed(self):
+        """Changing a file changes its stamp"""
+        fn = os.path.join(self.path, 'a.txt')
+        stamps = list(utils.file_stamps(fn))
+        self.write('a.txt', '1 2 3 4')
+        self.assertNotEqual(list(utils.file_stamps(fn)), stamps)
+
+    def test_folder(self):
+        """Folders are stamped file by file, including new files in subfolders"""
+        stamps = list(utils.file_stamps(self.path))
+        self.assertEqual([p for p, s in stamps], ['a.txt'])
+
+        self.write(os.path.join('1', 'fid'), 'data')
+        self.assertEqual([p for p, s in utils.file_stamps(self.path)], [os.path.join('1', 'fid'), 'a.txt'])
+
+    def test_missing(self):
+        """Missing files are stamped as missing"""
+        fn = os.path.join(self.path, 'b.txt')
+        self.assertEqual(list(utils.file_stamps(fn)), [('.', 'missing')])
+
+
+if __name__ == "__main__":
+    unittest.main()